@@ -0,0 +1,205 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Classes:  CircuitBreaker
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextlib import nullcontext
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+
+    """ Skip calls of a plugin which keeps failing.
+
+    o After 'threshold' consecutive failures the breaker opens, and calls
+      are skipped for 'reset_timeout' seconds.
+
+    o Then it is half-open:  one trial call is let through, closing the
+      breaker if it succeeds and opening it again if it fails.
+
+    o Only calls raising one of 'exceptions' count as failures, and
+      calls taking longer than 'time_budget' seconds (if set).  Other
+      errors, like conflicts or 'Unauthorized', are passed on without
+      being recorded.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30, time_budget=0,
+                 exceptions=(Exception,), clock=time.monotonic):
+
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.time_budget = time_budget
+        self.exceptions = exceptions
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self._trial = False
+
+    def allow(self):
+        """ -> True if the plugin may be called now.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if self._clock() - self.opened < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._trial = False
+
+            if self._trial:
+                return False
+
+            self._trial = True
+            return True
+
+    def record(self, duration, failed=False):
+        """ Record a call which took 'duration' seconds.
+        """
+        if self.time_budget and duration > self.time_budget:
+            failed = True
+
+        with self._lock:
+            if not failed:
+                self.state = CLOSED
+                self.failures = 0
+                self.opened = None
+                return
+
+            self.failures += 1
+
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.opened = self._clock()
+
+    def release(self):
+        """ End a call without recording it.
+
+        o A half-open breaker lets the next trial call through.
+        """
+        with self._lock:
+            self._trial = False
+
+    def call(self, plugin, method_name, *args, **kw):
+        """ Call the 'method_name' method of 'plugin', recording its
+            duration and failure.
+
+        o Looking up the method is part of the call:  a trial call must
+          be ended however it fails.
+        """
+        with self.guard(plugin):
+            return getattr(plugin, method_name)(*args, **kw)
+
+    @contextmanager
+    def guard(self, plugin=None, deadline=None):
+        """ Record the duration and failure of a 'with' block calling
+            'plugin'.
+
+        o Errors of plugins which don't want them swallowed are theirs
+          to report, and count as failures only if too slow.
+
+        o Blocks ending after the 'time.perf_counter' value 'deadline'
+          (if given) count as failures, too.
+        """
+        start = time.perf_counter()
+        exceptions = self.exceptions
+
+        if getattr(plugin, '_dont_swallow_my_exceptions', False):
+            exceptions = ()
+
+        failed = None   # not recorded unless too slow
+
+        try:
+            yield
+            failed = False
+        except exceptions:
+            failed = True
+            raise
+        finally:
+            end = time.perf_counter()
+            duration = end - start
+
+            if deadline is not None and end > deadline:
+                failed = True
+            elif self.time_budget and duration > self.time_budget:
+                failed = True
+
+            if failed is None:
+                self.release()
+            else:
+                self.record(duration, failed=failed)
+
+    def reset(self):
+        """ Close the breaker.
+        """
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened = None
+
+
+class _DisabledBreaker:
+
+    """ Stand-in for disabled circuit breakers.
+    """
+
+    state = CLOSED
+    failures = 0
+
+    def allow(self):
+        return True
+
+    def record(self, duration, failed=False):
+        pass
+
+    def release(self):
+        pass
+
+    def call(self, plugin, method_name, *args, **kw):
+        return getattr(plugin, method_name)(*args, **kw)
+
+    def guard(self, plugin=None, deadline=None):
+        return nullcontext()
+
+
+DISABLED = _DisabledBreaker()
+
+_circuit_breakers = {}
+# Reentrant: unpersisted user folders forget their entries from a
+# finalizer, which the garbage collector may run while we hold it.
+_circuit_breakers_lock = threading.RLock()
+
+
+def getCircuitBreakers(key):
+    """ Return the process-wide mapping of plugin ids to circuit breakers
+        registered for 'key'.
+    """
+    with _circuit_breakers_lock:
+        return _circuit_breakers.setdefault(key, {})
+
+
+def forgetCircuitBreakers(key):
+    """ Drop the circuit breakers registered for 'key'.
+    """
+    with _circuit_breakers_lock:
+        _circuit_breakers.pop(key, None)
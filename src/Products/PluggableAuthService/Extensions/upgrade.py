@@ -28,13 +28,23 @@
     Each migrated user will be assigned the global roles they have in the
     previous acl_users record.
 
+    Users and objects are migrated in chunks of 'chunk_size'.  Call with
+    'commit' set to commit each chunk:  the migration then resumes from
+    its last checkpoint if interrupted, and large sites need neither one
+    huge transaction nor the memory for it.
+
 $Id$
 """
 import logging
+import time
 
 import transaction
 
 
+# Roles every user has anyway
+_IMPLICIT_ROLES = ('Anonymous', 'Authenticated')
+
+
 def _write(response, tool, message):
     logger = logging.getLogger('PluggableAuthService.upgrade.%s' % tool)
     logger.info(message)
@@ -42,148 +52,290 @@ def _write(response, tool, message):
         response.write(message)
 
 
-def _replaceUserFolder(self, RESPONSE=None):
-    """replaces the old acl_users folder with a PluggableAuthService,
-    preserving users and passwords, if possible
+def _getCheckpoint(self):
+    """ Return the persistent record of our progress in migrating 'self'.
+    """
+    from Acquisition import aq_base
+    from persistent.mapping import PersistentMapping
+
+    checkpoint = getattr(aq_base(self), '_pas_migration', None)
+
+    if checkpoint is None:
+        checkpoint = self._pas_migration = PersistentMapping()
+
+    return checkpoint
+
+
+def _endChunk(self, commit):
+    """ Make a chunk's work durable and let go of the objects it loaded.
     """
     from Acquisition import aq_base
 
+    if commit:
+        transaction.commit()
+    else:
+        transaction.savepoint(True)
+
+    jar = getattr(aq_base(self), '_p_jar', None)
+    if jar is not None:
+        jar.cacheGC()
+
+
+def _reportProgress(response, tool, what, done, total, started, count):
+    elapsed = time.time() - started
+    rate = count / elapsed if elapsed else 0.0
+    if total is not None:
+        done = f'{done} of {total}'
+    _write(response, tool, f'  -- {done} {what} done ({rate:.1f} {what}/s)\n')
+
+
+def _makeUserFolder(self):
+    """ Return a new PluggableAuthService, not yet added to 'self'.
+
+    o It gets a ZODBUserManager and a ZODBRoleManager, knowing the roles
+      defined on 'self'.
+    """
+    from Products.PluginRegistry.PluginRegistry import PluginRegistry
+
     from ..interfaces.plugins import IAuthenticationPlugin
     from ..interfaces.plugins import IRoleAssignerPlugin
     from ..interfaces.plugins import IRoleEnumerationPlugin
     from ..interfaces.plugins import IRolesPlugin
     from ..interfaces.plugins import IUserEnumerationPlugin
+    from ..PluggableAuthService import _PLUGIN_TYPE_INFO
     from ..PluggableAuthService import PluggableAuthService
     from ..plugins.ZODBRoleManager import ZODBRoleManager
     from ..plugins.ZODBUserManager import ZODBUserManager
 
+    new_acl = PluggableAuthService()
+    registry = PluginRegistry(_PLUGIN_TYPE_INFO)
+    registry._setId('plugins')
+    new_acl._setObject('plugins', registry)
+    new_acl._setObject('users', ZODBUserManager('users'))
+    new_acl._setObject('roles', ZODBRoleManager('roles'))
+
+    plugins = new_acl.plugins
+    plugins.activatePlugin(IAuthenticationPlugin, 'users')
+    plugins.activatePlugin(IUserEnumerationPlugin, 'users')
+    plugins.activatePlugin(IRolesPlugin, 'roles')
+    plugins.activatePlugin(IRoleEnumerationPlugin, 'roles')
+    plugins.activatePlugin(IRoleAssignerPlugin, 'roles')
+
+    known_roles = set(new_acl.roles.listRoleIds()) | set(_IMPLICIT_ROLES)
+    for role_id in self.valid_roles():
+        if role_id not in known_roles:
+            new_acl.roles.addRole(role_id)
+
+    return new_acl
+
+
+def _replaceUserFolder(self, RESPONSE=None, chunk_size=1000, commit=False):
+    """replaces the old acl_users folder with a PluggableAuthService,
+    preserving users and passwords, if possible
+
+    o Users are migrated 'chunk_size' at a time into a new user folder,
+      which only replaces the old one once all users are in.
+
+    o With 'commit' set, each chunk is committed along with a checkpoint,
+      so an interrupted migration resumes after the last chunk.  Users
+      added to or removed from the old folder meanwhile are taken into
+      account when resuming.
+    """
+    from Acquisition import aq_base
+
+    from ..PluggableAuthService import PluggableAuthService
+
     if getattr(aq_base(self), '__allow_groups__', None):
         if self.__allow_groups__.__class__ is PluggableAuthService:
             _write(RESPONSE, 'replaceUserFolder',
                    'Already replaced this user folder\n')
             return
 
-        # Capture all the user info from the previous user folder,
-        # then delete it.
+        # Migrate all users from the previous user folder into a new one
+        # kept aside in the checkpoint, then swap them.
         old_acl = self.__allow_groups__
-        user_map = []
-        for user_name in old_acl.getUserNames():
-            old_user = old_acl.getUser(user_name)
+        checkpoint = _getCheckpoint(self)
+        new_acl = checkpoint.get('new_acl')
+
+        if new_acl is None:
+            new_acl = checkpoint['new_acl'] = _makeUserFolder(self)
+            migrated = set()
+        else:
+            migrated = set(new_acl.users.listUserIds())
             _write(RESPONSE, 'replaceRootUserFolder',
-                   'Capturing user info for %s\n' % user_name)
-            user_map.append({'login': user_name,
-                             'password': old_user._getPassword(),
-                             'roles': old_user.getRoles()})
+                   'Resuming after %d users\n' % len(migrated))
+
+        # The users in the new folder are the checkpoint:  the old folder
+        # may have changed since an interrupted run.
+        user_names = old_acl.getUserNames()
+        pending = [x for x in user_names if x not in migrated]
+        done = len(user_names) - len(pending)
+        started = time.time()
+        count = 0
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            _migrateUsers(new_acl, old_acl, chunk, chunk_size)
+            done += len(chunk)
+            count += len(chunk)
+            _endChunk(self, commit)
+            _reportProgress(RESPONSE, 'replaceRootUserFolder', 'users',
+                            done, len(user_names), started, count)
+
+        for user_id in migrated.difference(user_names):
+            _removeUser(new_acl, user_id)
+
+        del checkpoint['new_acl']
         self._delObject('acl_users')
-
-        # Create the new PluggableAuthService, and re-populate from
-        # the captured data
-        _pas = self.manage_addProduct['PluggableAuthService']
-        _pas.addPluggableAuthService()
-        new_acl = self.acl_users
-
-        user_folder = ZODBUserManager('users')
-        new_acl._setObject('users', user_folder)
-        role_manager = ZODBRoleManager('roles')
-        new_acl._setObject('roles', role_manager)
-
-        plugins = getattr(new_acl, 'plugins')
-        plugins.activatePlugin(IAuthenticationPlugin, 'users')
-        plugins.activatePlugin(IUserEnumerationPlugin, 'users')
-        plugins.activatePlugin(IRolesPlugin, 'roles')
-        plugins.activatePlugin(IRoleEnumerationPlugin, 'roles')
-        plugins.activatePlugin(IRoleAssignerPlugin, 'roles')
-        for user_dict in user_map:
-            _write(RESPONSE, 'replaceRootUserFolder',
-                   'Translating user %s\n' % user_name)
-            login = user_dict['login']
-            password = user_dict['password']
-            roles = user_dict['roles']
-
-            _migrate_user(new_acl, login, password, roles)
+        self._setObject('acl_users', new_acl)
         _write(RESPONSE, 'replaceRootUserFolder',
                'Replaced root acl_users with PluggableAuthService\n')
 
     transaction.savepoint(True)
 
 
-def _migrate_user(pas, login, password, roles):
+def _migrateUsers(pas, old_acl, user_names, chunk_size):
 
-    from AuthEncoding.AuthEncoding import is_encrypted
+    users = []
+    roles = {}
 
-    if is_encrypted(password):
-        pas.users._user_passwords[login] = password
-        pas.users._login_to_userid[login] = login
-        pas.users._userid_to_login[login] = login
-    else:
-        pas.users.addUser(login, login, password)
+    for user_name in user_names:
+        old_user = old_acl.getUser(user_name)
+        users.append((user_name, user_name, old_user._getPassword()))
+        roles[user_name] = old_user.getRoles()
 
-    new_user = pas.getUser(login)
-    for role_id in roles:
-        if role_id not in ['Authenticated', 'Anonymous']:
-            pas.roles.assignRoleToPrincipal(role_id, new_user.getId())
+    # Hashed passwords are stored as they are.  The users are not new,
+    # and subscribers would only see them in a detached user folder.
+    pas.users.addUsers(users, chunk_size=chunk_size, workers=0,
+                       notify_created=False)
+    known_roles = set(pas.roles.listRoleIds())
 
+    for user_name, role_ids in roles.items():
+        for role_id in role_ids:
+            if role_id in _IMPLICIT_ROLES:
+                continue
+            if role_id not in known_roles:
+                pas.roles.addRole(role_id)
+                known_roles.add(role_id)
+            pas.roles.assignRoleToPrincipal(role_id, user_name)
 
-def _upgradeLocalRoleAssignments(self, RESPONSE=None):
+
+def _removeUser(pas, user_id):
+    # The user was removed from the old folder after being migrated
+    for role_id in pas.roles.listRoleIds():
+        pas.roles.removeRoleFromPrincipal(role_id, user_id)
+    pas.users.removeUser(user_id)
+
+
+def _translateLocalRoles(user_folder, obj, RESPONSE):
+    """ Refashion the __ac_local_roles__ of 'obj' with new spellings.
+    """
+    from Acquisition import aq_base
+
+    if getattr(aq_base(obj), '__ac_local_roles__', None):
+        if not callable(obj.__ac_local_roles__):
+            new_map = {}
+            map = obj.__ac_local_roles__
+            for key in map.keys():
+                new_principals = user_folder.searchPrincipals(id=key)
+                if not new_principals:
+                    _write(RESPONSE,
+                           'upgradeLocalRoleAssignmentsFromRoot',
+                           '  Ignoring map for unknown principal %s\n'
+                           % key)
+                    new_map[key] = map[key]
+                    continue
+                npid = new_principals[0]['id']
+                new_map[npid] = map[key]
+                _write(RESPONSE,
+                       'upgradeLocalRoleAssignmentsFromRoot',
+                       f'  Translated {key} to {npid}\n')
+                _write(RESPONSE,
+                       'upgradeLocalRoleAssignmentsFromRoot',
+                       '  Assigned roles %s to %s\n' %
+                       (map[key], npid))
+            obj.__ac_local_roles__ = new_map
+            _write(RESPONSE, 'upgradeLocalRoleAssignmentsFromRoot',
+                   ('Local Roles map changed for %s\n' %
+                    '/'.join(obj.getPhysicalPath())))
+
+
+def _upgradeLocalRoleAssignments(self, RESPONSE=None, chunk_size=1000,
+                                 commit=False):
     """ upgrades the __ac_local_roles__ attributes on objects to account
         for a move to using the PluggableAuthService.
+
+    o The objects below 'self' are visited depth first, 'chunk_size' at a
+      time.  The checkpoint holds, for each folder being visited, its
+      path and the index of its next child.
     """
     from Acquisition import aq_base
 
-    seen = {}
-
-    def descend(user_folder, obj):
-        path = obj.getPhysicalPath()
-        if path not in seen:
-            # get __ac_local_roles__, break it apart and refashion it
-            # with new spellings.
-            seen[path] = 1
-            if getattr(aq_base(obj), '__ac_local_roles__', None):
-                if not callable(obj.__ac_local_roles__):
-                    new_map = {}
-                    map = obj.__ac_local_roles__
-                    for key in map.keys():
-                        new_principals = user_folder.searchPrincipals(id=key)
-                        if not new_principals:
-                            _write(RESPONSE,
-                                   'upgradeLocalRoleAssignmentsFromRoot',
-                                   '  Ignoring map for unknown principal %s\n'
-                                   % key)
-                            new_map[key] = map[key]
-                            continue
-                        npid = new_principals[0]['id']
-                        new_map[npid] = map[key]
-                        _write(RESPONSE,
-                               'upgradeLocalRoleAssignmentsFromRoot',
-                               f'  Translated {key} to {npid}\n')
-                        _write(RESPONSE,
-                               'upgradeLocalRoleAssignmentsFromRoot',
-                               '  Assigned roles %s to %s\n' %
-                               (map[key], npid))
-                    obj.__ac_local_roles__ = new_map
-                    _write(RESPONSE, 'upgradeLocalRoleAssignmentsFromRoot',
-                           ('Local Roles map changed for %s\n' %
-                            '/'.join(path)))
-            if (len(seen) % 100) == 0:
-                transaction.savepoint(True)
-                _write(RESPONSE, 'upgradeLocalRoleAssignmentsFromRoot',
-                       '  -- Set savepoint at object # %d\n' % len(seen))
-            if getattr(aq_base(obj), 'isPrincipiaFolderish', 0):
-                for o in obj.objectValues():
-                    descend(user_folder, o)
-
     if getattr(self, '_upgraded_acl_users', None):
         _write(RESPONSE, '_upgradeLocalRoleAssignments',
                'Local role assignments have already been updated.\n')
         return
 
-    descend(self.acl_users, self)
+    from persistent.list import PersistentList
+
+    user_folder = self.acl_users
+    checkpoint = _getCheckpoint(self)
+    stack = checkpoint.get('objects')
+
+    if stack is None:
+        _translateLocalRoles(user_folder, self, RESPONSE)
+        stack = checkpoint['objects'] = PersistentList([((), 0)])
+        checkpoint['objects_done'] = 1
+    else:
+        _write(RESPONSE, 'upgradeLocalRoleAssignmentsFromRoot',
+               'Resuming after %d objects\n' % checkpoint['objects_done'])
+
+    done = checkpoint['objects_done']
+    started = time.time()
+    count = 0
+    children = {}
+
+    while stack:
+        path, index = stack[-1]
+        folder = self.unrestrictedTraverse(path)
+        ids = children.get(path)
+
+        if ids is None:
+            ids = children[path] = list(folder.objectIds())
+
+        if index >= len(ids):
+            stack.pop()
+            del children[path]
+            continue
+
+        stack[-1] = (path, index + 1)
+        obj = folder._getOb(ids[index])
+        _translateLocalRoles(user_folder, obj, RESPONSE)
+
+        if getattr(aq_base(obj), 'isPrincipiaFolderish', 0):
+            stack.append((path + (ids[index],), 0))
+
+        done += 1
+        count += 1
+
+        if done % chunk_size == 0:
+            checkpoint['objects_done'] = done
+            _endChunk(self, commit)
+            _reportProgress(RESPONSE, 'upgradeLocalRoleAssignmentsFromRoot',
+                            'objects', done, None, started, count)
+
+    del checkpoint['objects']
+    del checkpoint['objects_done']
 
     transaction.savepoint(True)
 
 
 # External Method to use
-def replace_acl_users(self, RESPONSE=None):
-    _replaceUserFolder(self, RESPONSE)
-    _upgradeLocalRoleAssignments(self, RESPONSE)
+def replace_acl_users(self, RESPONSE=None, chunk_size=1000, commit=False):
+    from Acquisition import aq_base
+
+    _replaceUserFolder(self, RESPONSE, chunk_size, commit)
+    _upgradeLocalRoleAssignments(self, RESPONSE, chunk_size, commit)
     self._upgraded_acl_users = 1
+    if getattr(aq_base(self), '_pas_migration', None) is not None:
+        del self._pas_migration
@@ -13,7 +13,14 @@
 ##############################################################################
 """ Classes: PluggableAuthService
 """
+import heapq
+import itertools
 import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 
 from AccessControl import ClassSecurityInfo
 from AccessControl import ModuleSecurityInfo
@@ -41,6 +48,10 @@ from ZTUtils import Batch
 from Products.PluginRegistry.PluginRegistry import PluginRegistry
 from Products.StandardCacheManagers.RAMCacheManager import RAMCacheManager
 
+from .CircuitBreaker import DISABLED
+from .CircuitBreaker import CircuitBreaker
+from .CircuitBreaker import forgetCircuitBreakers
+from .CircuitBreaker import getCircuitBreakers
 from .events import PrincipalCreated
 from .interfaces.authservice import IPluggableAuthService
 from .interfaces.authservice import _noroles
@@ -66,7 +77,15 @@ from .interfaces.plugins import IUserEnumerationPlugin
 from .interfaces.plugins import IUserFactoryPlugin
 from .interfaces.plugins import IValidationPlugin
 from .permissions import SearchPrincipals
+from .PluginStatistics import LATENCY_BUCKETS
+from .PluginStatistics import forgetPluginStatistics
+from .PluginStatistics import getPluginStatistics
+from .PrincipalCache import forgetPrincipalCaches
+from .PrincipalCache import getPrincipalCache
+from .PrincipalCache import invalidatePrincipalCaches
+from .PrincipalCache import principalTag
 from .PropertiedUser import PropertiedUser
+from .PropertiedUser import _CompactUser
 from .utils import _wwwdir
 from .utils import classImplements
 from .utils import createKeywords
@@ -94,9 +113,93 @@ def reraise(plugin):
         raise
 
 
+def _asLimit(max_results):
+    """ 'max_results' search criterion -> int or None (no limit).
+    """
+    if not max_results:
+        return None
+    try:
+        max_results = int(max_results)
+    except ValueError:
+        return None
+    if max_results < 0:
+        return None
+    return max_results
+
+
+# Threads shared by all enumerators with a true 'concurrent_enumeration'
+# attribute, see 'PluggableAuthService.enumeration_timeout'.
+ENUMERATION_WORKERS = 8
+_enumeration_executor = None
+_enumeration_executor_lock = threading.Lock()
+
+
+def _getEnumerationExecutor():
+    global _enumeration_executor
+
+    with _enumeration_executor_lock:
+        if _enumeration_executor is None:
+            _enumeration_executor = ThreadPoolExecutor(
+                max_workers=ENUMERATION_WORKERS,
+                thread_name_prefix='PluggableAuthService-enumeration')
+
+    return _enumeration_executor
+
+
+def _listEnumeration(breaker, enum, method, criteria, deadline):
+    # Runs in the enumeration pool:  everything but the plugin call itself
+    # is looked up beforehand, in the thread owning the ZODB connection.
+    # Calls still running at the deadline fail, whatever their outcome.
+    with breaker.guard(enum, deadline=deadline):
+        return list(method(**criteria))
+
+
+def _forgetProcessState(key):
+    # Unpersisted user folders take their caches, statistics and circuit
+    # breakers with them.
+    forgetPrincipalCaches(key)
+    forgetPluginStatistics(key)
+    forgetCircuitBreakers(key)
+
+
 MultiPlugins = []
 
 
+def _callForPrincipals(plugin, name, principals, request, on_error=None):
+    """ -> [plugin.<name>(principal, request) for each principal]
+
+    o If there are several principals and the plugin has the batch variant
+      '<name>s', taking the sequence of principals, call it instead.
+
+    o If 'on_error' is passed, it is called instead of raising swallowable
+      exceptions, and the failed results are None.
+    """
+    if len(principals) > 1:
+        batch = getattr(plugin, name + 's', None)
+
+        if batch is not None:
+            try:
+                return list(batch(principals, request))
+            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+                if on_error is None:
+                    raise
+                on_error()
+
+    method = getattr(plugin, name)
+    result = []
+
+    for principal in principals:
+        try:
+            result.append(method(principal, request))
+        except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+            if on_error is None:
+                raise
+            on_error()
+            result.append(None)
+
+    return result
+
+
 def registerMultiPlugin(meta_type):
     """ Register a 'multi-plugin' in order to expose it to the Add List
     """
@@ -188,10 +291,56 @@ class PluggableAuthService(Folder, Cacheable):
     # of a method on this plugin.  See the applyTransform method.
     login_transform = ''
 
+    # Size and lifetime of the principal cache, see '_getPrincipalCache'.
+    principal_cache_size = 0
+    principal_cache_ttl = 3600
+
+    # Size and lifetime of the cache of failed lookups, see
+    # '_getNegativeCache'.
+    negative_cache_size = 0
+    negative_cache_ttl = 30
+
+    # Seconds searches wait for concurrent enumerators;  0 disables them,
+    # see '_mergeEnumerations'.
+    enumeration_timeout = 0.0
+
+    # Skip plugins failing 'breaker_threshold' times in a row (0: never)
+    # for 'breaker_reset_timeout' seconds;  calls slower than
+    # 'plugin_time_budget' seconds (0: no limit) count as failures.
+    # See '_getCircuitBreaker'.
+    breaker_threshold = 0
+    breaker_reset_timeout = 30
+    plugin_time_budget = 0.0
+
+    # Record call statistics of our plugins, see 'getPluginStatistics'.
+    instrument_plugins = False
+
     _properties = (
         dict(id='title', type='string', mode='w', label='Title'),
         dict(id='login_transform', type='string', mode='w',
              label='Transform to apply to login name'),
+        dict(id='principal_cache_size', type='int', mode='w',
+             label='Principal cache entries (0: use the cache manager)'),
+        dict(id='principal_cache_ttl', type='int', mode='w',
+             label='Principal cache lifetime in seconds'),
+        dict(id='negative_cache_size', type='int', mode='w',
+             label='Failed lookup cache entries (0: disabled)'),
+        dict(id='negative_cache_ttl', type='int', mode='w',
+             label='Failed lookup cache lifetime in seconds'),
+        dict(id='enumeration_timeout', type='float', mode='w',
+             label='Concurrent enumeration deadline in seconds '
+                   '(0: sequential)'),
+        dict(id='breaker_threshold', type='int', mode='w',
+             label='Consecutive plugin failures opening its circuit '
+                   'breaker (0: disabled)'),
+        dict(id='breaker_reset_timeout', type='int', mode='w',
+             label='Seconds before retrying a plugin with an open circuit '
+                   'breaker'),
+        dict(id='plugin_time_budget', type='float', mode='w',
+             label='Seconds after which plugin calls count as failures '
+                   '(0: no limit)'),
+        dict(id='instrument_plugins', type='boolean', mode='w',
+             label='Record call statistics of plugins'),
     )
 
     def getId(self):
@@ -228,6 +377,17 @@ class PluggableAuthService(Folder, Cacheable):
 
         return self._findUser(plugins, user_info['id'], user_info['login'])
 
+    @security.protected(ManageUsers)
+    def getUsersByIds(self, ids):
+        """ See IUserFolder.
+        """
+        plugins = self._getOb('plugins')
+
+        user_infos = self._verifyUsers(plugins, ids)
+
+        return self._findUsers(plugins, [(x['id'], x['login'])
+                                         for x in user_infos])
+
     @security.public
     def validate(self, request, auth='', roles=_noroles):
         """ See IUserFolder.
@@ -278,16 +438,11 @@ class PluggableAuthService(Folder, Cacheable):
         """
         search_name = kw.get('name', None)
 
-        result = []
-        max_results = kw.get('max_results', '')
-        sort_by = kw.get('sort_by', '')
+        # We apply sorting and slicing here across all sets, so only
+        # plugins which promise to do it themselves get to see them
+        sort_by = kw.pop('sort_by', '')
+        max_results = _asLimit(kw.pop('max_results', ''))
 
-        # We apply sorting and slicing here across all sets, so don't
-        # make the plugin do it
-        if sort_by:
-            del kw['sort_by']
-        if max_results:
-            del kw['max_results']
         if search_name:
             if kw.get('id') is not None:
                 del kw['id']  # don't even bother searching by id
@@ -297,35 +452,20 @@ class PluggableAuthService(Folder, Cacheable):
             kw['login'] = self.applyTransform(kw['login'])
 
         plugins = self._getOb('plugins')
-        enumerators = plugins.listPlugins(IUserEnumerationPlugin)
-
-        for enumerator_id, enum in enumerators:
-            try:
-                user_list = enum.enumerateUsers(**kw)
-                for user_info in user_list:
-                    info = {}
-                    info.update(user_info)
-                    info['userid'] = info['id']
-                    info['principal_type'] = 'user'
-                    if 'title' not in info:
-                        info['title'] = info['login']
-                    result.append(info)
-
-            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
-                reraise(enum)
-                logger.debug('UserEnumerationPlugin %s error' % enumerator_id,
-                             exc_info=True)
-
-        if sort_by:
-            result = sorted(result, key=lambda x: x.get(sort_by, '').lower())
-
-        if max_results:
-            try:
-                max_results = int(max_results)
-                result = result[:max_results]
-            except ValueError:
-                pass
-
+        enumerators = self._listPlugins(plugins, IUserEnumerationPlugin)
+
+        def decorate(user_info):
+            info = {}
+            info.update(user_info)
+            info['userid'] = info['id']
+            info['principal_type'] = 'user'
+            if 'title' not in info:
+                info['title'] = info['login']
+            return info
+
+        result = self._mergeEnumerations(enumerators, 'enumerateUsers',
+                                         'UserEnumerationPlugin', decorate,
+                                         kw, sort_by, max_results)
         return tuple(result)
 
     @security.protected(SearchPrincipals)
@@ -334,16 +474,13 @@ class PluggableAuthService(Folder, Cacheable):
         """
         search_name = kw.get('name', None)
 
-        result = []
-        max_results = kw.get('max_results', '')
-        sort_by = kw.get('sort_by', '')
+        # We apply sorting and slicing here across all sets, so only
+        # plugins which promise to do it themselves get to see them
+        sort_by = kw.pop('sort_by', '')
+        max_results = _asLimit(kw.pop('max_results', ''))
+        if max_results is not None:
+            max_results += 1
 
-        # We apply sorting and slicing here across all sets, so don't
-        # make the plugin do it
-        if sort_by:
-            del kw['sort_by']
-        if max_results:
-            del kw['max_results']
         if search_name:
             if kw.get('id') is not None:
                 del kw['id']
@@ -351,34 +488,20 @@ class PluggableAuthService(Folder, Cacheable):
                 kw['title'] = kw['name']
 
         plugins = self._getOb('plugins')
-        enumerators = plugins.listPlugins(IGroupEnumerationPlugin)
-
-        for enumerator_id, enum in enumerators:
-            try:
-                group_list = enum.enumerateGroups(**kw)
-                for group_info in group_list:
-                    info = {}
-                    info.update(group_info)
-                    info['groupid'] = info['id']
-                    info['principal_type'] = 'group'
-                    if 'title' not in info:
-                        info['title'] = '(Group) %s' % info['groupid']
-                    result.append(info)
-            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
-                reraise(enum)
-                logger.debug('GroupEnumerationPlugin %s error' % enumerator_id,
-                             exc_info=True)
-
-        if sort_by:
-            result = sorted(result, key=lambda x: x.get(sort_by, '').lower())
-
-        if max_results:
-            try:
-                max_results = int(max_results)
-                result = result[:max_results + 1]
-            except ValueError:
-                pass
-
+        enumerators = self._listPlugins(plugins, IGroupEnumerationPlugin)
+
+        def decorate(group_info):
+            info = {}
+            info.update(group_info)
+            info['groupid'] = info['id']
+            info['principal_type'] = 'group'
+            if 'title' not in info:
+                info['title'] = '(Group) %s' % info['groupid']
+            return info
+
+        result = self._mergeEnumerations(enumerators, 'enumerateGroups',
+                                         'GroupEnumerationPlugin', decorate,
+                                         kw, sort_by, max_results)
         return tuple(result)
 
     @security.protected(SearchPrincipals)
@@ -427,6 +550,7 @@ class PluggableAuthService(Folder, Cacheable):
         #   'set_owner' (we don't want to enforce ownership on contained
         #   objects).
         Folder._setObject(self, id, object, roles, user, set_owner)
+        self._invalidatePluginPipeline()
 
     @security.private
     def _delOb(self, id):
@@ -440,6 +564,7 @@ class PluggableAuthService(Folder, Cacheable):
             plugins.removePluginById(id)
 
         Folder._delOb(self, id)
+        self._invalidatePluginPipeline()
 
     #
     # ZMI stuff
@@ -447,8 +572,13 @@ class PluggableAuthService(Folder, Cacheable):
     security.declareProtected(ManageUsers, 'manage_search')  # NOQA: D001
     manage_search = PageTemplateFile('www/pasSearch', globals())
 
+    security.declarePrivate('_statisticsForm')  # NOQA: D001
+    _statisticsForm = PageTemplateFile('www/pasStatistics', globals())
+
     manage_options = (Folder.manage_options[:1]
-                      + ({'label': 'Search', 'action': 'manage_search'},)
+                      + ({'label': 'Search', 'action': 'manage_search'},
+                         {'label': 'Statistics',
+                          'action': 'manage_pluginStatistics'})
                       + Folder.manage_options[2:]
                       + Cacheable.manage_options)
 
@@ -505,6 +635,292 @@ class PluggableAuthService(Folder, Cacheable):
     #
     #   Helper methods
     #
+    @security.private
+    def _listPlugins(self, plugins, plugin_type):
+        """ plugin_type -> [(plugin_id, plugin)]
+
+        o Equivalent to 'plugins.listPlugins(plugin_type)', but the
+          plugins resolved for each interface are kept in a volatile
+          pipeline and only looked up again when the active plugin ids
+          for that interface change, or when objects are added to or
+          removed from this user folder.
+
+        o The cached plugins are stored unwrapped and bound to the
+          registry's parent on each call.
+        """
+        plugin_ids = plugins.listPluginIds(plugin_type)
+        registry = aq_base(plugins)
+        base = aq_base(self)
+
+        pipeline = getattr(base, '_v_plugin_pipeline', None)
+        if pipeline is None or pipeline[0] is not registry:
+            pipeline = base._v_plugin_pipeline = (registry, {})
+
+        compiled = pipeline[1].get(plugin_type)
+        if compiled is None or compiled[0] != plugin_ids:
+            resolved = tuple((plugin_id, aq_base(plugin)) for plugin_id, plugin
+                             in plugins.listPlugins(plugin_type))
+            compiled = pipeline[1][plugin_type] = (plugin_ids, resolved)
+
+        parent = aq_parent(aq_inner(plugins))
+        result = []
+        for plugin_id, plugin in compiled[1]:
+            if hasattr(plugin, '__of__'):
+                plugin = plugin.__of__(parent)
+            result.append((plugin_id, plugin))
+
+        if self.instrument_plugins:
+            statistics = self._getPluginStatistics()
+            result = [(plugin_id, statistics.instrument(plugin_id, plugin,
+                                                        plugin_type))
+                      for plugin_id, plugin in result]
+
+        return result
+
+    @security.private
+    def _getPluginStatistics(self):
+        """ Return the IPluginStatistics of our plugins.
+        """
+        return getPluginStatistics(self._getPrincipalCacheKey())
+
+    @security.private
+    def _getCircuitBreaker(self, plugin_id, plugin):
+        """ Return the circuit breaker guarding calls of 'plugin'.
+
+        o Plugins may override our 'plugin_time_budget' with their own
+          'time_budget' attribute.
+        """
+        if self.breaker_threshold <= 0:
+            return DISABLED
+
+        breakers = getCircuitBreakers(self._getPrincipalCacheKey())
+        breaker = breakers.get(plugin_id)
+
+        if breaker is None:
+            breaker = breakers.setdefault(plugin_id, CircuitBreaker(
+                exceptions=_SWALLOWABLE_PLUGIN_EXCEPTIONS))
+
+        breaker.threshold = self.breaker_threshold
+        breaker.reset_timeout = self.breaker_reset_timeout
+        breaker.time_budget = getattr(aq_base(plugin), 'time_budget',
+                                      self.plugin_time_budget)
+
+        return breaker
+
+    @security.protected(ManageUsers)
+    def getCircuitBreakerStates(self):
+        """ -> [{'plugin_id', 'state', 'failures', 'opened'}]
+
+        o 'opened' is the number of seconds since the breaker opened, or
+          None.
+        """
+        now = time.monotonic()
+        breakers = getCircuitBreakers(self._getPrincipalCacheKey())
+        result = []
+
+        for plugin_id, breaker in sorted(breakers.items()):
+            opened = breaker.opened
+            result.append({'plugin_id': plugin_id,
+                           'state': breaker.state,
+                           'failures': breaker.failures,
+                           'opened': None if opened is None else now - opened})
+
+        return result
+
+    @security.protected(ManageUsers)
+    def resetCircuitBreakers(self, REQUEST=None):
+        """ Close all circuit breakers of our plugins.
+        """
+        getCircuitBreakers(self._getPrincipalCacheKey()).clear()
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect('%s/manage_pluginStatistics'
+                                         '?manage_tabs_message='
+                                         'Circuit+breakers+reset.' %
+                                         self.absolute_url())
+
+    @security.protected(ManageUsers)
+    def getPluginStatistics(self):
+        """ See IPluggableAuthService.
+        """
+        return self._getPluginStatistics().report()
+
+    @security.protected(ManageUsers)
+    def manage_pluginStatistics(self, REQUEST=None, **kw):
+        """ Show the call statistics of our plugins.
+        """
+        return self._statisticsForm(statistics=self.getPluginStatistics(),
+                                    buckets=LATENCY_BUCKETS,
+                                    breakers=self.getCircuitBreakerStates(),
+                                    **kw)
+
+    @security.protected(ManageUsers)
+    def resetPluginStatistics(self, REQUEST=None):
+        """ See IPluggableAuthService.
+        """
+        self._getPluginStatistics().reset()
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect('%s/manage_pluginStatistics'
+                                         '?manage_tabs_message='
+                                         'Statistics+reset.' %
+                                         self.absolute_url())
+
+    @security.private
+    def _invalidatePluginPipeline(self):
+        """ Drop the plugins resolved by '_listPlugins'.
+        """
+        base = aq_base(self)
+        if getattr(base, '_v_plugin_pipeline', None) is not None:
+            base._v_plugin_pipeline = None
+
+    @security.private
+    def _mergeEnumerations(self, enumerators, method_name, label, decorate,
+                           criteria, sort_by, max_results):
+        """ -> [info_1, ... info_N] across all 'enumerators'.
+
+        o Results are sorted by the lowercased 'sort_by' value (if any)
+          and limited to 'max_results' mappings (if not None).
+
+        o Enumerators with a true 'sorted_enumeration' attribute get
+          'sort_by' and 'max_results' passed on;  their (possibly lazy)
+          results are merged without sorting them again.  The results
+          of all other enumerators are sorted here.
+
+        o Enumerators are only consumed until 'max_results' mappings
+          have been found.
+
+        o If 'enumeration_timeout' is set, enumerators with a true
+          'concurrent_enumeration' attribute are consumed at once in
+          threads of a shared pool.  Only the plugin calls run there.
+          Those not done within the timeout, counted from the start of
+          the search, are logged, left out of the results and count as
+          failures of their circuit breakers.
+        """
+        def key(info):
+            return info.get(sort_by, '').lower()
+
+        timeout = self.enumeration_timeout
+        deadline = time.perf_counter() + timeout
+        streams = []
+        pending = []
+
+        for enumerator_id, enum in enumerators:
+            presorted = getattr(aq_base(enum), 'sorted_enumeration', False)
+            if presorted:
+                kw = dict(criteria, sort_by=sort_by or None,
+                          max_results=max_results)
+            else:
+                kw = criteria
+
+            if timeout > 0 and getattr(aq_base(enum),
+                                       'concurrent_enumeration', False):
+                future = self._submitEnumeration(enumerator_id, enum,
+                                                 method_name, label, kw,
+                                                 deadline)
+                if future is not None:
+                    pending.append((len(streams), enumerator_id, enum,
+                                    future, sort_by and not presorted))
+                streams.append(())
+                continue
+
+            stream = self._iterEnumeration(enumerator_id, enum, method_name,
+                                           label, decorate, kw)
+
+            if sort_by and not presorted:
+                stream = sorted(stream, key=key)
+            streams.append(stream)
+
+        if pending:
+            remaining = max(deadline - time.perf_counter(), 0)
+            done, not_done = wait([x[3] for x in pending], timeout=remaining)
+
+            for index, enumerator_id, enum, future, unsorted in pending:
+                if future in done:
+                    try:
+                        infos = future.result()
+                    except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+                        reraise(enum)
+                        logger.debug(f'{label} {enumerator_id} error',
+                                     exc_info=True)
+                        continue
+
+                    stream = [decorate(x) for x in infos]
+                    if unsorted:
+                        stream.sort(key=key)
+                    streams[index] = stream
+                else:
+                    if future.cancel():
+                        # Never started:  end its (trial) call here.  Those
+                        # running fail once done, see '_listEnumeration'.
+                        breaker = self._getCircuitBreaker(enumerator_id, enum)
+                        breaker.record(timeout, failed=True)
+                    logger.warning('%s %s timed out after %s seconds',
+                                   label, enumerator_id, timeout)
+
+        if sort_by:
+            result = heapq.merge(*streams, key=key)
+        else:
+            result = itertools.chain(*streams)
+
+        if max_results is not None:
+            result = itertools.islice(result, max_results)
+
+        return list(result)
+
+    @security.private
+    def _submitEnumeration(self, enumerator_id, enum, method_name, label,
+                           criteria, deadline):
+        """ Start one enumerator in the shared pool -> future or None.
+
+        o The future's result is the list of undecorated results.
+
+        o Calls ending after the 'time.perf_counter' value 'deadline'
+          count as failures of the enumerator's circuit breaker.
+
+        o Enumerators with an open circuit breaker, or whose method cannot
+          be found, are skipped.
+        """
+        try:
+            method = getattr(enum, method_name)
+        except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+            reraise(enum)
+            logger.debug(f'{label} {enumerator_id} error', exc_info=True)
+            return None
+
+        breaker = self._getCircuitBreaker(enumerator_id, enum)
+        if not breaker.allow():
+            logger.debug(f'{label} {enumerator_id} skipped:  circuit '
+                         'breaker open')
+            return None
+
+        return _getEnumerationExecutor().submit(_listEnumeration, breaker,
+                                                enum, method, criteria,
+                                                deadline)
+
+    @security.private
+    def _iterEnumeration(self, enumerator_id, enum, method_name, label,
+                         decorate, criteria):
+        """ Yield the decorated results of one enumerator.
+
+        o Swallowable errors end the enumeration, keeping the results
+          produced so far.
+
+        o Enumerators with an open circuit breaker are skipped.
+        """
+        breaker = self._getCircuitBreaker(enumerator_id, enum)
+        if not breaker.allow():
+            logger.debug(f'{label} {enumerator_id} skipped:  circuit '
+                         'breaker open')
+            return
+
+        try:
+            for info in breaker.call(enum, method_name, **criteria):
+                yield decorate(info)
+        except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+            reraise(enum)
+            logger.debug(f'{label} {enumerator_id} error', exc_info=True)
+
     @security.private
     def _isNotCompetent(self, request, plugins):
         """ return true when this user folder should not try authentication.
@@ -512,7 +928,7 @@ class PluggableAuthService(Folder, Cacheable):
         Never called for top level user folder.
         """
         try:
-            not_competents = plugins.listPlugins(INotCompetentPlugin)
+            not_competents = self._listPlugins(plugins, INotCompetentPlugin)
         except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
             logger.debug('NotCompetent plugin listing error', exc_info=True)
             not_competents = ()
@@ -537,7 +953,7 @@ class PluggableAuthService(Folder, Cacheable):
           over all our authentication and extraction plugins.
         """
         try:
-            extractors = plugins.listPlugins(IExtractionPlugin)
+            extractors = self._listPlugins(plugins, IExtractionPlugin)
         except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
             logger.debug('Extractor plugin listing error', exc_info=True)
             extractors = ()
@@ -546,12 +962,14 @@ class PluggableAuthService(Folder, Cacheable):
             extractors = (('default', DumbHTTPExtractor()),)
 
         try:
-            authenticators = plugins.listPlugins(IAuthenticationPlugin)
+            authenticators = self._listPlugins(plugins,
+                                               IAuthenticationPlugin)
         except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
             logger.debug('Authenticator plugin listing error', exc_info=True)
             authenticators = ()
 
         result = []
+        memo = self._getRequestMemo(request)
 
         for extractor_id, extractor in extractors:
 
@@ -590,17 +1008,32 @@ class PluggableAuthService(Folder, Cacheable):
                 view_name = createViewName('_extractUserIds',
                                            credentials.get('login'))
                 keywords = createKeywords(**credentials)
-                user_ids = self.ZCacheable_get(view_name=view_name,
-                                               keywords=keywords,
-                                               default=None)
+                memo_key = ('_extractUserIds', keywords['keywords'])
+                user_ids = memo.get(memo_key)
                 if user_ids is None:
+                    user_ids = self._getCachedValue(view_name, keywords)
+                if user_ids is None and self._isKnownMiss(view_name,
+                                                          keywords):
                     user_ids = []
 
+                if user_ids is None:
+                    user_ids = []
+                    failed = False
+
                     for authenticator_id, auth in authenticators:
 
+                        breaker = self._getCircuitBreaker(authenticator_id,
+                                                          auth)
+                        if not breaker.allow():
+                            logger.debug(
+                                f'AuthenticationPlugin {authenticator_id}'
+                                ' skipped:  circuit breaker open')
+                            failed = True
+                            continue
+
                         try:
-                            uid_and_info = auth.authenticateCredentials(
-                                credentials)
+                            uid_and_info = breaker.call(
+                                auth, 'authenticateCredentials', credentials)
 
                             if uid_and_info is None:
                                 continue
@@ -612,15 +1045,19 @@ class PluggableAuthService(Folder, Cacheable):
                             logger.debug(
                                 f'AuthenticationPlugin {authenticator_id}'
                                 ' error', exc_info=True)
+                            failed = True
                             continue
 
                         if user_id is not None:
                             user_ids.append((user_id, info))
 
                     if user_ids:
-                        self.ZCacheable_set(user_ids, view_name=view_name,
-                                            keywords=keywords)
+                        self._setCachedValue(user_ids, view_name, keywords,
+                                             [x[0] for x in user_ids])
+                    elif not failed:
+                        self._setKnownMiss(view_name, keywords)
 
+                memo[memo_key] = user_ids
                 result.extend(user_ids)
 
         # Emergency user via HTTP basic auth always wins
@@ -655,7 +1092,7 @@ class PluggableAuthService(Folder, Cacheable):
 
         if plugins is None:
             plugins = self._getOb('plugins')
-        groupmakers = plugins.listPlugins(IGroupsPlugin)
+        groupmakers = self._listPlugins(plugins, IGroupsPlugin)
 
         for groupmaker_id, groupmaker in groupmakers:
 
@@ -672,7 +1109,7 @@ class PluggableAuthService(Folder, Cacheable):
     def _createAnonymousUser(self, plugins):
         """ Allow IAnonymousUserFactoryPlugins to create or fall back.
         """
-        factories = plugins.listPlugins(IAnonymousUserFactoryPlugin)
+        factories = self._listPlugins(plugins, IAnonymousUserFactoryPlugin)
 
         for factory_id, factory in factories:
 
@@ -688,7 +1125,7 @@ class PluggableAuthService(Folder, Cacheable):
         """ Allow IUserFactoryPlugins to create, or fall back to default.
         """
         name = self.applyTransform(name)
-        factories = plugins.listPlugins(IUserFactoryPlugin)
+        factories = self._listPlugins(plugins, IUserFactoryPlugin)
 
         for factory_id, factory in factories:
 
@@ -703,52 +1140,296 @@ class PluggableAuthService(Folder, Cacheable):
     def _findUser(self, plugins, user_id, name=None, request=None):
         """ user_id -> decorated_user
         """
-        if user_id == self._emergency_user.getUserName():
-            return self._emergency_user
+        return self._findUsers(plugins, [(user_id, name)], request)[0]
 
-        # See if the user can be retrieved from the cache
-        view_name = createViewName('_findUser', user_id)
-        name = self.applyTransform(name)
-        keywords = createKeywords(user_id=user_id, name=name)
-        user = self.ZCacheable_get(view_name=view_name, keywords=keywords,
-                                   default=None)
+    @security.private
+    def _findUsers(self, plugins, users, request=None):
+        """ [(user_id, name)] -> [decorated_user]
 
-        if user is None:
+        o Users missing from the cache are decorated together, see
+          '_decorateUsers'.
+        """
+        result = []
+        created = []
+        memo = {} if request is None else self._getRequestMemo(request)
 
-            user = self._createUser(plugins, user_id, name)
-            propfinders = plugins.listPlugins(IPropertiesPlugin)
+        for user_id, name in users:
 
-            for propfinder_id, propfinder in propfinders:
+            if user_id == self._emergency_user.getUserName():
+                result.append(self._emergency_user)
+                continue
 
-                data = propfinder.getPropertiesForUser(user, request)
-                if data:
-                    user.addPropertysheet(propfinder_id, data)
+            # See if the user was found for this request or can be
+            # retrieved from the cache
+            name = self.applyTransform(name)
+            memo_key = ('_findUser', user_id, name)
+            user = memo.get(memo_key)
 
-            groups = self._getGroupsForPrincipal(user, request,
-                                                 plugins=plugins)
-            user._addGroups(groups)
+            if user is None:
+                view_name = createViewName('_findUser', user_id)
+                keywords = createKeywords(user_id=user_id, name=name)
+                user = self._getCachedValue(view_name, keywords)
+                if user is not None:
+                    memo[memo_key] = user
 
-            rolemakers = plugins.listPlugins(IRolesPlugin)
+            if isinstance(user, _CompactUser):
+                user = user.restore()
 
-            for rolemaker_id, rolemaker in rolemakers:
-                try:
-                    roles = rolemaker.getRolesForPrincipal(user, request)
-                except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
-                    logger.debug('IRolesPlugin %s error' % rolemaker_id,
-                                 exc_info=True)
-                else:
-                    if roles:
-                        user._addRoles(roles)
+            elif user is None:
+                user = self._createUser(plugins, user_id, name)
+                created.append((user, user_id, memo_key, view_name,
+                                keywords))
 
-            user._addRoles(['Authenticated'])
+            result.append(user.__of__(self))
+
+        if created:
+            self._decorateUsers(plugins, [x[0] for x in created], request)
+
+        for user, user_id, memo_key, view_name, keywords in created:
 
             # Cache the user if caching is enabled
             base_user = aq_base(user)
             if getattr(base_user, '_p_jar', None) is None:
-                self.ZCacheable_set(base_user, view_name=view_name,
-                                    keywords=keywords)
+                if isinstance(base_user, PropertiedUser):
+                    base_user = _CompactUser(base_user)
+                # Changes to the roles of our groups affect us, too
+                self._setCachedValue(base_user, view_name, keywords,
+                                     [user_id] + list(user.getGroups()))
+            memo[memo_key] = base_user
+
+        return result
+
+    @security.private
+    def _getRequestMemo(self, request):
+        """ Return the mapping of our work done for 'request'.
+
+        o Nested user folders validating the same request, e.g. through
+          the NotCompetent_byRoles plugin, each find the credentials they
+          authenticated and the users they decorated in their own memo.
+
+        o The mapping lives as long as 'request';  requests which cannot
+          hold it get a fresh one.
+        """
+        other = getattr(request, 'other', None)
+
+        if not isinstance(other, dict):
+            return {}
+
+        return other.setdefault(self._getRequestMemoKey(), {})
+
+    @security.private
+    def _clearRequestMemo(self):
+        """ Forget our work done for the current request, if any.
+        """
+        other = getattr(getattr(self, 'REQUEST', None), 'other', None)
+
+        if isinstance(other, dict):
+            other.pop(self._getRequestMemoKey(), None)
 
-        return user.__of__(self)
+    @security.private
+    def _getRequestMemoKey(self):
+        """ Return the key of our memo in 'request.other'.
+
+        o The request sorts and renders its keys, so they must be strings.
+        """
+        return '_pas_memo:%s' % '/'.join(self.getPhysicalPath())
+
+    @security.private
+    def _decorateUsers(self, plugins, users, request=None):
+        """ Add the properties, groups and roles of new 'users'.
+
+        o Plugins providing the batch variant of their method, e.g.
+          'getPropertiesForUsers' for 'getPropertiesForUser', are called
+          once for all users.
+        """
+        propfinders = self._listPlugins(plugins, IPropertiesPlugin)
+
+        for propfinder_id, propfinder in propfinders:
+
+            all_data = _callForPrincipals(propfinder, 'getPropertiesForUser',
+                                          users, request)
+            for user, data in zip(users, all_data):
+                if data:
+                    user.addPropertysheet(propfinder_id, data)
+
+        if len(users) == 1:
+            user = users[0]
+            user._addGroups(self._getGroupsForPrincipal(user, request,
+                                                        plugins=plugins))
+        else:
+            groupmakers = self._listPlugins(plugins, IGroupsPlugin)
+
+            for groupmaker_id, groupmaker in groupmakers:
+
+                # Later plugins, like the RecursiveGroupsPlugin, see the
+                # groups added by earlier ones.
+                all_groups = _callForPrincipals(groupmaker,
+                                                'getGroupsForPrincipal',
+                                                users, request)
+                for user, groups in zip(users, all_groups):
+                    user._addGroups(groups)
+
+        rolemakers = self._listPlugins(plugins, IRolesPlugin)
+
+        for rolemaker_id, rolemaker in rolemakers:
+
+            def _logError(rolemaker_id=rolemaker_id):
+                logger.debug('IRolesPlugin %s error' % rolemaker_id,
+                             exc_info=True)
+
+            all_roles = _callForPrincipals(rolemaker, 'getRolesForPrincipal',
+                                           users, request, _logError)
+            for user, roles in zip(users, all_roles):
+                if roles:
+                    user._addRoles(roles)
+
+        for user in users:
+            user._addRoles(['Authenticated'])
+
+    @security.private
+    def _getPrincipalCache(self):
+        """ Return our IPrincipalCache, or None if it is disabled.
+
+        o Without it, principal data is cached through our ZCacheable
+          cache manager, if any.
+        """
+        if self.principal_cache_size <= 0:
+            return None
+
+        return getPrincipalCache(self._getPrincipalCacheKey(),
+                                 self.principal_cache_size,
+                                 self.principal_cache_ttl)
+
+    @security.private
+    def _getNegativeCache(self):
+        """ Return the IPrincipalCache of failed lookups, or None.
+
+        o Credentials no authenticator accepts and ids no enumerator knows
+          are remembered for 'negative_cache_ttl' seconds.
+
+        o Adding users, or changing their logins or passwords, clears it.
+        """
+        if self.negative_cache_size <= 0:
+            return None
+
+        return getPrincipalCache(self._getPrincipalCacheKey() + ('negative',),
+                                 self.negative_cache_size,
+                                 self.negative_cache_ttl)
+
+    @security.private
+    def _getPrincipalCacheKey(self):
+
+        # All connections share the caches of one persistent PAS.
+        base = aq_base(self)
+        jar = getattr(base, '_p_jar', None)
+        oid = getattr(base, '_p_oid', None)
+        if jar is None or oid is None:
+            # id() is reused once we are gone, so mark ourselves instead
+            key = base.__dict__.get('_v_principal_cache_key')
+            if key is None:
+                key = base._v_principal_cache_key = (None, object())
+                weakref.finalize(base, _forgetProcessState, key)
+            return key
+
+        return (jar.db().database_name, oid)
+
+    @security.private
+    def _getCachedValue(self, view_name, keywords):
+
+        cache = self._getPrincipalCache()
+
+        if cache is None:
+            return self.ZCacheable_get(view_name=view_name,
+                                       keywords=keywords, default=None)
+
+        return cache.get((view_name, keywords['keywords']))
+
+    @security.private
+    def _setCachedValue(self, value, view_name, keywords, principal_ids):
+
+        cache = self._getPrincipalCache()
+
+        if cache is None:
+            self.ZCacheable_set(value, view_name=view_name,
+                                keywords=keywords)
+        else:
+            cache.set((view_name, keywords['keywords']), value,
+                      tags=[principalTag(x) for x in principal_ids])
+
+    @security.private
+    def _isKnownMiss(self, view_name, keywords):
+
+        cache = self._getNegativeCache()
+
+        return (cache is not None
+                and cache.get((view_name, keywords['keywords'])) is not None)
+
+    @security.private
+    def _setKnownMiss(self, view_name, keywords):
+
+        cache = self._getNegativeCache()
+
+        if cache is not None:
+            cache.set((view_name, keywords['keywords']), True)
+
+    @security.private
+    def _invalidateNegativeCache(self):
+        """ Forget all failed lookups, e.g. once a user was added.
+        """
+        self._clearRequestMemo()
+        cache = self._getNegativeCache()
+
+        if cache is not None:
+            cache.clear()
+
+    @security.private
+    def _invalidatePrincipal(self, principal_id):
+        """ Drop the cached data of 'principal_id'.
+
+        o If 'principal_id' is a group, drop that of its members, too.
+        """
+        self._clearRequestMemo()
+
+        # Cached users are tagged with their (transitive) groups, and so
+        # are the group ancestors cached by our plugins
+        invalidatePrincipalCaches(self._getPrincipalCacheKey(),
+                                  [principalTag(principal_id)])
+
+        if (self._getPrincipalCache() is None
+                and self.ZCacheable_getManager() is not None):
+            for member_id in self._listTransitiveMembers(principal_id):
+                view_name = createViewName('_findUser', member_id)
+                self.ZCacheable_invalidate(view_name)
+
+    @security.private
+    def _listTransitiveMembers(self, principal_id):
+        """ -> ['principal_id', and the ids of its (nested) members]
+
+        o Members are found through group plugins knowing them, like the
+          ZODBGroupManager.
+        """
+        plugins = self._getOb('plugins')
+        managers = [x for i, x in self._listPlugins(plugins, IGroupsPlugin)
+                    if getattr(aq_base(x), '_listGroupMembers', None)]
+
+        seen = {principal_id: True}
+        pending = [principal_id]
+
+        while pending:
+            group_id = pending.pop()
+
+            for manager in managers:
+                prefix = getattr(manager, 'prefix', '')
+                if not group_id.startswith(prefix):
+                    continue
+
+                for member_id in manager._listGroupMembers(
+                        group_id[len(prefix):]):
+                    if member_id not in seen:
+                        seen[member_id] = True
+                        pending.append(member_id)
+
+        return list(seen)
 
     @security.private
     def _verifyUser(self, plugins, user_id=None, login=None):
@@ -769,31 +1450,113 @@ class PluggableAuthService(Folder, Cacheable):
 
         view_name = createViewName('_verifyUser', user_id or login)
         keywords = createKeywords(**criteria)
-        cached_info = self.ZCacheable_get(view_name=view_name,
-                                          keywords=keywords, default=None)
+        cached_info = self._getCachedValue(view_name, keywords)
 
         if cached_info is not None:
             return cached_info
 
-        enumerators = plugins.listPlugins(IUserEnumerationPlugin)
+        if self._isKnownMiss(view_name, keywords):
+            return None
+
+        enumerators = self._listPlugins(plugins, IUserEnumerationPlugin)
+        failed = False
 
         for enumerator_id, enumerator in enumerators:
+            breaker = self._getCircuitBreaker(enumerator_id, enumerator)
+            if not breaker.allow():
+                logger.debug(f'UserEnumerationPlugin {enumerator_id} '
+                             'skipped:  circuit breaker open')
+                failed = True
+                continue
+
             try:
-                info = enumerator.enumerateUsers(**criteria)
+                info = breaker.call(enumerator, 'enumerateUsers', **criteria)
 
                 if info:
                     # Put the computed value into the cache
-                    self.ZCacheable_set(info[0], view_name=view_name,
-                                        keywords=keywords)
+                    self._setCachedValue(info[0], view_name, keywords,
+                                         [info[0]['id']])
                     return info[0]
 
             except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
                 reraise(enumerator)
                 msg = 'UserEnumerationPlugin %s error' % enumerator_id
                 logger.debug(msg, exc_info=True)
+                failed = True
+
+        if not failed:
+            self._setKnownMiss(view_name, keywords)
 
         return None
 
+    @security.private
+    def _verifyUsers(self, plugins, user_ids):
+        """ [user_id] -> [info_dict]
+
+        o Return the info of the known users, in the order of 'user_ids'.
+
+        o Enumerators are asked once for all ids missing from the cache.
+        """
+        found = {}
+        missing = {}
+
+        for user_id in user_ids:
+
+            if user_id in found or user_id in missing:
+                continue
+
+            # Share the cache entries of '_verifyUser'
+            view_name = createViewName('_verifyUser', user_id)
+            keywords = createKeywords(exact_match=True, id=user_id)
+            cached_info = self._getCachedValue(view_name, keywords)
+
+            if cached_info is not None:
+                found[user_id] = cached_info
+            elif not self._isKnownMiss(view_name, keywords):
+                missing[user_id] = (view_name, keywords)
+
+        enumerators = ()
+        if missing:
+            enumerators = self._listPlugins(plugins, IUserEnumerationPlugin)
+        failed = False
+
+        for enumerator_id, enumerator in enumerators:
+            breaker = self._getCircuitBreaker(enumerator_id, enumerator)
+            if not breaker.allow():
+                logger.debug(f'UserEnumerationPlugin {enumerator_id} '
+                             'skipped:  circuit breaker open')
+                failed = True
+                continue
+
+            try:
+                infos = breaker.call(enumerator, 'enumerateUsers',
+                                     id=list(missing), exact_match=True)
+            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+                reraise(enumerator)
+                msg = 'UserEnumerationPlugin %s error' % enumerator_id
+                logger.debug(msg, exc_info=True)
+                failed = True
+                continue
+
+            for info in infos or ():
+                user_id = info['id']
+
+                if user_id in missing:
+                    view_name, keywords = missing.pop(user_id)
+                    found[user_id] = info
+                    # Put the computed value into the cache
+                    self._setCachedValue(info, view_name, keywords,
+                                         [user_id])
+
+            if not missing:
+                break
+
+        if not failed:
+            for view_name, keywords in missing.values():
+                self._setKnownMiss(view_name, keywords)
+
+        return [found.pop(x) for x in user_ids if x in found]
+
     @security.private
     def _authorizeUser(self, user, accessed, container, name, value,
                        roles=_noroles):
@@ -900,8 +1663,8 @@ class PluggableAuthService(Folder, Cacheable):
             accept specific plugin interfaces.
         """
         plugins = self._getOb('plugins')
-        useradders = plugins.listPlugins(IUserAdderPlugin)
-        roleassigners = plugins.listPlugins(IRoleAssignerPlugin)
+        useradders = self._listPlugins(plugins, IUserAdderPlugin)
+        roleassigners = self._listPlugins(plugins, IRoleAssignerPlugin)
 
         user = None
         login = self.applyTransform(login)
@@ -913,6 +1676,7 @@ class PluggableAuthService(Folder, Cacheable):
 
         for useradder_id, useradder in useradders:
             if useradder.doAddUser(login, password):
+                self._invalidateNegativeCache()
                 # ???: Adds user to cache, but without roles...
                 user = self.getUser(login)
                 break
@@ -1074,7 +1838,7 @@ class PluggableAuthService(Folder, Cacheable):
         valid_protocols = []
         choosers = []
         try:
-            choosers = plugins.listPlugins(IChallengeProtocolChooser)
+            choosers = self._listPlugins(plugins, IChallengeProtocolChooser)
         except KeyError:
             # Work around the fact that old instances might not have
             # IChallengeProtocolChooser registered with the
@@ -1088,7 +1852,7 @@ class PluggableAuthService(Folder, Cacheable):
             valid_protocols.extend(choosen)
 
         # Go through all challenge plugins
-        challengers = plugins.listPlugins(IChallengePlugin)
+        challengers = self._listPlugins(plugins, IChallengePlugin)
 
         protocol = None
 
@@ -1146,7 +1910,8 @@ class PluggableAuthService(Folder, Cacheable):
         """
         login = self.applyTransform(login)
         plugins = self._getOb('plugins')
-        cred_updaters = plugins.listPlugins(ICredentialsUpdatePlugin)
+        cred_updaters = self._listPlugins(plugins,
+                                          ICredentialsUpdatePlugin)
 
         for updater_id, updater in cred_updaters:
             updater.updateCredentials(request, response, login, new_password)
@@ -1171,7 +1936,8 @@ class PluggableAuthService(Folder, Cacheable):
         user = getSecurityManager().getUser()
         if aq_base(user) is not nobody:
             plugins = self._getOb('plugins')
-            cred_resetters = plugins.listPlugins(ICredentialsResetPlugin)
+            cred_resetters = self._listPlugins(plugins,
+                                               ICredentialsResetPlugin)
 
             for resetter_id, resetter in cred_resetters:
                 resetter.resetCredentials(request, response)
@@ -1210,7 +1976,7 @@ class PluggableAuthService(Folder, Cacheable):
         # Note: we do not compare the login name here.  See the
         # comment in updateLoginName above.
         plugins = self._getOb('plugins')
-        updaters = plugins.listPlugins(IUserEnumerationPlugin)
+        updaters = self._listPlugins(plugins, IUserEnumerationPlugin)
 
         # Call the updaters.  One of them *must* succeed without an
         # exception, even if it does not change anything.  When a
@@ -1251,7 +2017,7 @@ class PluggableAuthService(Folder, Cacheable):
         to know how many problems there are, if any.
         """
         plugins = self._getOb('plugins')
-        updaters = plugins.listPlugins(IUserEnumerationPlugin)
+        updaters = self._listPlugins(plugins, IUserEnumerationPlugin)
         for updater_id, updater in updaters:
             if not hasattr(updater, 'updateEveryLoginName'):
                 # This was a later addition to the interface, so we
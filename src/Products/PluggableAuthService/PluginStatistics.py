@@ -0,0 +1,185 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Classes:  PluginStatistics
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from .interfaces.authservice import IPluginStatistics
+from .utils import classImplements
+
+
+# Upper bounds of the latency histogram buckets, in seconds;  slower
+# calls land in a last, unbounded bucket.
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+_method_names = {}
+
+
+def _getMethodNames(plugin_type):
+    """ -> names of the methods of 'plugin_type', and of their batch variants.
+    """
+    names = _method_names.get(plugin_type)
+
+    if names is None:
+        names = set(plugin_type.names(all=True))
+        names.update([x + 's' for x in names])
+        names = _method_names[plugin_type] = frozenset(names)
+
+    return names
+
+
+class _InstrumentedPlugin:
+
+    """ Proxy timing calls of a plugin's 'plugin_type' methods.
+
+    o Other attributes are passed through untouched.
+
+    o Lazy results, like generators, are timed until they are returned.
+    """
+
+    def __init__(self, plugin, statistics, plugin_id, plugin_type):
+
+        self.__dict__.update(_plugin=plugin,
+                             _statistics=statistics,
+                             _key=(plugin_id, plugin_type.__identifier__),
+                             _names=_getMethodNames(plugin_type))
+
+    def __getattr__(self, name):
+
+        value = getattr(self._plugin, name)
+
+        if name not in self._names or not callable(value):
+            return value
+
+        statistics = self._statistics
+        key = self._key
+        clock = statistics._clock
+
+        def timed(*args, **kw):
+            start = clock()
+            try:
+                result = value(*args, **kw)
+            except BaseException:
+                statistics.record(key, clock() - start, failed=True)
+                raise
+            statistics.record(key, clock() - start)
+            return result
+
+        return timed
+
+    def __setattr__(self, name, value):
+
+        setattr(self._plugin, name, value)
+
+    def __repr__(self):
+
+        return f'<instrumented {self._plugin!r}>'
+
+
+class PluginStatistics:
+
+    """ Call counts, latencies and errors of plugins.
+
+    o Calls are counted per (plugin id, plugin interface identifier).
+    """
+
+    def __init__(self, clock=time.perf_counter):
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [calls, errors, total, max, histogram]
+
+    def instrument(self, plugin_id, plugin, plugin_type):
+        """ See IPluginStatistics.
+        """
+        return _InstrumentedPlugin(plugin, self, plugin_id, plugin_type)
+
+    def record(self, key, duration, failed=False):
+        """ See IPluginStatistics.
+        """
+        bucket = bisect_left(LATENCY_BUCKETS, duration)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                entry = self._entries[key] = [
+                    0, 0, 0.0, 0.0, [0] * (len(LATENCY_BUCKETS) + 1)]
+
+            entry[0] += 1
+            if failed:
+                entry[1] += 1
+            entry[2] += duration
+            if duration > entry[3]:
+                entry[3] = duration
+            entry[4][bucket] += 1
+
+    def report(self):
+        """ See IPluginStatistics.
+        """
+        with self._lock:
+            entries = [(key, list(entry[:4]) + [list(entry[4])])
+                       for key, entry in self._entries.items()]
+
+        result = []
+
+        for (plugin_id, interface), entry in entries:
+            calls, errors, total, maximum, histogram = entry
+            result.append({'plugin_id': plugin_id,
+                           'interface': interface,
+                           'calls': calls,
+                           'errors': errors,
+                           'total': total,
+                           'mean': total / calls,
+                           'max': maximum,
+                           'histogram': histogram})
+
+        result.sort(key=lambda x: x['total'], reverse=True)
+        return result
+
+    def reset(self):
+        """ See IPluginStatistics.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+classImplements(PluginStatistics, IPluginStatistics)
+
+
+_plugin_statistics = {}
+# Reentrant: unpersisted user folders forget their entries from a
+# finalizer, which the garbage collector may run while we hold it.
+_plugin_statistics_lock = threading.RLock()
+
+
+def getPluginStatistics(key):
+    """ Return the process-wide statistics registered for 'key'.
+    """
+    with _plugin_statistics_lock:
+        statistics = _plugin_statistics.get(key)
+
+        if statistics is None:
+            statistics = _plugin_statistics[key] = PluginStatistics()
+
+    return statistics
+
+
+def forgetPluginStatistics(key):
+    """ Drop the statistics registered for 'key'.
+    """
+    with _plugin_statistics_lock:
+        _plugin_statistics.pop(key, None)
@@ -0,0 +1,204 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Classes:  PrincipalCache
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import transaction
+
+from .interfaces.authservice import IPrincipalCache
+from .utils import classImplements
+
+
+def principalTag(principal_id):
+    """ Return the tag of entries depending on the principal 'principal_id'.
+    """
+    return ('principal', principal_id)
+
+
+class PrincipalCache:
+
+    """ In-process cache of principal data, invalidated by tags.
+
+    o At most 'max_entries' entries are kept;  the least recently used
+      are dropped first.
+
+    o Entries expire after 'ttl' seconds, unless set with their own 'ttl'.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, clock=time.monotonic):
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires, value, tags)
+        self._tagged = {}               # tag -> {key}
+
+    def get(self, key, default=None):
+        """ See IPrincipalCache.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return default
+
+            if entry[0] <= self._clock():
+                self._remove(key)
+                return default
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags=(), ttl=None):
+        """ See IPrincipalCache.
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        tags = frozenset(tags)
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (self._clock() + ttl, value, tags)
+
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, key):
+        """ See IPrincipalCache.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def invalidateTags(self, tags):
+        """ See IPrincipalCache.
+        """
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        """ See IPrincipalCache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def _remove(self, key):
+
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            for tag in entry[2]:
+                keys = self._tagged.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tagged[tag]
+
+
+classImplements(PrincipalCache, IPrincipalCache)
+
+
+_principal_caches = {}
+# Reentrant: unpersisted user folders forget their entries from a
+# finalizer, which the garbage collector may run while we hold it.
+_principal_caches_lock = threading.RLock()
+
+
+def getPrincipalCache(key, max_entries, ttl):
+    """ Return the process-wide cache registered for 'key'.
+
+    o The cache is created on first use and follows later changes of
+      'max_entries' and 'ttl'.
+    """
+    with _principal_caches_lock:
+        cache = _principal_caches.get(key)
+
+        if cache is None:
+            cache = _principal_caches[key] = PrincipalCache(max_entries, ttl)
+
+    cache.max_entries = max_entries
+    cache.ttl = ttl
+
+    return cache
+
+
+def forgetPrincipalCaches(key):
+    """ Drop the caches registered for 'key' and for keys extending it.
+    """
+    with _principal_caches_lock:
+        for cache_key in tuple(_principal_caches):
+            if cache_key[:len(key)] == key:
+                _principal_caches.pop(cache_key, None)
+
+
+def invalidatePrincipalCaches(key, tags):
+    """ Drop the entries tagged with 'tags' from the caches registered for
+        'key' and for keys extending it.
+
+    o The entries are dropped again when the current transaction ends:
+      until it commits, other threads still read the former state, and
+      may have cached it meanwhile.
+    """
+    _invalidatePrincipalCaches(key, tags)
+
+    txn = transaction.get()
+
+    try:
+        pending = txn.data(_pending_invalidations)
+    except KeyError:
+        pending = {}
+        txn.set_data(_pending_invalidations, pending)
+        txn.addAfterCommitHook(_afterTransaction, (pending,))
+        txn.addAfterAbortHook(_afterTransaction, (pending,))
+
+    pending.setdefault(key, set()).update(tags)
+
+
+def _invalidatePrincipalCaches(key, tags):
+
+    with _principal_caches_lock:
+        caches = [_principal_caches.get(cache_key)
+                  for cache_key in tuple(_principal_caches)
+                  if cache_key[:len(key)] == key]
+
+    for cache in caches:
+        if cache is not None:
+            cache.invalidateTags(tags)
+
+
+# Key of the invalidations pending until the end of a transaction
+_pending_invalidations = object()
+
+
+def _afterTransaction(*args):
+    # Called as '(status, pending)' after a commit, '(pending,)' after
+    # an abort.
+    pending = args[-1]
+
+    for key, tags in pending.items():
+        _invalidatePrincipalCaches(key, tags)
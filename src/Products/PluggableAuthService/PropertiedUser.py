@@ -13,9 +13,11 @@
 ##############################################################################
 """ Classes:  PropertiedUser
 """
+import sys
 
 from AccessControl.PermissionRole import _what_not_even_god_should_do
 from AccessControl.users import BasicUser
+from Acquisition import aq_base
 from Acquisition import aq_inner
 from Acquisition import aq_parent
 
@@ -89,45 +91,10 @@ class PropertiedUser(BasicUser):
         o Ripped off from AccessControl.User.BasicUser, which provides
           no other extension mechanism. :(
         """
-        user_id = self.getId()
-        group_ids = self.getGroups()
-
-        principal_ids = list(group_ids)
-        principal_ids.insert(0, user_id)
-
         local = {}
-        object = aq_inner(object)
-
-        while True:
-
-            local_roles = getattr(object, '__ac_local_roles__', None)
-
-            if local_roles:
-
-                if callable(local_roles):
-                    local_roles = local_roles()
-
-                dict = local_roles or {}
-
-                for principal_id in principal_ids:
-                    for role in dict.get(principal_id, []):
-                        local[role] = 1
-
-            inner = aq_inner(object)
-            parent = aq_parent(inner)
-
-            if parent is not None:
-                object = parent
-                continue
-
-            new = getattr(object, '__self__', None)
-
-            if new is not None:
 
-                object = aq_inner(new)
-                continue
-
-            break
+        for roles in self._iterLocalRoles(object):
+            local.update(dict.fromkeys(roles))
 
         return list(self.getRoles()) + list(local.keys())
 
@@ -168,40 +135,49 @@ class PropertiedUser(BasicUser):
         # Still have not found a match, so check local roles. We do
         # this manually rather than call getRolesInContext so that
         # we can incur only the overhead required to find a match.
-        inner_obj = aq_inner(object)
-        user_id = self.getId()
-        # [x.getId() for x in self.getGroups()]
-        group_ids = self.getGroups()
+        object_roles = frozenset(object_roles)
 
-        principal_ids = list(group_ids)
-        principal_ids.insert(0, user_id)
+        for roles in self._iterLocalRoles(object):
 
-        while True:
+            if not object_roles.isdisjoint(roles):
 
-            local_roles = getattr(inner_obj, '__ac_local_roles__', None)
+                if self._check_context(object):
+                    return 1
 
-            if local_roles:
+                return 0
 
-                if callable(local_roles):
-                    local_roles = local_roles()
+        return None
 
-                dict = local_roles or {}
+    def _iterLocalRoles(self, object):
+        """ Yield the local roles of ourselves and our groups, per level.
 
-                for principal_id in principal_ids:
+        o Walk the containment chain of 'object' up to the root, calling
+          '__ac_local_roles__' where it is callable.
 
-                    local_roles = dict.get(principal_id, [])
+        o The chain is walked afresh on every call, as local roles may
+          change during a request.
+        """
+        principal_ids = [self.getId()]
+        principal_ids.extend(self.getGroups())
 
-                    for role in object_roles:
+        inner_obj = aq_inner(object)
 
-                        if role in local_roles:
+        while True:
 
-                            if self._check_context(object):
-                                return 1
+            local_roles = getattr(inner_obj, '__ac_local_roles__', None)
 
-                            return 0
+            if local_roles:
 
-            inner = aq_inner(inner_obj)
-            parent = aq_parent(inner)
+                if callable(local_roles):
+                    local_roles = local_roles()
+
+                if local_roles:
+                    for principal_id in principal_ids:
+                        roles = local_roles.get(principal_id)
+                        if roles:
+                            yield roles
+
+            parent = aq_parent(aq_inner(inner_obj))
 
             if parent is not None:
                 inner_obj = parent
@@ -215,8 +191,6 @@ class PropertiedUser(BasicUser):
 
             break
 
-        return None
-
     #
     #   Interfaces to allow user folder plugins to annotate the user.
     #
@@ -268,3 +242,55 @@ class PropertiedUser(BasicUser):
 
 
 classImplements(PropertiedUser, IPropertiedUser)
+
+
+def _intern(value):
+
+    if type(value) is str:
+        return sys.intern(value)
+
+    return value
+
+
+class _CompactUser:
+
+    """ Frozen, compact copy of a PropertiedUser, as kept in user caches.
+
+    o Roles and groups are kept as tuples of interned strings, the
+      propertysheets as a tuple of (id, sheet) pairs;  other instance
+      attributes, e.g. of subclasses, as a tuple of items.
+
+    o 'restore' returns a new user of the original class.
+    """
+    __slots__ = ('_class', '_id', '_login', '_roles', '_groups',
+                 '_propertysheets', '_extra')
+
+    def __init__(self, user):
+
+        user = aq_base(user)
+        state = dict(user.__dict__)
+
+        self._class = user.__class__
+        self._id = _intern(state.pop('_id', None))
+        self._login = _intern(state.pop('_login', None))
+        self._roles = tuple([_intern(x) for x in state.pop('_roles', ())])
+        self._groups = tuple([_intern(x) for x in state.pop('_groups', ())])
+        self._propertysheets = tuple(state.pop('_propertysheets', {}).items())
+        self._extra = tuple(state.items()) or None
+
+    def restore(self):
+        """ Return a user equivalent to the one we were made from.
+        """
+        user = self._class.__new__(self._class)
+        state = user.__dict__
+
+        if self._extra:
+            state.update(self._extra)
+
+        state['_id'] = self._id
+        state['_login'] = self._login
+        state['_roles'] = dict.fromkeys(self._roles, 1)
+        state['_groups'] = dict.fromkeys(self._groups, 1)
+        state['_propertysheets'] = dict(self._propertysheets)
+
+        return user
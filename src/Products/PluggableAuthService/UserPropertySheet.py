@@ -24,6 +24,10 @@ from .utils import classImplements
 
 StringTypes = (str, str)
 
+# Sheets with the same schema share one schema tuple, see '_shareSchema'.
+_MAX_SHARED_SCHEMAS = 1000
+_shared_schemas = {}
+
 
 def _guessSchema(kw):
 
@@ -73,6 +77,24 @@ def _guessSchema(kw):
     return schema
 
 
+def _shareSchema(schema):
+    """ Return the shared tuple equal to 'schema', if there is one.
+    """
+    schema = tuple([tuple(x) for x in schema])
+
+    try:
+        return _shared_schemas[schema]
+    except TypeError:  # unhashable
+        return schema
+    except KeyError:
+        pass
+
+    if len(_shared_schemas) < _MAX_SHARED_SCHEMAS:
+        _shared_schemas[schema] = schema
+
+    return schema
+
+
 class UserPropertySheet:
 
     """ Model a single, read-only set of properties about a user.
@@ -83,6 +105,8 @@ class UserPropertySheet:
       as a sequence of (id, type) tuples;  if not passed, the c'tor will
       guess the schema from the keyword args.
     """
+    # Many instances are kept in user caches:  no per-instance '__dict__'.
+    __slots__ = ('_id', '_schema', '_properties')
 
     def __init__(self, id, schema=None, **kw):
 
@@ -91,7 +115,7 @@ class UserPropertySheet:
         if schema is None:
             schema = _guessSchema(kw)
 
-        self._schema = tuple(schema)
+        self._schema = _shareSchema(schema)
         self._properties = {}
 
         for id, ptype in schema:
@@ -0,0 +1,14 @@
+""" Benchmarks of the PluggableAuthService hot paths.
+
+Run them against synthetic user folders of 1000 and 100000 users and keep
+the JSON results::
+
+  python -m Products.PluggableAuthService.benchmarks --sizes 1000 100000 \
+      -o before.json
+
+Compare a later run with them;  the exit status is 1 if a benchmark got
+slower by more than the '--threshold' ratio::
+
+  python -m Products.PluggableAuthService.benchmarks --sizes 1000 100000 \
+      -o after.json --compare before.json
+"""
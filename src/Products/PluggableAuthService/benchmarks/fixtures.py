@@ -0,0 +1,152 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Synthetic user folders for the benchmarks.
+"""
+from AccessControl.AuthEncoding import pw_encrypt
+from OFS.Folder import Folder
+from OFS.SimpleItem import SimpleItem
+from Products.PluginRegistry.PluginRegistry import PluginRegistry
+from Testing.makerequest import makerequest
+from ZPublisher.utils import basic_auth_encode
+
+from ..interfaces.plugins import IAuthenticationPlugin
+from ..interfaces.plugins import IExtractionPlugin
+from ..interfaces.plugins import IGroupEnumerationPlugin
+from ..interfaces.plugins import IGroupsPlugin
+from ..interfaces.plugins import IRoleEnumerationPlugin
+from ..interfaces.plugins import IRolesPlugin
+from ..interfaces.plugins import IUserEnumerationPlugin
+from ..PluggableAuthService import _PLUGIN_TYPE_INFO
+from ..PluggableAuthService import PluggableAuthService
+from ..plugins.HTTPBasicAuthHelper import HTTPBasicAuthHelper
+from ..plugins.RecursiveGroupsPlugin import RecursiveGroupsPlugin
+from ..plugins.ZODBGroupManager import ZODBGroupManager
+from ..plugins.ZODBRoleManager import ZODBRoleManager
+from ..plugins.ZODBUserManager import ZODBUserManager
+
+
+PASSWORD = 'secret'
+
+# Each group is nested in the group with its id divided by this
+GROUP_FANOUT = 10
+
+
+def userId(index):
+    return 'user%07d' % index
+
+
+def groupId(index):
+    return 'group%06d' % index
+
+
+def roleId(index):
+    return 'Role%05d' % index
+
+
+class ProtectedItem(SimpleItem):
+
+    """ Published object only authenticated users may view.
+    """
+
+    __roles__ = ('Authenticated',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Fixture:
+
+    """ A user folder with 'users' users, 'groups' groups and 'roles' roles.
+
+    o User 'i' is a member of group 'i % groups', and group 'j' of group
+      'j // GROUP_FANOUT', so groups nest about log10('groups') deep.
+
+    o Each group has one role, and so has each user.
+    """
+
+    def __init__(self, users, groups=None, roles=None):
+
+        if groups is None:
+            groups = max(users // 10, 1)
+
+        if roles is None:
+            roles = max(users // 100, 1)
+
+        self.users = users
+        self.groups = groups
+        self.roles = roles
+
+        root = self.root = Folder('root')
+        root._setObject('item', ProtectedItem('item'))
+
+        root._setObject('acl_users', PluggableAuthService())
+        pas = self.pas = root.acl_users
+        registry = PluginRegistry(_PLUGIN_TYPE_INFO)
+        registry._setId('plugins')
+        pas._setObject('plugins', registry)
+
+        pas._setObject('http_auth', HTTPBasicAuthHelper('http_auth'))
+        pas._setObject('users', ZODBUserManager('users'))
+        pas._setObject('groups', ZODBGroupManager('groups'))
+        pas._setObject('recursive_groups',
+                       RecursiveGroupsPlugin('recursive_groups'))
+        pas._setObject('roles', ZODBRoleManager('roles'))
+
+        registry = pas.plugins
+        for plugin_type, plugin_ids in (
+                (IExtractionPlugin, ('http_auth',)),
+                (IAuthenticationPlugin, ('users',)),
+                (IUserEnumerationPlugin, ('users',)),
+                (IGroupEnumerationPlugin, ('groups',)),
+                (IGroupsPlugin, ('groups', 'recursive_groups')),
+                (IRoleEnumerationPlugin, ('roles',)),
+                (IRolesPlugin, ('roles',))):
+            for plugin_id in plugin_ids:
+                registry.activatePlugin(plugin_type, plugin_id)
+
+        self._populate()
+
+    def _populate(self):
+
+        pas = self.pas
+        # Hash once;  encrypted passwords are stored as they are.
+        password = pw_encrypt(PASSWORD)
+
+        for i in range(self.roles):
+            pas.roles.addRole(roleId(i))
+
+        for i in range(self.groups):
+            group_id = groupId(i)
+            pas.groups.addGroup(group_id)
+            pas.roles.assignRoleToPrincipal(roleId(i % self.roles), group_id)
+            if i:
+                pas.groups.addPrincipalToGroup(group_id,
+                                               groupId(i // GROUP_FANOUT))
+
+        for i in range(self.users):
+            user_id = userId(i)
+            pas.users.addUser(user_id, user_id, password)
+            pas.groups.addPrincipalToGroup(user_id, groupId(i % self.groups))
+            pas.roles.assignRoleToPrincipal(roleId(i % self.roles), user_id)
+
+    def makeRequest(self, user_id):
+        """ Return a request publishing our protected item to 'user_id'.
+        """
+        request = makerequest(self.root).REQUEST
+        item = self.root.item
+        request['PUBLISHED'] = item
+        request['PARENTS'] = [self.root]
+        request.steps = ['item']
+        request._auth = basic_auth_encode(user_id, PASSWORD)
+        return request
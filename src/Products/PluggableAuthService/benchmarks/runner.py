@@ -0,0 +1,202 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+""" Run the benchmarks and compare their results.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import timeit
+from itertools import cycle
+
+from ..PropertiedUser import PropertiedUser
+from .fixtures import Fixture
+from .fixtures import groupId
+from .fixtures import roleId
+from .fixtures import userId
+
+
+FORMAT_VERSION = 1
+
+# Number of distinct principals each benchmark cycles through
+SAMPLE_SIZE = 100
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """ Register a function returning the callable to time for a fixture.
+    """
+    def decorator(function):
+        BENCHMARKS[name] = function
+        return function
+    return decorator
+
+
+def _sample(count):
+    # Spread over the whole fixture, ending in deeply nested groups
+    step = max(count // SAMPLE_SIZE, 1)
+    return [count - 1 - i for i in range(0, count, step)][:SAMPLE_SIZE]
+
+
+@benchmark('validate')
+def _validate(fixture):
+    requests = cycle([fixture.makeRequest(userId(i))
+                      for i in _sample(fixture.users)])
+    return lambda: fixture.pas.validate(next(requests))
+
+
+@benchmark('getUserById')
+def _getUserById(fixture):
+    user_ids = cycle([userId(i) for i in _sample(fixture.users)])
+    return lambda: fixture.pas.getUserById(next(user_ids))
+
+
+@benchmark('searchUsers')
+def _searchUsers(fixture):
+    # Non-exact searches matching about 1 in 100 users
+    logins = cycle(['%05d' % (i // 100) for i in _sample(fixture.users)])
+    return lambda: fixture.pas.searchUsers(login=next(logins),
+                                           sort_by='login', max_results=20)
+
+
+@benchmark('searchPrincipals')
+def _searchPrincipals(fixture):
+    ids = cycle(['%04d' % (i // 100) for i in _sample(fixture.groups)])
+    return lambda: fixture.pas.searchPrincipals(id=next(ids), max_results=20)
+
+
+@benchmark('listAssignedPrincipals')
+def _listAssignedPrincipals(fixture):
+    role_ids = cycle([roleId(i) for i in _sample(fixture.roles)])
+    return lambda: fixture.pas.roles.listAssignedPrincipals(next(role_ids))
+
+
+@benchmark('recursiveGroups')
+def _recursiveGroups(fixture):
+    plugin = fixture.pas.recursive_groups
+    users = []
+
+    for i in _sample(fixture.users):
+        user = PropertiedUser(userId(i)).__of__(fixture.pas)
+        user._addGroups([groupId(i % fixture.groups)])
+        users.append(user)
+
+    users = cycle(users)
+    return lambda: plugin.getGroupsForPrincipal(next(users))
+
+
+def run(sizes, names=None, repeat=5, number=100, log=None):
+    """ -> results mapping for the benchmarks 'names' at each fixture size.
+
+    o Each benchmark is timed 'repeat' times for 'number' calls;  the
+      results hold the best and median time per call, in seconds.
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+
+    results = []
+
+    for size in sizes:
+        if log is not None:
+            log(f'Building a fixture of {size} users')
+        fixture = Fixture(size)
+
+        for name in names:
+            timer = timeit.Timer(BENCHMARKS[name](fixture))
+            timings = [x / number for x in timer.repeat(repeat, number)]
+            results.append({'benchmark': name,
+                            'size': size,
+                            'repeat': repeat,
+                            'number': number,
+                            'best': min(timings),
+                            'median': statistics.median(timings)})
+            if log is not None:
+                log(f'{name:24s} {size:>9d} {min(timings) * 1e6:12.1f} us')
+
+    return {'format': FORMAT_VERSION,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'results': results}
+
+
+def compare(baseline, current):
+    """ -> [(benchmark, size, baseline best, current best, ratio)]
+
+    o Only benchmarks present in both results are compared.
+    """
+    before = {(x['benchmark'], x['size']): x['best']
+              for x in baseline['results']}
+    comparison = []
+
+    for result in current['results']:
+        key = (result['benchmark'], result['size'])
+        if key in before:
+            comparison.append(key + (before[key], result['best'],
+                                     result['best'] / before[key]))
+
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m Products.PluggableAuthService.benchmarks',
+        description='Time PluggableAuthService hot paths.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000],
+                        help='numbers of users in the fixtures '
+                             '(default: 1000)')
+    parser.add_argument('--benchmark', action='append', dest='names',
+                        choices=sorted(BENCHMARKS),
+                        help='benchmark to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=100)
+    parser.add_argument('--output', '-o', help='write JSON results here')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='fail if a benchmark got slower by this ratio '
+                             'compared to --compare (default: 1.2)')
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    results = run(args.sizes, args.names, args.repeat, args.number, log)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+
+    status = 0
+    for name, size, before, after, ratio in compare(baseline, results):
+        flag = ''
+        if ratio > args.threshold:
+            flag = ' SLOWER'
+            status = 1
+        log(f'{name:24s} {size:>9d} {before * 1e6:12.1f} us '
+            f'{after * 1e6:12.1f} us {ratio:6.2f}{flag}')
+
+    return status
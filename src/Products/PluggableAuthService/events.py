@@ -39,17 +39,19 @@ class PASEvent:
 @implementer(IPrincipalAddedToGroupEvent)
 class PrincipalAddedToGroup(PASEvent):
 
-    def __init__(self, principal, group_id):
+    def __init__(self, principal, group_id, plugin=None):
         super().__init__(principal)
         self.group_id = group_id
+        self.plugin = plugin
 
 
 @implementer(IPrincipalRemovedFromGroupEvent)
 class PrincipalRemovedFromGroup(PASEvent):
 
-    def __init__(self, principal, group_id):
+    def __init__(self, principal, group_id, plugin=None):
         super().__init__(principal)
         self.group_id = group_id
+        self.plugin = plugin
 
 
 @implementer(IPrincipalCreatedEvent)
@@ -110,6 +110,16 @@ class IUserFolder(Interface):
         o If no such user can be found, return 'default'.
         """
 
+    def getUsersByIds(ids):
+        """ Return the users corresponding to the given ids.
+
+        o Users are returned in the order of 'ids';  ids for which no
+          user can be found are skipped.
+
+        o Unlike calling 'getUserById' for each id, plugins are asked
+          once for all users.
+        """
+
     def validate(request, auth='', roles=_noroles):
         """ Perform identification, authentication, and authorization.
 
@@ -221,6 +231,18 @@ class IPluggableAuthService(IUserFolder):
         to know how many problems there are, if any.
         """
 
+    def getPluginStatistics():
+        """ Return the call statistics of our plugins, see
+            IPluginStatistics.report.
+
+        o Calls are only recorded while the 'instrument_plugins'
+          property is true.
+        """
+
+    def resetPluginStatistics():
+        """ Forget the call statistics of our plugins.
+        """
+
 
 # The IMutableUserFolder and IEnumerableFolder are not supported
 # out-of-the-box by the pluggable authentication service.  These
@@ -262,3 +284,76 @@ class IEnumerableUserFolder(IUserFolder):
     def getUsers():
         """ Return a list of user objects.
         """
+
+
+class IPrincipalCache(Interface):
+
+    """ Bounded cache of principal data, invalidated by tags.
+
+    o Plugins get the cache of their PAS via its '_getPrincipalCache'
+      method, which returns None when the cache is disabled.
+
+    o Tag entries with 'PrincipalCache.principalTag(principal_id)' for
+      every principal they depend on:  invalidating the principal drops
+      all of them at once.
+    """
+
+    def get(key, default=None):
+        """ Return the unexpired value cached for 'key', or 'default'.
+        """
+
+    def set(key, value, tags=(), ttl=None):
+        """ Cache 'value' for 'key', tagged with the hashable 'tags'.
+
+        o 'ttl' defaults to the lifetime configured for the cache.
+        """
+
+    def invalidate(key):
+        """ Drop the entry for 'key', if any.
+        """
+
+    def invalidateTags(tags):
+        """ Drop all entries tagged with any of 'tags'.
+        """
+
+    def clear():
+        """ Drop all entries.
+        """
+
+
+class IPluginStatistics(Interface):
+
+    """ Call counts, latencies and errors of the plugins of a PAS.
+
+    o Statistics are kept per (plugin id, plugin interface identifier).
+    """
+
+    def instrument(plugin_id, plugin, plugin_type):
+        """ Return a proxy for 'plugin', recording its calls of the methods
+            of 'plugin_type'.
+        """
+
+    def record(key, duration, failed=False):
+        """ Record a call for 'key' which took 'duration' seconds.
+
+        o 'failed' tells whether the call raised an exception.
+        """
+
+    def report():
+        """ -> [mapping_1, ... mapping_N], slowest plugins first.
+
+        o Keys of the mappings:
+
+          'plugin_id', 'interface' -- the plugin and interface called
+
+          'calls', 'errors' -- numbers of calls, and of failed calls
+
+          'total', 'mean', 'max' -- latencies in seconds
+
+          'histogram' -- numbers of calls per latency bucket, see
+                         'PluginStatistics.LATENCY_BUCKETS'
+        """
+
+    def reset():
+        """ Forget all recorded calls.
+        """
@@ -13,12 +13,14 @@ class IPrincipalAddedToGroupEvent(IPASEvent):
     """A principal has been added to a group.
     """
     group_id = Attribute('Group ID to which principal is being added')
+    plugin = Attribute('Plugin which stores the membership, or None')
 
 
 class IPrincipalRemovedFromGroupEvent(IPASEvent):
     """A principal has been removed from a group.
     """
     group_id = Attribute('Group ID from which principal is being removed')
+    plugin = Attribute('Plugin which stored the membership, or None')
 
 
 class IPrincipalCreatedEvent(IPASEvent):
@@ -76,6 +76,12 @@ class ILoginPasswordHostExtractionPlugin(ILoginPasswordExtractionPlugin):
 class IAuthenticationPlugin(Interface):
 
     """ Map credentials to a user ID.
+
+    o Plugins may also provide 'getCredentialsRevision(user_id)',
+      returning a string which changes along with the password of
+      'user_id' (None for unknown users).  Plugins keeping users logged in
+      without their password, like the CookieAuthHelper in ticket mode,
+      stop accepting them once it changes.
     """
 
     def authenticateCredentials(credentials):
@@ -219,6 +225,10 @@ class IPropertiesPlugin(Interface):
 
         o May assign properties based on values in the REQUEST object, if
           present
+
+        o Plugins may also provide 'getPropertiesForUsers(users,
+          request=None)', returning the properties of several users in
+          their order, to be called instead of one call per user.
         """
 
 
@@ -234,6 +244,10 @@ class IGroupsPlugin(Interface):
           (either a user or another group) belongs.
 
         o May assign groups based on values in the REQUEST object, if present
+
+        o Plugins may also provide 'getGroupsForPrincipals(principals,
+          request=None)', returning the groups of several principals in
+          their order, to be called instead of one call per principal.
         """
 
 
@@ -248,6 +262,10 @@ class IRolesPlugin(Interface):
         o Return a sequence of role names which the principal has.
 
         o May assign roles based on values in the REQUEST object, if present.
+
+        o Plugins may also provide 'getRolesForPrincipals(principals,
+          request=None)', returning the roles of several principals in
+          their order, to be called instead of one call per principal.
         """
 
 
@@ -312,6 +330,18 @@ class IUserEnumerationPlugin(Interface):
           limiting the number of returned mappings.  If unspecified, the
           plugin should return mappings for all users satisfying the criteria.
 
+        o The PluggableAuthService only passes 'sort_by' and 'max_results'
+          on to plugins with a true 'sorted_enumeration' attribute.  Such
+          plugins must return their mappings sorted by the lowercased
+          'sort_by' value;  they may return any iterable, including a
+          lazy one.
+
+        o If the PluggableAuthService has an 'enumeration_timeout', it
+          calls plugins with a true 'concurrent_enumeration' attribute in
+          parallel threads, and leaves out those not done in time.  Only
+          I/O-bound plugins which are thread-safe and do not use
+          persistent objects may set it.
+
         o Minimal keys in the returned mappings:
 
           'id' -- (required) the user ID, which may be different than
@@ -384,6 +414,18 @@ class IGroupEnumerationPlugin(Interface):
           plugin should return mappings for all groups satisfying the
           criteria.
 
+        o The PluggableAuthService only passes 'sort_by' and 'max_results'
+          on to plugins with a true 'sorted_enumeration' attribute.  Such
+          plugins must return their mappings sorted by the lowercased
+          'sort_by' value;  they may return any iterable, including a
+          lazy one.
+
+        o If the PluggableAuthService has an 'enumeration_timeout', it
+          calls plugins with a true 'concurrent_enumeration' attribute in
+          parallel threads, and leaves out those not done in time.  Only
+          I/O-bound plugins which are thread-safe and do not use
+          persistent objects may set it.
+
         o Minimal keys in the returned mappings:
 
           'id' -- (required) the group ID
@@ -25,7 +25,10 @@ from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from zope.interface import implementedBy
 from zope.interface import providedBy
 
+from ..interfaces.plugins import IAuthenticationPlugin
 from ..permissions import ManageUsers
+from ..PluggableAuthService import _SWALLOWABLE_PLUGIN_EXCEPTIONS
+from ..PluggableAuthService import reraise
 from ..utils import classImplements
 from ..utils import createViewName
 
@@ -108,13 +111,107 @@ class BasePlugin(SimpleItem, PropertyManager):
         """ Canonical way to get at the PAS instance from a plugin """
         return aq_parent(aq_inner(self))
 
+    @security.private
+    def _getPrincipalInfos(self, principal_ids):
+        """ principal_ids -> {principal_id: [info_1, ... info_N]}
+
+        o Look the principals up in one exact-match search, and only fall
+          back to searching one principal at a time for the ids which
+          were not found that way.
+        """
+        result = {principal_id: [] for principal_id in principal_ids}
+
+        if result:
+            pas = self._getPAS()
+
+            for info in pas.searchPrincipals(id=list(result),
+                                             exact_match=True):
+                infos = result.get(info['id'])
+                if infos is not None:
+                    infos.append(info)
+
+            for principal_id, infos in result.items():
+                if not infos:
+                    infos.extend(pas.searchPrincipals(id=principal_id,
+                                                      exact_match=True))
+
+        return result
+
     @security.private
     def _invalidatePrincipalCache(self, id):
         pas = self._getPAS()
-        if pas is not None and hasattr(aq_base(pas), 'ZCacheable_invalidate'):
+        if pas is None:
+            return
+        if hasattr(aq_base(pas), '_invalidatePrincipal'):
+            pas._invalidatePrincipal(id)
+        elif hasattr(aq_base(pas), 'ZCacheable_invalidate'):
             view_name = createViewName('_findUser', id)
             pas.ZCacheable_invalidate(view_name)
 
+    @security.private
+    def _invalidateNegativeCache(self):
+        pas = self._getPAS()
+        if pas is not None and hasattr(aq_base(pas),
+                                       '_invalidateNegativeCache'):
+            pas._invalidateNegativeCache()
+
+    @security.private
+    def _authenticateLogin(self, login, password):
+        """ Ask the other authenticators of our PAS -> user id or None.
+        """
+        pas = self._getPAS()
+        credentials = {'login': self.applyTransform(login),
+                       'password': password}
+
+        for plugin_id, plugin in pas.plugins.listPlugins(
+                IAuthenticationPlugin):
+            if plugin_id == self.getId():
+                continue
+            try:
+                info = plugin.authenticateCredentials(credentials)
+            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+                reraise(plugin)
+                continue
+            if info is not None and info[0] is not None:
+                return info[0]
+
+        return None
+
+    @security.private
+    def _getCredentialsRevision(self, user_id):
+        """ Ask our PAS about 'user_id' -> revision string or None.
+
+        o Return None if 'user_id' does not exist (anymore).
+
+        o Otherwise, join the revisions of the other authenticators which
+          provide 'getCredentialsRevision';  they change along with the
+          password of 'user_id'.
+        """
+        pas = self._getPAS()
+
+        if pas is None:
+            return ''
+
+        if pas._verifyUser(pas.plugins, user_id=user_id) is None:
+            return None
+
+        revisions = []
+
+        for plugin_id, plugin in pas.plugins.listPlugins(
+                IAuthenticationPlugin):
+            if plugin_id == self.getId() or getattr(
+                    aq_base(plugin), 'getCredentialsRevision', None) is None:
+                continue
+            try:
+                revision = plugin.getCredentialsRevision(user_id)
+            except _SWALLOWABLE_PLUGIN_EXCEPTIONS:
+                reraise(plugin)
+                continue
+            if revision is not None:
+                revisions.append(revision)
+
+        return ':'.join(revisions)
+
     @security.private
     def applyTransform(self, value):
         """ Transform for login name.
@@ -15,6 +15,9 @@
 """
 
 import codecs
+import hmac
+import os
+import time
 from base64 import decodebytes
 from base64 import encodebytes
 from binascii import Error
@@ -32,10 +35,12 @@ from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from Products.PageTemplates.ZopePageTemplate import ZopePageTemplate
 from zope.interface import Interface
 
+from ..interfaces.plugins import IAuthenticationPlugin
 from ..interfaces.plugins import IChallengePlugin
 from ..interfaces.plugins import ICredentialsResetPlugin
 from ..interfaces.plugins import ICredentialsUpdatePlugin
 from ..interfaces.plugins import ILoginPasswordHostExtractionPlugin
+from ..permissions import ManageUsers
 from ..plugins.BasePlugin import BasePlugin
 from ..utils import classImplements
 from ..utils import url_local
@@ -79,6 +84,21 @@ def decode_hex(raw):
     return value
 
 
+TICKET_PREFIX = 'ticket'
+
+
+def _ticket_payload(user_id, login, issued, expires):
+    return ':'.join([hexlify(user_id.encode('utf-8')).decode('ascii'),
+                     hexlify(login.encode('utf-8')).decode('ascii'),
+                     '%d' % issued, '%d' % expires])
+
+
+def _ticket_signature(secret, payload, revision):
+    # The credentials revision is signed, but not stored in the ticket
+    message = ('%s:%s' % (payload, revision)).encode('utf-8')
+    return hmac.new(secret, message, 'sha256').hexdigest().encode('ascii')
+
+
 class CookieAuthHelper(Folder, BasePlugin):
     """ Multi-plugin for managing details of Cookie Authentication. """
 
@@ -89,6 +109,10 @@ class CookieAuthHelper(Folder, BasePlugin):
     cookie_same_site = 'Lax'
     cookie_same_site_choices = ('None', 'Lax', 'Strict')
     cookie_secure = False
+    use_tickets = False
+    ticket_lifetime = 7200
+    ticket_refresh = 600
+    _ticket_secrets = ()
     security = ClassSecurityInfo()
 
     _properties = ({'id': 'title', 'label': 'Title',
@@ -101,7 +125,13 @@ class CookieAuthHelper(Folder, BasePlugin):
                     'label': 'Cookie SameSite restriction', 'mode': 'w',
                     'select_variable': 'cookie_same_site_choices'},
                    {'id': 'login_path', 'label': 'Login Form',
-                    'type': 'string', 'mode': 'w'})
+                    'type': 'string', 'mode': 'w'},
+                   {'id': 'use_tickets', 'type': 'boolean', 'mode': 'w',
+                    'label': 'Store signed tickets instead of passwords'},
+                   {'id': 'ticket_lifetime', 'type': 'int', 'mode': 'w',
+                    'label': 'Ticket lifetime (seconds)'},
+                   {'id': 'ticket_refresh', 'type': 'int', 'mode': 'w',
+                    'label': 'Renew tickets older than (seconds)'})
 
     manage_options = (BasePlugin.manage_options[:1]
                       + Folder.manage_options[:1]
@@ -133,18 +163,22 @@ class CookieAuthHelper(Folder, BasePlugin):
                 # Cookie is in a different format, so it is not ours
                 return creds
 
-            try:
-                login, password = cookie_val.split(':')
-            except ValueError:
-                # Cookie is in a different format, so it is not ours
-                return creds
+            if cookie_val.startswith(TICKET_PREFIX + ':'):
+                creds = self._extractTicket(request, cookie_val)
 
-            try:
-                creds['login'] = decode_hex(login)
-                creds['password'] = decode_hex(password)
-            except (Error, TypeError):
-                # Cookie is in a different format, so it is not ours
-                return {}
+            else:
+                try:
+                    login, password = cookie_val.split(':')
+                except ValueError:
+                    # Cookie is in a different format, so it is not ours
+                    return creds
+
+                try:
+                    creds['login'] = decode_hex(login)
+                    creds['password'] = decode_hex(password)
+                except (Error, TypeError):
+                    # Cookie is in a different format, so it is not ours
+                    return {}
 
         if creds:
             creds['remote_host'] = request.get('REMOTE_HOST', '')
@@ -156,6 +190,74 @@ class CookieAuthHelper(Folder, BasePlugin):
 
         return creds
 
+    @security.private
+    def _extractTicket(self, request, cookie_val):
+        """ Verify the ticket in 'cookie_val' -> credentials or {}.
+
+        o Tickets are rejected once their user is removed or its
+          credentials revision changes, e.g. with its password.
+
+        o Tickets signed with a previous secret, or older than
+          'ticket_refresh' seconds, are renewed in the response.
+        """
+        if not self.use_tickets:
+            return {}
+
+        try:
+            payload, signature = cookie_val[len(TICKET_PREFIX) + 1:].rsplit(
+                ':', 1)
+            user_id, login, issued, expires = payload.split(':')
+            user_id = decode_hex(user_id)
+            login = decode_hex(login)
+            issued = int(issued)
+            expires = int(expires)
+            payload.encode('ascii')
+            signature = signature.encode('ascii')
+        except (Error, TypeError, ValueError):
+            # Cookie is in a different format, so it is not ours
+            return {}
+
+        now = time.time()
+
+        if expires <= now or not self._ticket_secrets:
+            return {}
+
+        revision = self._getCredentialsRevision(user_id)
+
+        if revision is None:
+            return {}
+
+        for secret in self._ticket_secrets:
+            if hmac.compare_digest(
+                    _ticket_signature(secret, payload, revision), signature):
+                break
+        else:
+            return {}
+
+        if secret is not self._ticket_secrets[0] or \
+                now - issued >= self.ticket_refresh:
+            response = request.get('RESPONSE')
+            if response is not None:
+                self._setTicketCookie(response, user_id, login, revision)
+
+        return {'login': login, 'ticket_user_id': user_id}
+
+    @security.private
+    def authenticateCredentials(self, credentials):
+        """ See IAuthenticationPlugin.
+
+        o Only accept the tickets we verified while extracting them.
+        """
+        if credentials.get('extractor') != self.getId():
+            return None
+
+        user_id = credentials.get('ticket_user_id')
+
+        if user_id is None:
+            return None
+
+        return user_id, credentials.get('login')
+
     @security.private
     def challenge(self, request, response, **kw):
         """ Challenge the user for credentials. """
@@ -171,14 +273,72 @@ class CookieAuthHelper(Folder, BasePlugin):
         return cookie_val
 
     @security.private
-    def updateCredentials(self, request, response, login, new_password):
-        """ Respond to change of credentials (NOOP for basic auth). """
-        cookie_val = self.get_cookie_value(login, new_password)
+    def get_ticket_value(self, user_id, login, revision=None):
+        """ Return a ticket for 'user_id' signed with our current secret.
+
+        o 'revision' defaults to the current credentials revision of
+          'user_id'.
+        """
+        if not self._ticket_secrets:
+            self.rotateTicketSecret()
+
+        if revision is None:
+            revision = self._getCredentialsRevision(user_id) or ''
+
+        issued = int(time.time())
+        payload = _ticket_payload(user_id, login, issued,
+                                  issued + self.ticket_lifetime)
+        signature = _ticket_signature(self._ticket_secrets[0], payload,
+                                      revision)
+        ticket = b':'.join([TICKET_PREFIX.encode('ascii'),
+                            payload.encode('ascii'), signature])
+        return encodebytes(ticket).replace(b'\n', b'')
+
+    @security.protected(ManageUsers)
+    def rotateTicketSecret(self, REQUEST=None):
+        """ Sign new tickets with a new secret.
+
+        o Tickets signed with the previous secret stay valid, and are
+          renewed with the new one;  older tickets are rejected.
+        """
+        self._ticket_secrets = (os.urandom(32),) + self._ticket_secrets[:1]
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect('%s/manage_propertiesForm'
+                                         '?manage_tabs_message='
+                                         'Ticket+secret+rotated.' %
+                                         self.absolute_url())
+
+    @security.private
+    def _setCookie(self, response, cookie_val):
         cookie_secure = self.cookie_same_site == 'None' or self.cookie_secure
         response.setCookie(self.cookie_name, quote(cookie_val),
                            path='/', same_site=self.cookie_same_site,
                            secure=cookie_secure)
 
+    @security.private
+    def _setTicketCookie(self, response, user_id, login, revision=None):
+        self._setCookie(response,
+                        self.get_ticket_value(user_id, login, revision))
+
+    @security.private
+    def updateCredentials(self, request, response, login, new_password):
+        """ Respond to change of credentials (NOOP for basic auth).
+
+        o In ticket mode, only a successful login sets a ticket cookie.
+        """
+        if not self.use_tickets:
+            self._setCookie(response,
+                            self.get_cookie_value(login, new_password))
+            return
+
+        user_id = self._authenticateLogin(login, new_password)
+
+        if user_id is None:
+            response.expireCookie(self.cookie_name, path='/')
+        else:
+            self._setTicketCookie(response, user_id, login)
+
     @security.private
     def resetCredentials(self, request, response):
         """ Raise unauthorized to tell browser to clear credentials. """
@@ -291,7 +451,8 @@ class CookieAuthHelper(Folder, BasePlugin):
 
 classImplements(CookieAuthHelper, ICookieAuthHelper,
                 ILoginPasswordHostExtractionPlugin, IChallengePlugin,
-                ICredentialsUpdatePlugin, ICredentialsResetPlugin)
+                ICredentialsUpdatePlugin, ICredentialsResetPlugin,
+                IAuthenticationPlugin)
 
 InitializeClass(CookieAuthHelper)
 
@@ -16,7 +16,11 @@
 
 import re
 import socket
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from AccessControl import ClassSecurityInfo
 from AccessControl.class_init import InitializeClass
@@ -102,6 +106,251 @@ if IP is not None:
 
     _MATCH_TYPE_FILTERS['ip'] = IPFilter
 
+
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def _getFilter(match_info):
+    filter = match_info.get('match_filter')
+
+    if filter is None:  # legacy data
+        filter = _MATCH_TYPE_FILTERS[match_info['match_type']](
+            match_info['match_string'])
+
+    return filter
+
+
+class _MappingMatcher:
+
+    """ Find the mappings of one user matching a host name or address.
+
+    o Equality, prefix and suffix filters are looked up by the candidate
+      and its prefixes or suffixes, IP filters by the candidate's
+      enclosing networks, so a lookup does not visit every mapping.
+
+    o Regular expressions are tested one by one only if their combined
+      alternation matches the candidate.
+    """
+
+    def __init__(self, mappings):
+
+        self._mappings = tuple(mappings)
+        self._equals = {}
+        self._startswith = {}
+        self._endswith = {}
+        self._networks = {}
+        self._regexes = []
+        self._others = []
+        self._regex = None
+
+        for position, match_info in enumerate(self._mappings):
+            filter = _getFilter(match_info)
+
+            if isinstance(filter, EqualsFilter):
+                self._index(self._equals, filter.match_string, position)
+            elif isinstance(filter, StartsWithFilter):
+                self._index(self._startswith, filter.match_string, position)
+            elif isinstance(filter, EndsWithFilter):
+                self._index(self._endswith, filter.match_string, position)
+            elif IP is not None and isinstance(filter, IPFilter):
+                ip = filter.ip
+                key = (ip.version(), ip.prefixlen(),
+                       ip.int() >> (ip.len().bit_length() - 1))
+                self._index(self._networks, key, position)
+            elif (isinstance(filter, RegexFilter)
+                  and not _BACKREFERENCE.search(filter.regex.pattern)):
+                self._regexes.append((position, filter))
+            else:
+                self._others.append((position, filter))
+
+        self._startswith_lengths = sorted({len(x) for x in self._startswith})
+        self._endswith_lengths = sorted({len(x) for x in self._endswith})
+        self._prefixes = sorted({x[:2] for x in self._networks})
+
+        if self._regexes:
+            try:
+                self._regex = re.compile('|'.join([
+                    '(?:%s)' % x.regex.pattern for _, x in self._regexes]))
+            except re.error:  # e.g. conflicting group names or flags
+                self._others.extend(self._regexes)
+                self._regexes = []
+
+    def __bool__(self):
+
+        return bool(self._mappings)
+
+    def __call__(self, candidates):
+        """ Return the matching mappings, in order.
+
+        o Like the filters, a mapping is returned once for each candidate
+          it matches.
+        """
+        counts = {}
+
+        for candidate in candidates:
+            for position in self._match(candidate):
+                counts[position] = counts.get(position, 0) + 1
+
+        return [self._mappings[x]
+                for x in sorted(counts) for i in range(counts[x])]
+
+    def _index(self, index, key, position):
+
+        index.setdefault(key, []).append(position)
+
+    def _match(self, candidate):
+
+        found = set(self._equals.get(candidate, ()))
+
+        for length in self._startswith_lengths:
+            if length > len(candidate):
+                break
+            found.update(self._startswith.get(candidate[:length], ()))
+
+        for length in self._endswith_lengths:
+            if length > len(candidate):
+                break
+            found.update(self._endswith.get(
+                candidate[len(candidate) - length:], ()))
+
+        if self._networks:
+            try:
+                c_ip = IP(candidate)
+            except ValueError:
+                c_ip = None
+
+            if c_ip is not None:
+                bits = c_ip.len().bit_length() - 1 + c_ip.prefixlen()
+                for version, prefixlen in self._prefixes:
+                    if version == c_ip.version() and \
+                       prefixlen <= c_ip.prefixlen():
+                        key = (version, prefixlen,
+                               c_ip.int() >> (bits - prefixlen))
+                        found.update(self._networks.get(key, ()))
+
+        if self._regex is not None and self._regex.match(candidate):
+            found.update([x for x, filter in self._regexes
+                          if filter(candidate)])
+
+        found.update([x for x, filter in self._others if filter(candidate)])
+
+        return found
+
+
+_NO_MAPPINGS = _MappingMatcher(())
+
+
+def _lookupHostName(address):
+    return socket.gethostbyaddr(address)[0]
+
+
+def _lookupHostAddress(host_name):
+    return socket.gethostbyname(host_name)
+
+
+class _CachingResolver:
+
+    """ Resolve host names and addresses, remembering the answers.
+
+    o Answers are kept for the 'ttl' passed by the caller, failed lookups
+      for at most 'negative_ttl' seconds.  At most 'max_entries' answers
+      are kept, the oldest are dropped first.
+
+    o Given a 'timeout', lookups run in a pool of 'max_workers' threads
+      and the caller stops waiting after 'timeout' seconds, getting an
+      empty answer.  A late answer is still cached for the next caller.
+    """
+
+    def __init__(self, lookupHostName=None, lookupHostAddress=None,
+                 max_entries=10000, negative_ttl=60, max_workers=4,
+                 clock=time.monotonic):
+
+        self._lookups = {'name': lookupHostName or _lookupHostName,
+                         'address': lookupHostAddress or _lookupHostAddress}
+        self._max_entries = max_entries
+        self._negative_ttl = negative_ttl
+        self._max_workers = max_workers
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+
+    def getHostName(self, address, timeout=0, ttl=0):
+        """ Return the host name for 'address', or an empty string.
+        """
+        return self._resolve('name', address, timeout, ttl)
+
+    def getHostAddress(self, host_name, timeout=0, ttl=0):
+        """ Return the address of 'host_name', or an empty string.
+        """
+        return self._resolve('address', host_name, timeout, ttl)
+
+    def clear(self):
+
+        with self._lock:
+            self._cache.clear()
+
+    def _resolve(self, kind, key, timeout, ttl):
+
+        with self._lock:
+            entry = self._cache.get((kind, key))
+
+        if entry is not None and entry[0] > self._clock():
+            return entry[1]
+
+        if not timeout:
+            return self._lookup(kind, key, ttl)
+
+        try:
+            return self._submit(kind, key, ttl).result(timeout)
+        except FutureTimeoutError:
+            return ''
+
+    def _lookup(self, kind, key, ttl):
+
+        try:
+            value = self._lookups[kind](key)
+        except OSError:
+            value = ''
+            ttl = min(ttl, self._negative_ttl)
+
+        if ttl > 0:
+            with self._lock:
+                self._cache.pop((kind, key), None)
+                self._cache[(kind, key)] = (self._clock() + ttl, value)
+                while len(self._cache) > self._max_entries:
+                    self._cache.popitem(last=False)
+
+        return value
+
+    def _submit(self, kind, key, ttl):
+
+        with self._lock:
+            future = self._pending.get((kind, key))
+
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        self._max_workers,
+                        thread_name_prefix='DomainAuthHelper-resolver')
+                future = self._executor.submit(self._lookup, kind, key, ttl)
+                self._pending[(kind, key)] = future
+                future.add_done_callback(
+                    lambda done: self._forget(kind, key, done))
+
+        return future
+
+    def _forget(self, kind, key, future):
+
+        with self._lock:
+            if self._pending.get((kind, key)) is future:
+                del self._pending[(kind, key)]
+
+
+_resolver = _CachingResolver()
+
+
 manage_addDomainAuthHelperForm = PageTemplateFile(
     'www/daAdd', globals(), __name__='manage_addDomainAuthHelperForm')
 
@@ -138,6 +387,17 @@ class DomainAuthHelper(BasePlugin):
                           'action': 'manage_genericmap'
                       }) + BasePlugin.manage_options[1:])
 
+    dns_timeout = 0.0
+    dns_cache_ttl = 300
+
+    _properties = BasePlugin._properties + (
+        {'id': 'dns_timeout', 'type': 'float', 'mode': 'w',
+         'label': 'DNS lookup timeout in seconds (0: wait for the answer)'},
+        {'id': 'dns_cache_ttl', 'type': 'int', 'mode': 'w',
+         'label': 'Remember DNS answers for seconds (0: never)'})
+
+    _v_matchers = None
+
     def __init__(self, id, title=''):
         """ Initialize a new instance """
         self.id = id
@@ -209,42 +469,60 @@ class DomainAuthHelper(BasePlugin):
     @security.private
     def _findMatches(self, login, r_host='', r_address=''):
         """ Find the match """
-        matches = []
-
         if not r_host and not r_address:
-            return tuple(matches)
+            return ()
+
+        user_matcher = self._getMatcher(login)
+        generic_matcher = self._getMatcher('')
 
-        all_info = list(self._domain_map.get(login, []))
-        all_info.extend(self._domain_map.get('', []))
+        if not user_matcher and not generic_matcher:
+            return ()
 
         if not r_host:
-            try:
-                r_host = socket.gethostbyaddr(r_address)[0]
-            except OSError:
-                pass
+            r_host = _resolver.getHostName(r_address, self.dns_timeout,
+                                           self.dns_cache_ttl)
 
         if not r_address:
-            try:
-                r_address = socket.gethostbyname(r_host)
-            except OSError:
-                pass
+            r_address = _resolver.getHostAddress(r_host, self.dns_timeout,
+                                                 self.dns_cache_ttl)
 
         if not r_host and not r_address:
-            return tuple(matches)
+            return ()
 
         candidates = [r_host, r_address]
+        matches = user_matcher(candidates)
+        matches.extend(generic_matcher(candidates))
+
+        return tuple(matches)
 
-        for match_info in all_info:
-            m_type = match_info['match_type']
-            m_string = match_info['match_string']
-            filter = match_info.get('match_filter')
+    @security.private
+    def _getMatcher(self, user_id):
+        """ Return the compiled matcher for the mappings of 'user_id'.
+        """
+        if self._v_matchers is None:
+            self._v_matchers = {}
 
-            if filter is None:  # legacy data
-                filter = _MATCH_TYPE_FILTERS[m_type](m_string)
+        matcher = self._v_matchers.get(user_id)
 
-            matches.extend([match_info for x in candidates if filter(x)])
+        if matcher is None:
+            mappings = self._domain_map.get(user_id)
 
-        return tuple(matches)
+            if not mappings:
+                # Don't remember every login tried
+                return _NO_MAPPINGS
+
+            matcher = _MappingMatcher(mappings)
+            self._v_matchers[user_id] = matcher
+
+        return matcher
+
+    @security.private
+    def _invalidateMatchers(self):
+
+        self._v_matchers = None
+        # The mappings live in the map's buckets:  mark ourselves changed,
+        # so that other connections drop their compiled matchers, too.
+        self._p_changed = True
 
     @security.protected(manage_users)
     def listMatchTypes(self):
@@ -314,6 +592,7 @@ class DomainAuthHelper(BasePlugin):
             msg = 'Match already exists'
 
         self._domain_map[user_id] = record
+        self._invalidateMatchers()
 
         if REQUEST is not None:
             msg = msg or 'Match added.'
@@ -347,6 +626,7 @@ class DomainAuthHelper(BasePlugin):
             record.remove(match)
 
         self._domain_map[user_id] = record
+        self._invalidateMatchers()
 
         if REQUEST is not None:
             msg = 'Matches deleted'
@@ -19,6 +19,7 @@ import copy
 from AccessControl import ClassSecurityInfo
 from AccessControl.class_init import InitializeClass
 from AccessControl.requestmethod import postonly
+from Acquisition import aq_base
 from Acquisition import aq_inner
 from Acquisition import aq_parent
 from OFS.Cache import Cacheable
@@ -68,15 +69,20 @@ class DynamicGroupDefinition(SimpleItem, PropertyManager):
     security = ClassSecurityInfo()
     security.declareObjectProtected(ManageGroups)
 
+    request_only = False
+
     _v_compiled = None
+    _v_evaluation_info = None
 
     _properties = ({'id': 'id', 'type': 'string', 'mode': ''},
                    {'id': 'predicate', 'type': 'string', 'mode': 'w'},
                    {'id': 'title', 'type': 'string', 'mode': 'w'},
                    {'id': 'description', 'type': 'text', 'mode': 'w'},
-                   {'id': 'active', 'type': 'boolean', 'mode': 'w'})
+                   {'id': 'active', 'type': 'boolean', 'mode': 'w'},
+                   {'id': 'request_only', 'type': 'boolean', 'mode': 'w'})
 
-    def __init__(self, id, predicate, title, description, active):
+    def __init__(self, id, predicate, title, description, active,
+                 request_only=False):
 
         self._setId(id)
         self._setPredicate(predicate)
@@ -84,22 +90,22 @@ class DynamicGroupDefinition(SimpleItem, PropertyManager):
         self.title = title
         self.description = description
         self.active = bool(active)
+        self.request_only = bool(request_only)
 
     def __call__(self, principal, request=None):
         """ Evaluate our expression to determine whether 'principal' belongs.
         """
-        predicate = self._getPredicate()
         plugin = aq_parent(aq_inner(self))
-        properties = {}
+        data = _getPredicateContext(principal, request, plugin)
 
-        for k, v in self.propertyItems():
-            properties[k] = v
+        return self._evaluate(data)
 
-        data = getEngine().getContext({'request': request,
-                                       'nothing': None,
-                                       'principal': principal,
-                                       'group': properties,
-                                       'plugin': plugin})
+    @security.private
+    def _evaluate(self, data):
+        """ Evaluate our expression in the (possibly shared) context 'data'.
+        """
+        predicate, properties = self._getEvaluationInfo()
+        data.setLocal('group', properties)
 
         result = predicate(data)
 
@@ -108,6 +114,27 @@ class DynamicGroupDefinition(SimpleItem, PropertyManager):
 
         return result
 
+    @security.private
+    def _getEvaluationInfo(self):
+        """ Return '(predicate, properties)'.
+
+        o 'predicate' is our compiled expression, 'properties' a mapping
+          of our properties.
+        """
+        info = self._v_evaluation_info
+
+        if info is None:
+            info = (self._getPredicate(), dict(self.propertyItems()))
+            self._v_evaluation_info = info
+
+        return info
+
+    @security.private
+    def _invalidateEvaluationInfo(self):
+
+        if self._v_evaluation_info is not None:
+            del self._v_evaluation_info
+
     @security.private
     def _setPredicate(self, predicate):
 
@@ -116,6 +143,8 @@ class DynamicGroupDefinition(SimpleItem, PropertyManager):
         if self._v_compiled is not None:
             del self._v_compiled
 
+        self._invalidateEvaluationInfo()
+
     @security.private
     def _getPredicate(self):
 
@@ -133,6 +162,18 @@ class DynamicGroupDefinition(SimpleItem, PropertyManager):
         else:
             PropertyManager._updateProperty(self, id, value)
 
+    @security.private
+    def _setPropValue(self, id, value):
+
+        PropertyManager._setPropValue(self, id, value)
+        self._invalidateEvaluationInfo()
+
+    @security.private
+    def _delProperty(self, id):
+
+        PropertyManager._delProperty(self, id)
+        self._invalidateEvaluationInfo()
+
     #
     #   ZMI
     #
@@ -158,12 +199,17 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
       'principal' -- the principal being tested.
 
       'request' -- the request object.
+
+    o Predicates of groups marked as 'request_only' must not depend on
+      the principal;  they are evaluated once per request.
     """
     meta_type = 'Dynamic Groups Plugin'
     zmi_icon = 'fas fa-users'
 
     security = ClassSecurityInfo()
 
+    _v_definitions = None
+
     def __init__(self, id, title=''):
 
         self._setId(id)
@@ -177,10 +223,28 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
         """ See IGroupsPlugin.
         """
         grps = []
-        DGD = DynamicGroupDefinition.meta_type
-        for group in self.objectValues(DGD):
-            if group.active and group(principal, request):
-                grps.append(f'{self.prefix}{group.getId()}')
+        data = None
+        memo = self._getRequestMemo(request)
+
+        for group in self._getDefinitions():
+            predicate, properties = group._getEvaluationInfo()
+
+            if not properties['active']:
+                continue
+
+            group_id = group.getId()
+            info, result = memo.get(group_id, (None, None))
+
+            if info is not properties:
+                if data is None:
+                    data = _getPredicateContext(principal, request, self)
+                result = group._evaluate(data)
+                if properties['request_only']:
+                    memo[group_id] = (properties, result)
+
+            if result:
+                grps.append(f'{self.prefix}{group_id}')
+
         return grps
 
     @security.protected(ManageGroups)
@@ -241,6 +305,50 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
 
         return tuple(group_info)
 
+    @security.private
+    def _getDefinitions(self):
+        """ Return our group definitions, in order, without wrappers.
+
+        o The list is kept until our '_p_mtime' changes or a definition
+          is added or removed.
+        """
+        cached = self._v_definitions
+
+        if cached is None or cached[0] != self._p_mtime:
+            DGD = DynamicGroupDefinition.meta_type
+            definitions = tuple([aq_base(x) for x in self.objectValues(DGD)])
+            cached = self._v_definitions = (self._p_mtime, definitions)
+
+        return cached[1]
+
+    @security.private
+    def _getRequestMemo(self, request):
+        """ Return the mapping of request-only predicate results.
+
+        o The mapping lives as long as 'request';  requests which cannot
+          hold it get a fresh one.
+        """
+        other = getattr(request, 'other', None)
+
+        if not isinstance(other, dict):
+            return {}
+
+        key = '_dgp_memo:%s' % '/'.join(self.getPhysicalPath())
+
+        return other.setdefault(key, {})
+
+    @security.private
+    def _setOb(self, id, object):
+
+        Folder._setOb(self, id, object)
+        self._v_definitions = None
+
+    @security.private
+    def _delOb(self, id):
+
+        Folder._delOb(self, id)
+        self._v_definitions = None
+
     #
     #   Housekeeping
     #
@@ -265,6 +373,9 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
           'predicate' -- the TALES expression defining group membership
 
           'active' -- boolean flag:  is the group currently active?
+
+          'request_only' -- boolean flag:  is the predicate independent
+          of the principal?
         """
         try:
             original = self._getOb(group_id)
@@ -301,12 +412,15 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
           'predicate' -- the TALES expression defining group membership
 
           'active' -- boolean flag:  is the group currently active?
+
+          'request_only' -- boolean flag:  is the predicate independent
+          of the principal?
         """
         return [self.getGroupInfo(x) for x in self.listGroupIds()]
 
     @security.private
     def addGroup(self, group_id, predicate, title='', description='',
-                 active=True):
+                 active=True, request_only=False):
         """ Add a group definition.
 
         o Raise KeyError if we have an existing group definition
@@ -316,7 +430,7 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
             raise KeyError('Duplicate group ID: %s' % group_id)
 
         info = DynamicGroupDefinition(group_id, predicate, title,
-                                      description, active)
+                                      description, active, request_only)
 
         self._setObject(group_id, info)
 
@@ -328,13 +442,14 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
 
     @security.private
     def updateGroup(self, group_id, predicate, title=None, description=None,
-                    active=None):
+                    active=None, request_only=None):
         """ Update a group definition.
 
         o Raise KeyError if we don't have an existing group definition
           for 'group_id'.
 
-        o Don't update 'title', 'description', or 'active' unless supplied.
+        o Don't update 'title', 'description', 'active' or 'request_only'
+          unless supplied.
         """
         if group_id not in self.listGroupIds():
             raise KeyError('Invalid group ID: %s' % group_id)
@@ -352,6 +467,11 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
         if active is not None:
             group.active = active
 
+        if request_only is not None:
+            group.request_only = bool(request_only)
+
+        group._invalidateEvaluationInfo()
+
         # This method changes the enumerateGroups return value
         view_name = createViewName('enumerateGroups')
         self.ZCacheable_invalidate(view_name=view_name)
@@ -392,10 +512,12 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
     @csrf_only
     @postonly
     def manage_addGroup(self, group_id, title, description, predicate,
-                        active=True, RESPONSE=None, REQUEST=None):
+                        active=True, request_only=False,
+                        RESPONSE=None, REQUEST=None):
         """ Add a group via the ZMI.
         """
-        self.addGroup(group_id, predicate, title, description, active)
+        self.addGroup(group_id, predicate, title, description, active,
+                      request_only)
 
         message = 'Group+%s+added' % group_id
 
@@ -408,10 +530,11 @@ class DynamicGroupsPlugin(Folder, BasePlugin, Cacheable):
     @postonly
     def manage_updateGroup(self, group_id, predicate, title=None,
                            description=None, active=True,
-                           RESPONSE=None, REQUEST=None):
+                           request_only=False, RESPONSE=None, REQUEST=None):
         """ Update a group via the ZMI.
         """
-        self.updateGroup(group_id, predicate, title, description, active)
+        self.updateGroup(group_id, predicate, title, description, active,
+                         request_only)
 
         message = 'Group+%s+updated' % group_id
 
@@ -450,6 +573,15 @@ classImplements(DynamicGroupsPlugin, IDynamicGroupsPlugin, IGroupsPlugin,
 InitializeClass(DynamicGroupsPlugin)
 
 
+def _getPredicateContext(principal, request, plugin):
+
+    return getEngine().getContext({'request': request,
+                                   'nothing': None,
+                                   'principal': principal,
+                                   'group': None,
+                                   'plugin': plugin})
+
+
 class _DynamicGroupFilter:
 
     def __init__(self, id=None, **kw):
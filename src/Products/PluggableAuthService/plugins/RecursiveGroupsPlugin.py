@@ -13,16 +13,26 @@
 ##############################################################################
 """ Classes: RecursiveGroupsPlugin
 """
+from collections import deque
 
 from AccessControl import ClassSecurityInfo
 from AccessControl.class_init import InitializeClass
+from Acquisition import aq_base
 from Acquisition import aq_parent
+from OFS.Cache import Cacheable
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
+from zope.component import adapter
 from zope.interface import Interface
 
+from ..interfaces.events import IPrincipalAddedToGroupEvent
+from ..interfaces.events import IPrincipalRemovedFromGroupEvent
 from ..interfaces.plugins import IGroupsPlugin
+from ..PrincipalCache import getPrincipalCache
+from ..PrincipalCache import invalidatePrincipalCaches
+from ..PrincipalCache import principalTag
 from ..PropertiedUser import PropertiedUser
 from ..utils import classImplements
+from ..utils import createViewName
 from .BasePlugin import BasePlugin
 
 
@@ -63,7 +73,7 @@ class SimpleGroup:
         pass
 
 
-class RecursiveGroupsPlugin(BasePlugin):
+class RecursiveGroupsPlugin(BasePlugin, Cacheable):
 
     """ PAS plugin for recursively flattening a collection of groups
     """
@@ -72,6 +82,19 @@ class RecursiveGroupsPlugin(BasePlugin):
 
     security = ClassSecurityInfo()
 
+    # Size and lifetime of the cache of group ancestors (0: disabled),
+    # see '_getAncestorsCache'.
+    ancestors_cache_size = 0
+    ancestors_cache_ttl = 60
+
+    _properties = BasePlugin._properties + (
+        dict(id='ancestors_cache_size', type='int', mode='w',
+             label='Group ancestors cache entries (0: only use the '
+                   'cache manager)'),
+        dict(id='ancestors_cache_ttl', type='int', mode='w',
+             label='Group ancestors cache lifetime in seconds'),
+    )
+
     def __init__(self, id, title=None):
 
         self._id = self.id = id
@@ -83,25 +106,156 @@ class RecursiveGroupsPlugin(BasePlugin):
     @security.private
     def getGroupsForPrincipal(self, user, request=None):
 
-        set = list(user.getGroups())
-        seen = []
-        parent = aq_parent(self)
+        seen = dict.fromkeys(user.getGroups())   # insertion ordered
+
+        for group_id in tuple(seen):
+            seen.update(dict.fromkeys(self._getAncestors(group_id)))
+
+        return tuple(seen)
+
+    @security.private
+    def _getAncestors(self, group_id):
+        """ group_id -> ids of all groups 'group_id' (indirectly) belongs to.
+
+        o The result is shared by all principals belonging to the group,
+          and cached until the memberships of the group or of one of its
+          ancestors change.
+        """
+        cache = self._getAncestorsCache()
+        ancestors = None if cache is None else cache.get(group_id)
+
+        if ancestors is not None:
+            return ancestors
+
+        if cache is None:
+            getParentGroups = self._getParentGroups
+        else:
+            getParentGroups = self._listParentGroups
+
+        pending = deque(getParentGroups(group_id))
+        seen = {group_id: True}   # insertion ordered
 
-        while set:
-            test = set.pop(0)
+        while pending:
+            test = pending.popleft()
             if test in seen:
                 continue
-            seen.append(test)
-            new_groups = parent._getGroupsForPrincipal(
-                PropertiedUser(test).__of__(parent),
-                ignore_plugins=(self.getId(),))
-            if new_groups:
-                set.extend(new_groups)
+            seen[test] = True
+            known = None if cache is None else cache.get(test)
+            if known is None:
+                pending.extend(getParentGroups(test))
+            else:
+                # The ancestors of 'test' are complete already
+                seen.update(dict.fromkeys(known))
 
-        return tuple(seen)
+        ancestors = tuple(x for x in seen if x != group_id)
+
+        if cache is not None:
+            cache.set(group_id, ancestors,
+                      tags=[principalTag(x) for x in (group_id,) + ancestors])
+
+        return ancestors
+
+    @security.private
+    def _getAncestorsCache(self):
+        """ Return the IPrincipalCache of group ancestors, or None.
+
+        o The cache is shared by all threads, and by all plugins of our
+          user folder in other ZODB connections.  Membership changes
+          made in other processes, or by group plugins which neither
+          invalidate the principal nor notify membership events, show
+          after 'ancestors_cache_ttl' seconds.
+
+        o With 'ancestors_cache_size' at 0 (the default), only the direct
+          parents of each group are cached, by our cache manager (if any).
+        """
+        key = self._getAncestorsCacheKey()
+
+        if key is None:
+            return None
+
+        return getPrincipalCache(key, self.ancestors_cache_size,
+                                 self.ancestors_cache_ttl)
+
+    @security.private
+    def _getAncestorsCacheKey(self):
+
+        if self.ancestors_cache_size <= 0:
+            return None
+
+        pas = self._getPAS()
+        if getattr(aq_base(pas), '_getPrincipalCacheKey', None) is None:
+            return None
+
+        # Our user folder drops the entries tagged with the principals
+        # it invalidates, see 'PluggableAuthService._invalidatePrincipal'.
+        return pas._getPrincipalCacheKey() + ('ancestors', self.getId())
+
+    @security.private
+    def _getParentGroups(self, group_id):
+        """ group_id -> ids of the groups 'group_id' directly belongs to.
+
+        o The result is cached by our cache manager until the group's
+          memberships change.
+        """
+        view_name = createViewName('_getParentGroups', group_id)
+        parent_groups = self.ZCacheable_get(view_name=view_name, default=None)
+
+        if parent_groups is None:
+            parent_groups = self._listParentGroups(group_id)
+            self.ZCacheable_set(parent_groups, view_name=view_name)
+
+        return parent_groups
+
+    @security.private
+    def _listParentGroups(self, group_id):
+        """ group_id -> ids of the groups 'group_id' directly belongs to.
+        """
+        parent = aq_parent(self)
+
+        return tuple(parent._getGroupsForPrincipal(
+            PropertiedUser(group_id).__of__(parent),
+            ignore_plugins=(self.getId(),)))
+
+    @security.private
+    def _invalidateParentGroups(self, group_id):
+        # Also drop the ancestors of the groups descending from 'group_id'
+        key = self._getAncestorsCacheKey()
+
+        if key is None:
+            view_name = createViewName('_getParentGroups', group_id)
+            self.ZCacheable_invalidate(view_name=view_name)
+        else:
+            invalidatePrincipalCaches(key, [principalTag(group_id)])
+
+    manage_options = BasePlugin.manage_options + Cacheable.manage_options
 
 
 classImplements(RecursiveGroupsPlugin, IRecursiveGroupsPlugin, IGroupsPlugin)
 
 
 InitializeClass(RecursiveGroupsPlugin)
+
+
+@adapter(IPrincipalAddedToGroupEvent)
+def principalAddedToGroupHandler(event):
+    _invalidateRecursiveGroups(event)
+
+
+@adapter(IPrincipalRemovedFromGroupEvent)
+def principalRemovedFromGroupHandler(event):
+    _invalidateRecursiveGroups(event)
+
+
+def _invalidateRecursiveGroups(event):
+    # Drop the cached parent groups of the principal in the recursive
+    # groups plugins next to the plugin which changed the membership.
+    plugin = getattr(event, 'plugin', None)
+    if plugin is None:
+        return
+
+    pas = plugin._getPAS()
+    if pas is None:
+        return
+
+    for rgp in pas.objectValues(RecursiveGroupsPlugin.meta_type):
+        rgp._invalidateParentGroups(event.principal)
@@ -20,6 +20,7 @@ from OFS.PropertyManager import PropertyManager
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from zope.interface import Interface
 
+from ..interfaces.plugins import IAuthenticationPlugin
 from ..interfaces.plugins import ICredentialsResetPlugin
 from ..interfaces.plugins import ICredentialsUpdatePlugin
 from ..interfaces.plugins import ILoginPasswordHostExtractionPlugin
@@ -48,19 +49,31 @@ def manage_addSessionAuthHelper(dispatcher, id, title=None, REQUEST=None):
                                      dispatcher.absolute_url())
 
 
+def _setIfChanged(session, key, value):
+    # Unchanged values are not written, sparing the session data
+    # container a write and its conflicts.
+    if session.get(key, '') != value:
+        session.set(key, value)
+
+
 class SessionAuthHelper(BasePlugin):
     """ Multi-plugin for managing details of Session Authentication. """
     meta_type = 'Session Auth Helper'
     zmi_icon = 'fas fa-fingerprint'
     security = ClassSecurityInfo()
     clear_session_on_login = False
+    use_tickets = False
 
     _properties = (
         PropertyManager._properties +
         ({'id': 'clear_session_on_login',
           'label': 'Clear session data at login boundary',
           'type': 'boolean',
-          'mode': 'rw'},)
+          'mode': 'rw'},
+         {'id': 'use_tickets',
+          'label': 'Store the authenticated user id instead of the password',
+          'type': 'boolean',
+          'mode': 'rw'})
     )
 
     def __init__(self, id, title=None):
@@ -74,12 +87,17 @@ class SessionAuthHelper(BasePlugin):
 
         # Looking into the session first...
         name = request.SESSION.get('__ac_name', '')
-        password = request.SESSION.get('__ac_password', '')
 
-        if name:
+        if name and self.use_tickets:
+            user_id = request.SESSION.get('__ac_user_id', '')
+            if user_id and self._checkRevision(request.SESSION, user_id):
+                creds['login'] = name
+                creds['session_user_id'] = user_id
+        elif name:
             creds['login'] = name
-            creds['password'] = password
-        else:
+            creds['password'] = request.SESSION.get('__ac_password', '')
+
+        if not creds:
             # Look into the request now
             login_pw = request._authUserPW()
 
@@ -92,6 +110,12 @@ class SessionAuthHelper(BasePlugin):
                 self.updateCredentials(
                     request, request.RESPONSE, name, password)
 
+                # Once authenticated, they need not be checked again
+                user_id = request.SESSION.get('__ac_user_id', '')
+                if self.use_tickets and user_id:
+                    del creds['password']
+                    creds['session_user_id'] = user_id
+
         if creds:
             creds['remote_host'] = request.get('REMOTE_HOST', '')
 
@@ -102,25 +126,76 @@ class SessionAuthHelper(BasePlugin):
 
         return creds
 
+    @security.private
+    def _checkRevision(self, session, user_id):
+        """ Is the user id stored in 'session' still good?
+
+        o It is dropped from the session once its user is removed or the
+          user's credentials revision changes, e.g. with its password.
+        """
+        revision = self._getCredentialsRevision(user_id)
+
+        if revision is not None and \
+                revision == session.get('__ac_revision', ''):
+            return True
+
+        _setIfChanged(session, '__ac_user_id', '')
+        _setIfChanged(session, '__ac_revision', '')
+        return False
+
+    @security.private
+    def authenticateCredentials(self, credentials):
+        """ See IAuthenticationPlugin.
+
+        o Only accept the user ids we stored in the session.
+        """
+        if credentials.get('extractor') != self.getId():
+            return None
+
+        user_id = credentials.get('session_user_id')
+
+        if user_id is None:
+            return None
+
+        return user_id, credentials.get('login')
+
     @security.private
     def updateCredentials(self, request, response, login, new_password):
-        """ Respond to change of credentials. """
-        if request.SESSION.get('__ac_name') != login:
+        """ Respond to change of credentials.
+
+        o In ticket mode, the password is only checked here, and the
+          session only keeps the user id it belongs to.
+        """
+        session = request.SESSION
+
+        if session.get('__ac_name') != login:
             # This is a new session
             if self.clear_session_on_login:
-                request.SESSION.clear()
-            request.SESSION.set('__ac_name', login)
-        request.SESSION.set('__ac_password', new_password)
+                session.clear()
+            session.set('__ac_name', login)
+
+        if not self.use_tickets:
+            _setIfChanged(session, '__ac_password', new_password)
+            return
+
+        user_id = self._authenticateLogin(login, new_password)
+        revision = user_id and self._getCredentialsRevision(user_id)
+        _setIfChanged(session, '__ac_user_id', user_id or '')
+        _setIfChanged(session, '__ac_revision', revision or '')
+        _setIfChanged(session, '__ac_password', '')
 
     @security.private
     def resetCredentials(self, request, response):
         """ Empty out the currently-stored session values """
-        request.SESSION.set('__ac_name', '')
-        request.SESSION.set('__ac_password', '')
+        session = request.SESSION
+
+        for key in ('__ac_name', '__ac_password', '__ac_user_id',
+                    '__ac_revision'):
+            _setIfChanged(session, key, '')
 
 
 classImplements(SessionAuthHelper, ISessionAuthHelper,
                 ILoginPasswordHostExtractionPlugin, ICredentialsUpdatePlugin,
-                ICredentialsResetPlugin)
+                ICredentialsResetPlugin, IAuthenticationPlugin)
 
 InitializeClass(SessionAuthHelper)
@@ -20,6 +20,7 @@ from AccessControl.class_init import InitializeClass
 from AccessControl.requestmethod import postonly
 from Acquisition import aq_parent
 from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from zope.event import notify
 from zope.interface import Interface
@@ -66,12 +67,22 @@ class ZODBGroupManager(BasePlugin):
 
     security = ClassSecurityInfo()
 
+    # enumerateGroups honors 'sort_by' and 'max_results', see
+    # PluggableAuthService._mergeEnumerations.
+    sorted_enumeration = True
+
+    # Reverse index of '_principal_groups', see '_listGroupMembers'.
+    # Instances created before it existed get it on their next change of
+    # group memberships.
+    _group_principals = None
+
     def __init__(self, id, title=None):
 
         self._id = self.id = id
         self.title = title
         self._groups = OOBTree()
         self._principal_groups = OOBTree()
+        self._group_principals = OOBTree()
 
     #
     #   IGroupEnumerationPlugin implementation
@@ -124,6 +135,12 @@ class ZODBGroupManager(BasePlugin):
                 if not group_filter or group_filter(info):
                     group_info.append(info)
 
+        if sort_by:
+            group_info.sort(key=lambda x: x.get(sort_by, '').lower())
+
+        if max_results:
+            group_info = group_info[:int(max_results)]
+
         return tuple(group_info)
 
     #
@@ -193,7 +210,7 @@ class ZODBGroupManager(BasePlugin):
 
         o Raise KeyError if 'group_id' doesn't already exist.
         """
-        for principal_id in self._principal_groups.keys():
+        for principal_id in self._listGroupMembers(group_id):
             self.removePrincipalFromGroup(principal_id, group_id)
         del self._groups[group_id]
 
@@ -232,16 +249,17 @@ class ZODBGroupManager(BasePlugin):
         """
         result = []
 
-        for k, v in self._principal_groups.items():
-            if group_id in v:
-                parent = aq_parent(self)
-                info = parent.searchPrincipals(id=k, exact_match=True)
-                if len(info) == 0:
-                    title = '<%s: not found>' % k
-                else:
-                    # always use the title of the first principal found
-                    title = info[0].get('title', k)
-                result.append((k, title))
+        principal_ids = self._listGroupMembers(group_id)
+        principal_infos = self._getPrincipalInfos(principal_ids)
+
+        for k in principal_ids:
+            info = principal_infos[k]
+            if len(info) == 0:
+                title = '<%s: not found>' % k
+            else:
+                # always use the title of the first principal found
+                title = info[0].get('title', k)
+            result.append((k, title))
 
         return result
 
@@ -262,8 +280,9 @@ class ZODBGroupManager(BasePlugin):
         if not already:
             new = current + (group_id,)
             self._principal_groups[principal_id] = new
+            self._indexMembership(principal_id, group_id)
             self._invalidatePrincipalCache(principal_id)
-            notify(PrincipalAddedToGroup(principal_id, group_id))
+            notify(PrincipalAddedToGroup(principal_id, group_id, self))
 
         return not already
 
@@ -288,11 +307,53 @@ class ZODBGroupManager(BasePlugin):
 
         if already:
             self._principal_groups[principal_id] = new
+            self._unindexMembership(principal_id, group_id)
             self._invalidatePrincipalCache(principal_id)
-            notify(PrincipalRemovedFromGroup(principal_id, group_id))
+            notify(PrincipalRemovedFromGroup(principal_id, group_id, self))
 
         return already
 
+    @security.private
+    def _listGroupMembers(self, group_id):
+        """ group_id -> sorted ids of the principals belonging to the group.
+        """
+        if self._group_principals is None:
+            return [k for k, v in self._principal_groups.items()
+                    if group_id in v]
+
+        return list(self._group_principals.get(group_id, ()))
+
+    @security.private
+    def _rebuildGroupPrincipals(self):
+        """ Rebuild the reverse index of '_principal_groups'.
+        """
+        self._group_principals = OOBTree()
+
+        for principal_id, group_ids in self._principal_groups.items():
+            for group_id in group_ids:
+                self._indexMembership(principal_id, group_id)
+
+    @security.private
+    def _indexMembership(self, principal_id, group_id):
+        if self._group_principals is None:
+            self._rebuildGroupPrincipals()
+
+        principal_ids = self._group_principals.get(group_id)
+        if principal_ids is None:
+            principal_ids = self._group_principals[group_id] = OOTreeSet()
+        principal_ids.insert(principal_id)
+
+    @security.private
+    def _unindexMembership(self, principal_id, group_id):
+        if self._group_principals is None:
+            self._rebuildGroupPrincipals()
+
+        principal_ids = self._group_principals.get(group_id)
+        if principal_ids is not None and principal_id in principal_ids:
+            principal_ids.remove(principal_id)
+            if not principal_ids:
+                del self._group_principals[group_id]
+
     #
     #   ZMI
     #
@@ -22,6 +22,7 @@ from AccessControl.requestmethod import postonly
 from Acquisition import aq_inner
 from Acquisition import aq_parent
 from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
 from zope.interface import Interface
 
@@ -72,6 +73,11 @@ class ZODBRoleManager(BasePlugin):
 
     security = ClassSecurityInfo()
 
+    # Reverse index of '_principal_roles', see '_listPrincipalsWithRole'.
+    # Instances created before it existed get it on their next change of
+    # role assignments.
+    _role_principals = None
+
     def __init__(self, id, title=None):
 
         self._id = self.id = id
@@ -79,6 +85,7 @@ class ZODBRoleManager(BasePlugin):
 
         self._roles = OOBTree()
         self._principal_roles = OOBTree()
+        self._role_principals = OOBTree()
 
     def manage_afterAdd(self, item, container):
 
@@ -216,7 +223,7 @@ class ZODBRoleManager(BasePlugin):
         remove it from the roles in the root of the site (at the
         bottom of the Security tab at manage_access).
         """
-        for principal_id in self._principal_roles.keys():
+        for principal_id in list(self._listPrincipalsWithRole(role_id)):
             self.removeRoleFromPrincipal(role_id, principal_id)
 
         del self._roles[role_id]
@@ -257,25 +264,25 @@ class ZODBRoleManager(BasePlugin):
         """
         result = []
 
-        for k, v in self._principal_roles.items():
-            if role_id in v:
-                # should be at most one and only one mapping to 'k'
+        principal_ids = self._listPrincipalsWithRole(role_id)
+        principal_infos = self._getPrincipalInfos(principal_ids)
 
-                parent = aq_parent(self)
-                info = parent.searchPrincipals(id=k, exact_match=True)
+        for k in principal_ids:
+            # should be at most one and only one mapping to 'k'
+            info = principal_infos[k]
 
-                if len(info) > 1:
-                    message = ('Multiple groups or users exist with the '
-                               'name "%s". Remove one of the duplicate groups '
-                               'or users.' % (k))
-                    LOG.error(message)
-                    raise MultiplePrincipalError(message)
+            if len(info) > 1:
+                message = ('Multiple groups or users exist with the '
+                           'name "%s". Remove one of the duplicate groups '
+                           'or users.' % (k))
+                LOG.error(message)
+                raise MultiplePrincipalError(message)
 
-                if len(info) == 0:
-                    title = '<%s: not found>' % k
-                else:
-                    title = info[0].get('title', k)
-                result.append((k, title))
+            if len(info) == 0:
+                title = '<%s: not found>' % k
+            else:
+                title = info[0].get('title', k)
+            result.append((k, title))
 
         return result
 
@@ -296,6 +303,7 @@ class ZODBRoleManager(BasePlugin):
         if not already:
             new = current + (role_id,)
             self._principal_roles[principal_id] = new
+            self._indexRoleAssignment(role_id, principal_id)
             self._invalidatePrincipalCache(principal_id)
 
         return not already
@@ -320,10 +328,52 @@ class ZODBRoleManager(BasePlugin):
 
         if already:
             self._principal_roles[principal_id] = new
+            self._unindexRoleAssignment(role_id, principal_id)
             self._invalidatePrincipalCache(principal_id)
 
         return already
 
+    @security.private
+    def _listPrincipalsWithRole(self, role_id):
+        """ role_id -> sorted principal ids to whom the role is assigned.
+        """
+        if self._role_principals is None:
+            return [k for k, v in self._principal_roles.items()
+                    if role_id in v]
+
+        return list(self._role_principals.get(role_id, ()))
+
+    @security.private
+    def _rebuildRolePrincipals(self):
+        """ Rebuild the reverse index of '_principal_roles'.
+        """
+        self._role_principals = OOBTree()
+
+        for principal_id, role_ids in self._principal_roles.items():
+            for role_id in role_ids:
+                self._indexRoleAssignment(role_id, principal_id)
+
+    @security.private
+    def _indexRoleAssignment(self, role_id, principal_id):
+        if self._role_principals is None:
+            self._rebuildRolePrincipals()
+
+        principal_ids = self._role_principals.get(role_id)
+        if principal_ids is None:
+            principal_ids = self._role_principals[role_id] = OOTreeSet()
+        principal_ids.insert(principal_id)
+
+    @security.private
+    def _unindexRoleAssignment(self, role_id, principal_id):
+        if self._role_principals is None:
+            self._rebuildRolePrincipals()
+
+        principal_ids = self._role_principals.get(role_id)
+        if principal_ids is not None and principal_id in principal_ids:
+            principal_ids.remove(principal_id)
+            if not principal_ids:
+                del self._role_principals[role_id]
+
     #
     #   ZMI
     #
@@ -14,25 +14,43 @@
 """ Classes: ZODBUserManager
 """
 import copy
+import hmac
 import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from hashlib import sha1
+from hashlib import sha256
+from itertools import islice
 
+import transaction
 from AccessControl import ClassSecurityInfo
 from AccessControl.class_init import InitializeClass
 from AccessControl.requestmethod import postonly
 from AccessControl.SecurityManagement import getSecurityManager
+from Acquisition import aq_base
 from AuthEncoding import AuthEncoding
 from BTrees.OOBTree import OOBTree
+from BTrees.OOBTree import OOTreeSet
+from BTrees.OOBTree import intersection
+from BTrees.OOBTree import union
 from OFS.Cache import Cacheable
+from persistent import Persistent
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
+from zope.event import notify
 from zope.interface import Interface
 
+from ..events import PrincipalCreated
 from ..interfaces.plugins import IAuthenticationPlugin
 from ..interfaces.plugins import IUserAdderPlugin
 from ..interfaces.plugins import IUserEnumerationPlugin
 from ..permissions import ManageUsers
 from ..permissions import SetOwnPassword
 from ..plugins.BasePlugin import BasePlugin
+from ..PropertiedUser import PropertiedUser
 from ..utils import classImplements
 from ..utils import createViewName
 from ..utils import csrf_only
@@ -40,6 +58,10 @@ from ..utils import csrf_only
 
 logger = logging.getLogger('PluggableAuthService')
 
+# addUsers hashes smaller chunks of passwords in-process:  starting worker
+# processes costs more than it saves.
+POOL_MIN_PASSWORDS = 256
+
 
 class IZODBUserManager(Interface):
     """ Marker interface.
@@ -73,6 +95,22 @@ class ZODBUserManager(BasePlugin, Cacheable):
 
     security = ClassSecurityInfo()
 
+    # enumerateUsers honors 'sort_by' and 'max_results', see
+    # PluggableAuthService._mergeEnumerations.
+    sorted_enumeration = True
+
+    # Trigram indexes used for substring searches, see '_searchUserIds'.
+    # Instances created before they existed get them on their next change.
+    _id_index = None
+    _login_index = None
+
+    # Seconds to remember successfully verified credentials, 0 disables.
+    verified_credentials_ttl = 0
+
+    _properties = BasePlugin._properties + (
+        {'id': 'verified_credentials_ttl', 'type': 'int', 'mode': 'w',
+         'label': 'Remember verified passwords for seconds (0: never)'},)
+
     def __init__(self, id, title=None):
 
         self._id = self.id = id
@@ -82,6 +120,9 @@ class ZODBUserManager(BasePlugin, Cacheable):
         self._login_to_userid = OOBTree()
         self._userid_to_login = OOBTree()
 
+        self._id_index = _TrigramIndex()
+        self._login_index = _TrigramIndex()
+
     #
     #   IAuthenticationPlugin implementation
     #
@@ -119,19 +160,33 @@ class ZODBUserManager(BasePlugin, Cacheable):
         if reference is None:
             return None
 
+        ttl = self.verified_credentials_ttl
+        key = (userid, login, password, reference)
+
+        if ttl > 0 and _verified_credentials.get(*key):
+            return userid, login
+
+        if self._verifyPassword(reference, password):
+            if ttl > 0:
+                _verified_credentials.set(ttl, *key)
+            return userid, login
+
+        return None
+
+    @security.private
+    def _verifyPassword(self, reference, password):
+        """ Does 'password' match the stored 'reference'?
+        """
         if AuthEncoding.is_encrypted(reference):
             if AuthEncoding.pw_validate(reference, password):
-                return userid, login
+                return True
 
         # Support previous naive behavior
         if isinstance(password, str):
             password = password.encode('utf8')
         digested = sha1(password).hexdigest()
 
-        if reference == digested:
-            return userid, login
-
-        return None
+        return reference == digested
 
     #
     #   IUserEnumerationPlugin implementation
@@ -190,7 +245,7 @@ class ZODBUserManager(BasePlugin, Cacheable):
             user_filter = None
 
         else:   # Searching
-            user_ids = self.listUserIds()
+            user_ids = self._searchUserIds(id, login, **kw)
             user_filter = _ZODBUserFilter(id, login, **kw)
 
         for user_id in user_ids:
@@ -207,6 +262,12 @@ class ZODBUserManager(BasePlugin, Cacheable):
                 if not user_filter or user_filter(info):
                     user_info.append(info)
 
+        if sort_by:
+            user_info.sort(key=lambda x: x.get(sort_by, '').lower())
+
+        if max_results:
+            user_info = user_info[:int(max_results)]
+
         # Put the computed value into the cache
         self.ZCacheable_set(user_info, view_name=view_name, keywords=keywords)
 
@@ -232,6 +293,70 @@ class ZODBUserManager(BasePlugin, Cacheable):
         """
         return self._user_passwords.keys()
 
+    @security.private
+    def _searchUserIds(self, id=None, login=None, **kw):
+        """ -> candidate user ids for a non-exact search.
+
+        o Use the trigram indexes to narrow the search down to the users
+          whose id or login may contain one of the search terms.  The
+          candidates still need to go through '_ZODBUserFilter'.
+
+        o Fall back to all user ids when the indexes cannot help.
+        """
+        if id:
+            # The filter matches against the prefixed id, which the index
+            # does not know about.
+            if self.prefix:
+                return self.listUserIds()
+            index, terms = self._id_index, id
+        elif login:
+            index, terms = self._login_index, login
+        elif kw:
+            return ()   # _ZODBUserFilter rejects everybody
+        else:
+            return self.listUserIds()
+
+        if index is None:
+            return self.listUserIds()
+
+        result = None
+        for term in terms:
+            if not term:
+                return self.listUserIds()
+            result = union(result, index.search(term))
+
+        return result or ()
+
+    @security.private
+    def _rebuildSearchIndexes(self):
+        """ Reindex all users for substring searches.
+        """
+        self._id_index = _TrigramIndex()
+        self._login_index = _TrigramIndex()
+
+        for user_id, login_name in self._userid_to_login.items():
+            self._id_index.index(user_id, user_id)
+            self._login_index.index(user_id, login_name)
+
+    @security.private
+    def _indexUser(self, user_id, login_name, old_login_name=None):
+        if self._login_index is None:
+            self._rebuildSearchIndexes()
+
+        if old_login_name is not None:
+            self._login_index.unindex(user_id, old_login_name)
+
+        self._id_index.index(user_id, user_id)
+        self._login_index.index(user_id, login_name)
+
+    @security.private
+    def _unindexUser(self, user_id, login_name):
+        if self._login_index is None:
+            self._rebuildSearchIndexes()
+
+        self._id_index.unindex(user_id, user_id)
+        self._login_index.unindex(user_id, login_name)
+
     @security.protected(ManageUsers)
     def getUserInfo(self, user_id):
         """ user_id -> dict
@@ -279,11 +404,113 @@ class ZODBUserManager(BasePlugin, Cacheable):
         self._user_passwords[user_id] = self._pw_encrypt(password)
         self._login_to_userid[login_name] = user_id
         self._userid_to_login[user_id] = login_name
+        self._indexUser(user_id, login_name)
+        self._invalidateNegativeCache()
 
         # enumerateUsers return value has changed
         view_name = createViewName('enumerateUsers')
         self.ZCacheable_invalidate(view_name=view_name)
 
+    @security.private
+    def addUsers(self, users, encrypted=False, chunk_size=1000,
+                 workers=None, notify_created=True):
+        """ Add many users -> number of users added.
+
+        o 'users' is an iterable of (user_id, login_name, password).
+
+        o Passwords are hashed by 'workers' processes (default: one per
+          CPU;  0 hashes them here), started fresh rather than forked from
+          this process once a chunk holds at least POOL_MIN_PASSWORDS of
+          them.  Subclasses overriding '_pw_encrypt' always hash here.
+          With 'encrypted' set, passwords are taken as already hashed and
+          stored as they are.
+
+        o Users are added 'chunk_size' at a time, in sorted order, with a
+          savepoint and the PrincipalCreated events of each chunk.  With
+          'notify_created' false, no events are sent, e.g. for users
+          migrated from another user folder.
+
+        o Raise KeyError for duplicate user ids or login names;  users of
+          earlier chunks stay added until the transaction is aborted.
+        """
+        users = iter(users)
+        added = 0
+        pool = None
+        use_pool = (not encrypted and workers != 0 and
+                    type(aq_base(self))._pw_encrypt is
+                    ZODBUserManager._pw_encrypt)
+
+        try:
+            while True:
+                chunk = list(islice(users, chunk_size))
+                if not chunk:
+                    break
+                self._checkNewUsers(chunk)
+
+                passwords = [x[2] for x in chunk]
+                if use_pool and len(passwords) >= POOL_MIN_PASSWORDS:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(
+                            workers, mp_context=_getPoolContext())
+                    passwords = list(pool.map(_pw_encrypt, passwords,
+                                              chunksize=64))
+                elif not encrypted:
+                    passwords = [self._pw_encrypt(x) for x in passwords]
+
+                for (user_id, login_name, _), password in sorted(
+                        zip(chunk, passwords)):
+                    self._user_passwords[user_id] = password
+                    self._userid_to_login[user_id] = login_name
+                    self._indexUser(user_id, login_name)
+
+                for login_name, user_id in sorted(
+                        (x[1], x[0]) for x in chunk):
+                    self._login_to_userid[login_name] = user_id
+
+                transaction.savepoint(True)
+                added += len(chunk)
+                if notify_created:
+                    self._notifyCreated(chunk)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+            if added:
+                self._invalidateNegativeCache()
+                view_name = createViewName('enumerateUsers')
+                self.ZCacheable_invalidate(view_name=view_name)
+
+        return added
+
+    @security.private
+    def _checkNewUsers(self, chunk):
+        user_ids = set()
+        login_names = set()
+
+        for user_id, login_name, password in chunk:
+            if user_id in user_ids or \
+                    self._user_passwords.get(user_id) is not None:
+                raise KeyError('Duplicate user ID: %s' % user_id)
+
+            if login_name in login_names or \
+                    self._login_to_userid.get(login_name) is not None:
+                raise KeyError('Duplicate login name: %s' % login_name)
+
+            user_ids.add(user_id)
+            login_names.add(login_name)
+
+    @security.private
+    def _notifyCreated(self, chunk):
+        pas = self._getPAS()
+        create = getattr(pas, '_createUser', None)
+
+        for user_id, login_name, password in chunk:
+            if create is not None:
+                user = create(pas.plugins, user_id, login_name)
+            else:
+                user = PropertiedUser(user_id, login_name)
+            notify(PrincipalCreated(user))
+
     @security.private
     def updateUser(self, user_id, login_name):
 
@@ -298,6 +525,9 @@ class ZODBUserManager(BasePlugin, Cacheable):
             del self._login_to_userid[old_login]
             self._login_to_userid[login_name] = user_id
             self._userid_to_login[user_id] = login_name
+            self._indexUser(user_id, login_name, old_login)
+            self._invalidateNegativeCache()
+            self._invalidatePrincipalCache(user_id)
         # Signal success.
         return True
 
@@ -332,9 +562,11 @@ class ZODBUserManager(BasePlugin, Cacheable):
             new_login_to_userid[new_login_name] = user_id
             if new_login_name != old_login_name:
                 self._userid_to_login[user_id] = new_login_name
+                self._indexUser(user_id, new_login_name, old_login_name)
                 # Also, remove from the cache
                 view_name = createViewName('enumerateUsers', user_id)
                 self.ZCacheable_invalidate(view_name=view_name)
+                self._invalidatePrincipalCache(user_id)
                 logger.debug('User id %s: changed login name from %r to %r.',
                              user_id, old_login_name, new_login_name)
 
@@ -356,6 +588,7 @@ class ZODBUserManager(BasePlugin, Cacheable):
         self.ZCacheable_invalidate(view_name=view_name)
         # Store the new login mapping.
         self._login_to_userid = new_login_to_userid
+        self._invalidateNegativeCache()
 
     @security.private
     def removeUser(self, user_id):
@@ -368,6 +601,9 @@ class ZODBUserManager(BasePlugin, Cacheable):
         del self._user_passwords[user_id]
         del self._login_to_userid[login_name]
         del self._userid_to_login[user_id]
+        self._unindexUser(user_id, login_name)
+        _verified_credentials.invalidate(user_id)
+        self._invalidatePrincipalCache(user_id)
 
         # Also, remove from the cache
         view_name = createViewName('enumerateUsers')
@@ -383,6 +619,25 @@ class ZODBUserManager(BasePlugin, Cacheable):
 
         if password:
             self._user_passwords[user_id] = self._pw_encrypt(password)
+            _verified_credentials.invalidate(user_id)
+            self._invalidateNegativeCache()
+            self._invalidatePrincipalCache(user_id)
+
+    @security.private
+    def getCredentialsRevision(self, user_id):
+        """ user_id -> digest of the stored password hash, or None.
+
+        o See IAuthenticationPlugin.
+        """
+        reference = self._user_passwords.get(user_id)
+
+        if reference is None:
+            return None
+
+        if isinstance(reference, str):
+            reference = reference.encode('utf-8')
+
+        return sha256(reference).hexdigest()
 
     @security.private
     def _pw_encrypt(self, password):
@@ -391,9 +646,7 @@ class ZODBUserManager(BasePlugin, Cacheable):
         If 'password' is already encrypted, it is returned
         as is and not encrypted again.
         """
-        if AuthEncoding.is_encrypted(password):
-            return password
-        return AuthEncoding.pw_encrypt(password)
+        return _pw_encrypt(password)
 
     #
     #   ZMI
@@ -588,3 +841,135 @@ class _ZODBUserFilter:
                 return 1
 
         return 0
+
+
+def _trigrams(value, pad=''):
+    value = '{0}{1}{0}'.format(pad, value.lower())
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _getPoolContext():
+    # Forking a process holding ZODB connections and threads is unsafe
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _pw_encrypt(password):
+    # Module level, so ProcessPoolExecutor workers can run it
+    if AuthEncoding.is_encrypted(password):
+        return password
+    return AuthEncoding.pw_encrypt(password)
+
+
+class _VerifiedCredentials:
+
+    """ Remember recently verified credentials, without their passwords.
+
+    o Entries are keyed by an HMAC of user id, login, password and stored
+      password hash, under a random key which never leaves the process.
+      Changing the stored hash therefore also invalidates the entry.
+
+    o At most 'max_entries' entries are kept, the oldest are dropped first.
+    """
+
+    def __init__(self, max_entries=10000, clock=time.monotonic):
+
+        self._hmac_key = os.urandom(32)
+        self._max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id, login, password, reference):
+        """ Were these credentials verified within their lifetime?
+        """
+        digest = self._digest(user_id, login, password, reference)
+
+        with self._lock:
+            entry = self._entries.get(digest)
+
+        return entry is not None and entry[0] > self._clock()
+
+    def set(self, ttl, user_id, login, password, reference):
+        """ Remember verified credentials for 'ttl' seconds.
+        """
+        digest = self._digest(user_id, login, password, reference)
+
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._entries[digest] = (self._clock() + ttl, user_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """ Forget all credentials verified for 'user_id'.
+        """
+        with self._lock:
+            for digest, entry in list(self._entries.items()):
+                if entry[1] == user_id:
+                    del self._entries[digest]
+
+    def _digest(self, *values):
+
+        message = []
+        for value in values:
+            if isinstance(value, str):
+                value = value.encode('utf8')
+            message.append(b'%d:%s' % (len(value), value))
+
+        return hmac.new(self._hmac_key, b''.join(message), 'sha256').digest()
+
+
+_verified_credentials = _VerifiedCredentials()
+
+
+class _TrigramIndex(Persistent):
+
+    """ Map the lowercased trigrams of one string value per key to keys.
+
+    o Values are padded with NUL characters, so search terms shorter
+      than three characters are still found inside short values.
+    """
+
+    def __init__(self):
+
+        self._trigrams = OOBTree()
+
+    def index(self, key, value):
+
+        for trigram in _trigrams(value, '\x00'):
+            keys = self._trigrams.get(trigram)
+            if keys is None:
+                keys = self._trigrams[trigram] = OOTreeSet()
+            keys.insert(key)
+
+    def unindex(self, key, value):
+
+        for trigram in _trigrams(value, '\x00'):
+            keys = self._trigrams.get(trigram)
+            if keys is not None and key in keys:
+                keys.remove(key)
+                if not keys:
+                    del self._trigrams[trigram]
+
+    def search(self, term):
+        """ term -> keys whose value may contain 'term'.
+        """
+        term = term.lower()
+
+        if len(term) < 3:
+            result = None
+            for trigram, keys in self._trigrams.items():
+                if term in trigram:
+                    result = union(result, keys)
+            return result
+
+        result = None
+        for trigram in _trigrams(term):
+            keys = self._trigrams.get(trigram)
+            if keys is None:
+                return None
+            result = keys if result is None else intersection(result, keys)
+
+        return result
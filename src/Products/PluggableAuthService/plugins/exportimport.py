@@ -360,9 +360,11 @@ class DynamicGroupsPluginExportImport(SimpleXMLExportImport):
             title = self._getNodeAttr(group, 'title', None)
             description = self._getNodeAttr(group, 'description', None)
             active = self._getNodeAttr(group, 'active', None)
+            request_only = self._getNodeAttr(group, 'request_only', None)
 
             self.context.addGroup(group_id, predicate, title,
-                                  description, active == 'True')
+                                  description, active == 'True',
+                                  request_only == 'True')
 
     def _getExportInfo(self):
         group_info = []
@@ -373,7 +375,8 @@ class DynamicGroupsPluginExportImport(SimpleXMLExportImport):
                     'predicate': ginfo['predicate'],
                     'title': ginfo['title'],
                     'description': ginfo['description'],
-                    'active': ginfo['active']}
+                    'active': ginfo['active'],
+                    'request_only': ginfo['request_only']}
             group_info.append(info)
 
         return {'title': self.context.title, 'groups': group_info}
@@ -21,6 +21,8 @@ class FauxPAS(FauxContainer):
 
     def searchPrincipals(self, **kw):
         id = kw.get('id')
+        if isinstance(id, list):
+            return [{'id': x} for x in id]
         return [{'id': id}]
 
 
@@ -32,6 +34,8 @@ class FauxSmartPAS(FauxContainer):
 
     def searchPrincipals(self, **kw):
         id = kw.get('id')
+        if isinstance(id, list):
+            return [{'id': x} for x in id if self.user_ids.get(x)]
         prin = self.user_ids.get(id, None)
         return (prin and [{'id': id}]) or []
 
@@ -13,10 +13,13 @@
 ##############################################################################
 import codecs
 import unittest
+from base64 import decodebytes
 from base64 import encodebytes
+from urllib.parse import unquote
 
 from ...interfaces.plugins import IChallengePlugin
 from ...tests import pastc
+from ...tests.conformance import IAuthenticationPlugin_conformance
 from ...tests.conformance import IChallengePlugin_conformance
 from ...tests.conformance import ICredentialsResetPlugin_conformance
 from ...tests.conformance import ICredentialsUpdatePlugin_conformance
@@ -63,7 +66,8 @@ class CookieAuthHelperTests(unittest.TestCase,
                             ILoginPasswordHostExtractionPlugin_conformance,
                             IChallengePlugin_conformance,
                             ICredentialsResetPlugin_conformance,
-                            ICredentialsUpdatePlugin_conformance):
+                            ICredentialsUpdatePlugin_conformance,
+                            IAuthenticationPlugin_conformance):
 
     def _getTargetClass(self):
 
@@ -290,6 +294,113 @@ class CookieAuthHelperTests(unittest.TestCase,
         self.assertTrue(cookie_attrs['secure'])
 
 
+class CookieAuthHelperTicketTests(unittest.TestCase):
+
+    def _makeOne(self, **kw):
+
+        from ...plugins.CookieAuthHelper import CookieAuthHelper
+
+        helper = CookieAuthHelper('cookie_auth')
+        helper.use_tickets = True
+        for name, value in kw.items():
+            setattr(helper, name, value)
+        return helper
+
+    def _extract(self, helper, cookie_val):
+
+        response = FauxCookieResponse()
+        request = FauxSettableRequest(RESPONSE=response)
+        request.set(helper.cookie_name, cookie_val.decode('ascii'))
+        creds = helper.extractCredentials(request)
+        creds.pop('remote_host', None)
+        creds.pop('remote_address', None)
+        return creds, response
+
+    def test_ticket_round_trip(self):
+        helper = self._makeOne()
+        ticket = helper.get_ticket_value('user_id', 'login')
+
+        creds, response = self._extract(helper, ticket)
+        self.assertEqual(creds, {'login': 'login',
+                                 'ticket_user_id': 'user_id'})
+        # Fresh tickets are not written again
+        self.assertEqual(response.cookies, {})
+
+        creds['extractor'] = 'cookie_auth'
+        self.assertEqual(helper.authenticateCredentials(creds),
+                         ('user_id', 'login'))
+
+    def test_authenticateCredentials_other_extractor(self):
+        helper = self._makeOne()
+        self.assertIsNone(helper.authenticateCredentials(
+            {'login': 'login', 'ticket_user_id': 'user_id',
+             'extractor': 'other'}))
+        self.assertIsNone(helper.authenticateCredentials(
+            {'login': 'login', 'password': 'password',
+             'extractor': 'cookie_auth'}))
+
+    def test_ticket_tampered(self):
+        helper = self._makeOne()
+        other = self._makeOne()
+        other._ticket_secrets = helper._ticket_secrets = (b'secret',)
+        ticket = helper.get_ticket_value('user_id', 'login')
+        self.assertEqual(self._extract(other, ticket)[0]['ticket_user_id'],
+                         'user_id')
+
+        forged = encodebytes(decodebytes(ticket).replace(
+            codecs.encode(b'user_id', 'hex_codec'),
+            codecs.encode(b'manager', 'hex_codec'))).rstrip()
+        self.assertEqual(self._extract(helper, forged)[0], {})
+
+        other._ticket_secrets = (b'other',)
+        self.assertEqual(self._extract(other, ticket)[0], {})
+
+    def test_ticket_garbage(self):
+        helper = self._makeOne()
+        helper.get_ticket_value('user_id', 'login')
+        for ticket in ('ticket:', 'ticket:a:b:1:2:sig',
+                       'ticket:61:62:\u0661:\u0662:sig'):
+            cookie_val = encodebytes(ticket.encode('utf8')).rstrip()
+            self.assertEqual(self._extract(helper, cookie_val)[0], {})
+
+    def test_ticket_expired(self):
+        helper = self._makeOne(ticket_lifetime=0)
+        ticket = helper.get_ticket_value('user_id', 'login')
+        self.assertEqual(self._extract(helper, ticket)[0], {})
+
+    def test_ticket_renewal(self):
+        helper = self._makeOne(ticket_refresh=0)
+        ticket = helper.get_ticket_value('user_id', 'login')
+
+        creds, response = self._extract(helper, ticket)
+        self.assertEqual(creds['ticket_user_id'], 'user_id')
+        self.assertIn((helper.cookie_name, '/'), response.cookies)
+
+    def test_rotateTicketSecret(self):
+        helper = self._makeOne()
+        ticket = helper.get_ticket_value('user_id', 'login')
+
+        # Tickets signed with the previous secret are renewed
+        helper.rotateTicketSecret()
+        creds, response = self._extract(helper, ticket)
+        self.assertEqual(creds['ticket_user_id'], 'user_id')
+        renewed = response.cookies[(helper.cookie_name, '/')]
+        renewed = unquote(renewed).encode('ascii')
+        self.assertEqual(self._extract(helper, renewed)[1].cookies, {})
+
+        # Older tickets are rejected
+        helper.rotateTicketSecret()
+        self.assertEqual(self._extract(helper, ticket)[0], {})
+        self.assertEqual(self._extract(helper, renewed)[0]['ticket_user_id'],
+                         'user_id')
+
+    def test_tickets_disabled(self):
+        helper = self._makeOne()
+        ticket = helper.get_ticket_value('user_id', 'login')
+        helper.use_tickets = False
+        self.assertEqual(self._extract(helper, ticket)[0], {})
+
+
 class CookieAuthHelperIntegrationTests(pastc.PASTestCase):
 
     def test_login_with_missing_came_from(self):
@@ -313,3 +424,72 @@ class CookieAuthHelperIntegrationTests(pastc.PASTestCase):
 
         self.assertEqual(
             response.headers['Location'], 'http://nohost/test_folder_1_')
+
+    def _addTicketHelper(self):
+        from ...interfaces.plugins import IAuthenticationPlugin
+        from ...interfaces.plugins import IExtractionPlugin
+        pas = self.folder.acl_users
+        factory = pas.manage_addProduct['PluggableAuthService']
+        factory.addCookieAuthHelper('cookie_auth')
+        cookie_auth = pas.cookie_auth
+        cookie_auth.use_tickets = True
+        pas.plugins.activatePlugin(IExtractionPlugin, 'cookie_auth')
+        pas.plugins.activatePlugin(IAuthenticationPlugin, 'cookie_auth')
+        return pas, cookie_auth
+
+    def _ticketRequest(self, cookie_auth):
+        response = FauxCookieResponse()
+        request = FauxSettableRequest(RESPONSE=response)
+        cookie_auth.updateCredentials(request, response, 'user_login',
+                                      'user_password')
+        cookie_val = unquote(response.cookies[(cookie_auth.cookie_name,
+                                               '/')])
+        request = self.app.REQUEST
+        request[cookie_auth.cookie_name] = cookie_val
+        return request
+
+    def test_ticket_login(self):
+        pas, cookie_auth = self._addTicketHelper()
+
+        response = FauxCookieResponse()
+        request = FauxSettableRequest(RESPONSE=response)
+        cookie_auth.updateCredentials(request, response, 'user_login',
+                                      'wrong')
+        self.assertEqual(response.cookies, {})
+
+        cookie_auth.updateCredentials(request, response, 'user_login',
+                                      'user_password')
+        cookie_val = unquote(response.cookies[(cookie_auth.cookie_name,
+                                               '/')])
+        self.assertNotIn(b'user_password', decodebytes(cookie_val.encode()))
+
+        request = self.app.REQUEST
+        request[cookie_auth.cookie_name] = cookie_val
+        pas.users.authenticateCredentials = None
+        self.assertEqual(pas._extractUserIds(request, pas.plugins),
+                         [('user_id', 'user_login')])
+
+    def test_ticket_removed_user(self):
+        pas, cookie_auth = self._addTicketHelper()
+        request = self._ticketRequest(cookie_auth)
+        self.assertEqual(pas._extractUserIds(request, pas.plugins),
+                         [('user_id', 'user_login')])
+
+        pas.users.removeUser('user_id')
+        self.assertEqual(pas._extractUserIds(request, pas.plugins), [])
+
+    def test_ticket_password_changed(self):
+        pas, cookie_auth = self._addTicketHelper()
+        request = self._ticketRequest(cookie_auth)
+
+        pas.users.updateUserPassword('user_id', 'changed')
+        self.assertEqual(pas._extractUserIds(request, pas.plugins), [])
+
+        # New tickets carry the new password's revision
+        response = FauxCookieResponse()
+        cookie_auth.updateCredentials(request, response, 'user_login',
+                                      'changed')
+        request[cookie_auth.cookie_name] = unquote(
+            response.cookies[(cookie_auth.cookie_name, '/')])
+        self.assertEqual(pas._extractUserIds(request, pas.plugins),
+                         [('user_id', 'user_login')])
@@ -11,6 +11,7 @@
 # FOR A PARTICULAR PURPOSE.
 #
 ##############################################################################
+import threading
 import unittest
 
 from ...tests.conformance import IAuthenticationPlugin_conformance
@@ -39,6 +40,20 @@ class FauxRequestWithClientAddr(FauxRequest):
         return self._data.get('CLIENT_ADDR')
 
 
+class FauxLookup:
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def __call__(self, key):
+        self.calls.append(key)
+        answer = self.answers.get(key)
+        if answer is None:
+            raise OSError(key)
+        return answer
+
+
 class DomainAuthHelperTests(unittest.TestCase, IExtractionPlugin_conformance,
                             IAuthenticationPlugin_conformance,
                             IRolesPlugin_conformance):
@@ -151,6 +166,107 @@ class DomainAuthHelperTests(unittest.TestCase, IExtractionPlugin_conformance,
 
         self.assertEqual(helper.authenticateCredentials(creds), ('foo', 'foo'))
 
+    def _matchStrings(self, matches):
+        return [x['match_string'] for x in matches]
+
+    def test__findMatches_in_mapping_order(self):
+        helper = self._makeOne()
+        helper.manage_addMapping(match_type='regex', match_string='^ba.$')
+        helper.manage_addMapping(match_type='startswith', match_string='10.')
+        helper.manage_addMapping(match_type='endswith', match_string='.org')
+        helper.manage_addMapping(user_id='qux', match_type='equals',
+                                 match_string='baz')
+        helper.manage_addMapping(match_type='equals', match_string='foo')
+
+        matches = helper._findMatches('qux', 'baz', '10.0.0.1')
+        self.assertEqual(self._matchStrings(matches),
+                         ['baz', '^ba.$', '10.'])
+        self.assertEqual(matches[0]['username'], 'qux')
+
+        matches = helper._findMatches('', 'www.example.org', '10.0.0.1')
+        self.assertEqual(self._matchStrings(matches),
+                         ['10.', '.org'] * 2)
+
+        self.assertEqual(helper._findMatches('qux', 'quux', '192.168.1.1'),
+                         ())
+
+    def test__findMatches_match_both_candidates(self):
+        helper = self._makeOne()
+        helper.manage_addMapping(match_type='regex', match_string='.*')
+        helper.manage_addMapping(match_type='regex',
+                                 match_string='(a)\\1')
+
+        matches = helper._findMatches('qux', 'aa', 'b')
+        self.assertEqual(self._matchStrings(matches),
+                         ['.*', '.*', '(a)\\1'])
+
+    def test__findMatches_after_removeMappings(self):
+        helper = self._makeOne()
+        helper.manage_addMapping(match_type='equals', match_string='bam')
+        helper.manage_addMapping(match_type='endswith', match_string='am')
+        self.assertEqual(len(helper._findMatches('', 'bam', '10.0.0.1')), 4)
+
+        match_id = helper.listMappingsForUser()[0]['match_id']
+        helper.manage_removeMappings(match_ids=[match_id])
+
+        self.assertEqual(self._matchStrings(helper._findMatches('qux', 'bam',
+                                                                '10.0.0.1')),
+                         ['am'])
+
+    def test__findMatches_unknown_logins_not_remembered(self):
+        helper = self._makeOne()
+        helper.manage_addMapping(user_id='foo', match_type='equals',
+                                 match_string='bam')
+
+        for login in ('foo', 'bar', 'baz'):
+            helper._findMatches(login, 'bam', '10.0.0.1')
+
+        self.assertEqual(sorted(helper._v_matchers), ['foo'])
+        self.assertEqual(len(helper._findMatches('foo', 'bam', '10.0.0.1')),
+                         1)
+        self.assertEqual(helper._findMatches('bar', 'bam', '10.0.0.1'), ())
+
+    @unittest.skipIf(IP is None, 'IPy is not installed')
+    def test__findMatches_ip(self):
+        helper = self._makeOne()
+        helper.manage_addMapping(match_type='ip', match_string='10.0.0.0/8')
+        helper.manage_addMapping(match_type='ip', match_string='10.1.0.0/16')
+        helper.manage_addMapping(match_type='ip', match_string='10.1.2.3')
+        helper.manage_addMapping(match_type='ip', match_string='::1')
+
+        def findMatches(address):
+            return self._matchStrings(helper._findMatches('', 'host',
+                                                          address))
+
+        self.assertEqual(findMatches('10.1.2.3'),
+                         ['10.0.0.0/8', '10.1.0.0/16', '10.1.2.3'] * 2)
+        self.assertEqual(findMatches('10.2.0.1'), ['10.0.0.0/8'] * 2)
+        self.assertEqual(findMatches('10.1.0.0/24'),
+                         ['10.0.0.0/8', '10.1.0.0/16'] * 2)
+        self.assertEqual(findMatches('::1'), ['::1'] * 2)
+        self.assertEqual(findMatches('11.0.0.1'), [])
+
+    def test__findMatches_resolves_through_cache(self):
+        from ...plugins import DomainAuthHelper as module
+        lookup = FauxLookup({'10.0.0.1': 'host.example.org'})
+        saved, module._resolver = module._resolver, module._CachingResolver(
+            lookupHostName=lookup, lookupHostAddress=lookup)
+        try:
+            helper = self._makeOne()
+            helper.manage_addMapping(match_type='endswith',
+                                     match_string='.example.org')
+
+            for i in range(2):
+                matches = helper._findMatches('qux', '', '10.0.0.1')
+                self.assertEqual(self._matchStrings(matches),
+                                 ['.example.org'])
+                self.assertEqual(helper._findMatches('qux', 'nohost', ''),
+                                 ())
+
+            self.assertEqual(lookup.calls, ['10.0.0.1', 'nohost'])
+        finally:
+            module._resolver = saved
+
     # ???  add tests for getRolesForPrincipal, etc.
 
 
@@ -272,9 +388,83 @@ class IPFilterTests(unittest.TestCase):
         self.assertFalse(filter('192.168.0.13'))
 
 
+class CachingResolverTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+        from ...plugins.DomainAuthHelper import _CachingResolver
+        return _CachingResolver
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def test_caches_answers_until_ttl(self):
+        now = [0]
+        lookup = FauxLookup({'10.0.0.1': 'host'})
+        resolver = self._makeOne(lookupHostName=lookup, clock=lambda: now[0])
+
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), 'host')
+        now[0] = 9
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), 'host')
+        self.assertEqual(len(lookup.calls), 1)
+
+        now[0] = 10
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), 'host')
+        self.assertEqual(len(lookup.calls), 2)
+
+    def test_no_ttl_no_caching(self):
+        lookup = FauxLookup({'host': '10.0.0.1'})
+        resolver = self._makeOne(lookupHostAddress=lookup)
+
+        self.assertEqual(resolver.getHostAddress('host'), '10.0.0.1')
+        self.assertEqual(resolver.getHostAddress('host'), '10.0.0.1')
+        self.assertEqual(len(lookup.calls), 2)
+
+    def test_negative_caching(self):
+        now = [0]
+        lookup = FauxLookup({})
+        resolver = self._makeOne(lookupHostName=lookup, negative_ttl=5,
+                                 clock=lambda: now[0])
+
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), '')
+        now[0] = 4
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), '')
+        self.assertEqual(len(lookup.calls), 1)
+
+        now[0] = 5
+        self.assertEqual(resolver.getHostName('10.0.0.1', ttl=10), '')
+        self.assertEqual(len(lookup.calls), 2)
+
+    def test_bounded(self):
+        lookup = FauxLookup({'a': '1', 'b': '2', 'c': '3'})
+        resolver = self._makeOne(lookupHostAddress=lookup, max_entries=2)
+
+        for host_name in ('a', 'b', 'c', 'c', 'b', 'a'):
+            resolver.getHostAddress(host_name, ttl=10)
+
+        self.assertEqual(lookup.calls, ['a', 'b', 'c', 'a'])
+
+    def test_timeout(self):
+        release = threading.Event()
+        answered = threading.Event()
+
+        def slowLookup(address):
+            release.wait(10)
+            answered.set()
+            return 'host'
+
+        resolver = self._makeOne(lookupHostName=slowLookup)
+
+        self.assertEqual(resolver.getHostName('10.0.0.1', 0.01, 10), '')
+
+        release.set()
+        answered.wait(10)
+        self.assertEqual(resolver.getHostName('10.0.0.1', 10, 10), 'host')
+
+
 def test_suite():
     loadTestsFromTestCase = unittest.defaultTestLoader.loadTestsFromTestCase
     tests = (loadTestsFromTestCase(DomainAuthHelperTests),
+             loadTestsFromTestCase(CachingResolverTests),
              loadTestsFromTestCase(EqualsFilterTests),
              loadTestsFromTestCase(StartsWithFilterTests),
              loadTestsFromTestCase(EndsWithFilterTests),
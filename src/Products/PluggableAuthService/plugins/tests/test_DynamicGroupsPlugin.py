@@ -32,6 +32,23 @@ class FauxScript:
         return self.return_value
 
 
+class FauxCountingScript(FauxScript):
+
+    calls = 0
+
+    def __call__(self, *args, **kw):
+
+        self.calls += 1
+        return self.return_value
+
+
+class FauxRequest(dict):
+
+    def __init__(self, **kw):
+        dict.__init__(self, **kw)
+        self.other = {}
+
+
 class FauxPrincipal:
 
     __allow_access_to_unprotected_subobjects__ = 1
@@ -473,3 +490,73 @@ class DynamicGroupsPlugin(unittest.TestCase, IGroupsPlugin_conformance,
         groups = dpg.getGroupsForPrincipal(principal, {})
         self.assertEqual(len(groups), 1)
         self.assertIn('ggp_effable', groups)
+
+    def test_getGroupsForPrincipal_request_only_once_per_request(self):
+
+        dpg = self._makeOne('ggp_memo')
+        callme = FauxCountingScript('callme', 1)
+        dpg._setOb('callme', callme)
+
+        dpg.addGroup('scripted', 'python: plugin.callme(request)',
+                     request_only=True)
+        dpg.addGroup('effable', 'python:principal.getId().startswith("f")')
+
+        request = FauxRequest()
+        for id in ('faux', 'other'):
+            groups = dpg.getGroupsForPrincipal(FauxPrincipal(id), request)
+            self.assertIn('scripted', groups)
+        self.assertEqual(callme.calls, 1)
+        self.assertEqual(groups, ['scripted'])
+
+        dpg.getGroupsForPrincipal(FauxPrincipal('faux'), FauxRequest())
+        self.assertEqual(callme.calls, 2)
+
+        # Changing the group drops its memoized result
+        callme.return_value = 0
+        dpg.updateGroup('scripted', 'python: plugin.callme(request)')
+        groups = dpg.getGroupsForPrincipal(FauxPrincipal('faux'), request)
+        self.assertEqual(callme.calls, 3)
+        self.assertEqual(groups, ['effable'])
+
+    def test_getGroupsForPrincipal_not_request_only(self):
+
+        dpg = self._makeOne('ggp_not_memo')
+        callme = FauxCountingScript('callme', 1)
+        dpg._setOb('callme', callme)
+
+        dpg.addGroup('scripted', 'python: plugin.callme(request)')
+
+        request = FauxRequest()
+        for id in ('faux', 'other'):
+            groups = dpg.getGroupsForPrincipal(FauxPrincipal(id), request)
+            self.assertEqual(groups, ['scripted'])
+        self.assertEqual(callme.calls, 2)
+        self.assertEqual(dpg._getRequestMemo(request), {})
+
+        dpg.updateGroup('scripted', 'python: plugin.callme(request)',
+                        request_only=True)
+        for id in ('faux', 'other'):
+            groups = dpg.getGroupsForPrincipal(FauxPrincipal(id), request)
+            self.assertEqual(groups, ['scripted'])
+        self.assertEqual(callme.calls, 3)
+        self.assertTrue(dpg.getGroupInfo('scripted')['request_only'])
+
+    def test_getGroupsForPrincipal_follows_definitions(self):
+
+        dpg = self._makeOne('ggp_definitions')
+        principal = FauxPrincipal('faux')
+
+        dpg.addGroup('everyone', 'python:1')
+        self.assertEqual(dpg.getGroupsForPrincipal(principal, {}),
+                         ['everyone'])
+
+        dpg.addGroup('effable', 'python:principal.getId().startswith("f")')
+        self.assertEqual(dpg.getGroupsForPrincipal(principal, {}),
+                         ['everyone', 'effable'])
+
+        dpg.updateGroup('everyone', 'python:1', active=False)
+        self.assertEqual(dpg.getGroupsForPrincipal(principal, {}),
+                         ['effable'])
+
+        dpg.removeGroup('effable')
+        self.assertEqual(dpg.getGroupsForPrincipal(principal, {}), [])
@@ -13,6 +13,8 @@
 ##############################################################################
 import unittest
 
+from ...tests import pastc
+from ...tests.conformance import IAuthenticationPlugin_conformance
 from ...tests.conformance import ICredentialsResetPlugin_conformance
 from ...tests.conformance import ICredentialsUpdatePlugin_conformance
 from ...tests.conformance import ILoginPasswordHostExtractionPlugin_conformance
@@ -20,13 +22,24 @@ from ...tests.test_PluggableAuthService import FauxResponse
 from ...tests.test_PluggableAuthService import FauxSession
 
 
+class FauxRecordingSession(FauxSession):
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.writes = []
+
+    def set(self, name, value):
+        self.writes.append(name)
+        return super().set(name, value)
+
+
 class FauxHTTPRequest:
 
-    def __init__(self, name=None, password=None):
+    def __init__(self, name=None, password=None, session=None):
         self._name = name
         self._password = password
         self.RESPONSE = FauxResponse()
-        self.SESSION = FauxSession()
+        self.SESSION = FauxSession() if session is None else session
 
     def _authUserPW(self):
         if self._name is None:
@@ -41,7 +54,8 @@ class FauxHTTPRequest:
 class SessionAuthHelperTests(unittest.TestCase,
                              ILoginPasswordHostExtractionPlugin_conformance,
                              ICredentialsResetPlugin_conformance,
-                             ICredentialsUpdatePlugin_conformance):
+                             ICredentialsUpdatePlugin_conformance,
+                             IAuthenticationPlugin_conformance):
 
     def _getTargetClass(self):
         from ...plugins.SessionAuthHelper import SessionAuthHelper
@@ -162,3 +176,131 @@ class SessionAuthHelperTests(unittest.TestCase,
                           'password': 'b:az',
                           'remote_host': '',
                           'remote_address': ''})
+
+    def test_extractCredentials_session_creds_no_writes(self):
+        helper = self._makeOne()
+        request = FauxHTTPRequest(name='foo', password='b:ar')
+        request.SESSION = FauxRecordingSession()
+
+        helper.extractCredentials(request)
+        self.assertEqual(request.SESSION.writes,
+                         ['__ac_name', '__ac_password'])
+
+        request.SESSION.writes = []
+        helper.extractCredentials(request)
+        helper.updateCredentials(request, request.RESPONSE, 'foo', 'b:ar')
+        self.assertEqual(request.SESSION.writes, [])
+
+        helper.resetCredentials(request, request.RESPONSE)
+        request.SESSION.writes = []
+        helper.resetCredentials(request, request.RESPONSE)
+        self.assertEqual(request.SESSION.writes, [])
+
+    def _makeTicketHelper(self):
+        helper = self._makeOne()
+        helper.use_tickets = True
+        checked = []
+
+        def _authenticateLogin(login, password):
+            checked.append(login)
+            if (login, password) == ('foo', 'b:ar'):
+                return 'foo_id'
+
+        helper._authenticateLogin = _authenticateLogin
+        self.revisions = {'foo_id': 'r1'}
+        helper._getCredentialsRevision = self.revisions.get
+        return helper, checked
+
+    def test_extractCredentials_ticket(self):
+        helper, checked = self._makeTicketHelper()
+        request = FauxHTTPRequest(name='foo', password='b:ar')
+        request.SESSION = FauxRecordingSession()
+        expected = {'login': 'foo',
+                    'session_user_id': 'foo_id',
+                    'remote_host': '',
+                    'remote_address': ''}
+
+        self.assertEqual(helper.extractCredentials(request), expected)
+        self.assertEqual(request.SESSION, {'__ac_name': 'foo',
+                                           '__ac_user_id': 'foo_id',
+                                           '__ac_revision': 'r1'})
+
+        # The password is neither checked nor written again
+        request.SESSION.writes = []
+        self.assertEqual(helper.extractCredentials(request), expected)
+        self.assertEqual(checked, ['foo'])
+        self.assertEqual(request.SESSION.writes, [])
+
+        expected['extractor'] = helper.getId()
+        self.assertEqual(helper.authenticateCredentials(expected),
+                         ('foo_id', 'foo'))
+        expected['extractor'] = 'other'
+        self.assertIsNone(helper.authenticateCredentials(expected))
+
+    def test_extractCredentials_ticket_wrong_password(self):
+        helper, checked = self._makeTicketHelper()
+        request = FauxHTTPRequest(name='foo', password='wrong')
+
+        self.assertEqual(helper.extractCredentials(request),
+                         {'login': 'foo',
+                          'password': 'wrong',
+                          'remote_host': '',
+                          'remote_address': ''})
+        self.assertFalse(request.SESSION.get('__ac_user_id'))
+        self.assertFalse(request.SESSION.get('__ac_password'))
+
+    def test_updateCredentials_ticket_drops_password(self):
+        helper, checked = self._makeTicketHelper()
+        request = FauxHTTPRequest()
+        request.SESSION['__ac_name'] = 'foo'
+        request.SESSION['__ac_password'] = 'b:ar'
+
+        helper.updateCredentials(request, request.RESPONSE, 'foo', 'b:ar')
+        self.assertEqual(request.SESSION, {'__ac_name': 'foo',
+                                           '__ac_password': '',
+                                           '__ac_user_id': 'foo_id',
+                                           '__ac_revision': 'r1'})
+
+        helper.resetCredentials(request, request.RESPONSE)
+        self.assertEqual(helper.extractCredentials(request), {})
+
+    def test_extractCredentials_ticket_removed_user(self):
+        helper, checked = self._makeTicketHelper()
+        request = FauxHTTPRequest(name='foo', password='b:ar')
+        self.assertEqual(
+            helper.extractCredentials(request)['session_user_id'], 'foo_id')
+
+        del self.revisions['foo_id']
+        request = FauxHTTPRequest(session=request.SESSION)
+        self.assertEqual(helper.extractCredentials(request), {})
+        self.assertEqual(request.SESSION['__ac_user_id'], '')
+
+    def test_extractCredentials_ticket_password_changed(self):
+        helper, checked = self._makeTicketHelper()
+        request = FauxHTTPRequest(name='foo', password='b:ar')
+        helper.extractCredentials(request)
+
+        self.revisions['foo_id'] = 'r2'
+        request = FauxHTTPRequest(session=request.SESSION)
+        self.assertEqual(helper.extractCredentials(request), {})
+
+
+class SessionAuthHelperIntegrationTests(pastc.PASTestCase):
+
+    def test_ticket_removed_user(self):
+        from ...interfaces.plugins import IAuthenticationPlugin
+        from ...plugins.SessionAuthHelper import SessionAuthHelper
+        pas = self.folder.acl_users
+        pas._setObject('session_auth', SessionAuthHelper('session_auth'))
+        session_auth = pas.session_auth
+        session_auth.use_tickets = True
+        pas.plugins.activatePlugin(IAuthenticationPlugin, 'session_auth')
+
+        request = FauxHTTPRequest(name='user_login', password='user_password')
+        self.assertEqual(
+            session_auth.extractCredentials(request)['session_user_id'],
+            'user_id')
+
+        pas.users.removeUser('user_id')
+        request = FauxHTTPRequest(session=request.SESSION)
+        self.assertEqual(session_auth.extractCredentials(request), {})
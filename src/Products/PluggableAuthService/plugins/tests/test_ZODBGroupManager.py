@@ -210,6 +210,60 @@ class ZODBGroupManagerTests(unittest.TestCase,
         self.assertEqual(principals, [('userid1', 'userid1'),
                                       ('userid2', 'userid2')])
 
+    def test_listAssignedPrincipals_batched_lookup(self):
+
+        class FauxCountingPAS(FauxSmartPAS):
+
+            def searchPrincipals(self, **kw):
+                self.searches.append(kw['id'])
+                return FauxSmartPAS.searchPrincipals(self, **kw)
+
+        pas = FauxCountingPAS()
+        pas.searches = []
+        pas.user_ids.update({'userid1': 'userid1', 'userid2': 'userid2'})
+        zgm = self._makeOne().__of__(pas)
+
+        zgm.addGroup('group')
+        zgm.addGroup('other')
+        for principal_id in ('userid2', 'userid1', 'userid3'):
+            zgm.addPrincipalToGroup(principal_id, 'group')
+        zgm.addPrincipalToGroup('userid4', 'other')
+
+        self.assertEqual(zgm.listAssignedPrincipals('group'),
+                         [('userid1', 'userid1'), ('userid2', 'userid2'),
+                          ('userid3', '<userid3: not found>')])
+        self.assertEqual(pas.searches,
+                         [['userid1', 'userid2', 'userid3'], 'userid3'])
+
+    def test_group_principals_index(self):
+        zgm = self._makeOne().__of__(FauxPAS())
+
+        zgm.addGroup('group1')
+        zgm.addGroup('group2')
+        zgm.addPrincipalToGroup('userid1', 'group1')
+        zgm.addPrincipalToGroup('userid2', 'group1')
+        zgm.addPrincipalToGroup('userid1', 'group2')
+
+        self.assertEqual(zgm._listGroupMembers('group1'),
+                         ['userid1', 'userid2'])
+
+        zgm.removePrincipalFromGroup('userid1', 'group1')
+        self.assertEqual(zgm._listGroupMembers('group1'), ['userid2'])
+
+        zgm.removeGroup('group2')
+        self.assertEqual(zgm._listGroupMembers('group2'), [])
+        self.assertNotIn('group2', zgm._group_principals)
+        self.assertEqual(zgm.getGroupsForPrincipal(DummyUser('userid1')),
+                         ())
+
+        # Instances created before the index existed.
+        del zgm._group_principals
+        self.assertEqual(zgm._listGroupMembers('group1'), ['userid2'])
+
+        zgm.addPrincipalToGroup('userid3', 'group1')
+        self.assertEqual(list(zgm._group_principals['group1']),
+                         ['userid2', 'userid3'])
+
     def test_enumerateGroups_exact_nonesuch(self):
         from ...tests.test_PluggableAuthService import FauxRoot
 
@@ -224,6 +278,22 @@ class ZODBGroupManagerTests(unittest.TestCase,
 
         self.assertEqual(zgm.enumerateGroups(id='qux', exact_match=True), ())
 
+    def test_enumerateGroups_sort_by_and_max_results(self):
+        from ...tests.test_PluggableAuthService import FauxRoot
+
+        root = FauxRoot()
+        zgm = self._makeOne(id='sorted').__of__(root)
+
+        zgm.addGroup('foo', 'Zed')
+        zgm.addGroup('bar', 'alpha')
+        zgm.addGroup('baz', 'Beta')
+
+        info = zgm.enumerateGroups(sort_by='title')
+        self.assertEqual([x['id'] for x in info], ['bar', 'baz', 'foo'])
+
+        info = zgm.enumerateGroups(sort_by='title', max_results=2)
+        self.assertEqual([x['id'] for x in info], ['bar', 'baz'])
+
     def test_enumerateGroups_exact_string(self):
         from ...tests.test_PluggableAuthService import FauxRoot
 
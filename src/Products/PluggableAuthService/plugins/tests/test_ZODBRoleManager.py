@@ -438,6 +438,70 @@ class ZODBRoleManagerTests(unittest.TestCase, IRolesPlugin_conformance,
         self.assertRaises(MultiplePrincipalError,
                           zrm.listAssignedPrincipals, 'test')
 
+    def test_listAssignedPrincipals_batched_lookup(self):
+
+        class FauxCountingPAS(FauxSmartPAS):
+
+            def searchPrincipals(self, **kw):
+                self.searches.append(kw['id'])
+                return FauxSmartPAS.searchPrincipals(self, **kw)
+
+        root = FauxCountingPAS()
+        root.searches = []
+        root.user_ids.update({'foo': 'foo', 'bar': 'bar', 'baz': 'baz'})
+        zrm = self._makeOne(id='batched').__of__(root)
+
+        zrm.addRole('test')
+        for principal_id in ('foo', 'bar', 'baz', 'qux'):
+            zrm.assignRoleToPrincipal('test', principal_id)
+
+        self.assertEqual(zrm.listAssignedPrincipals('test'),
+                         [('bar', 'bar'), ('baz', 'baz'), ('foo', 'foo'),
+                          ('qux', '<qux: not found>')])
+        # One batched search, and one more for the principal not found.
+        self.assertEqual(root.searches,
+                         [['bar', 'baz', 'foo', 'qux'], 'qux'])
+
+    def test_role_principals_index(self):
+
+        root = FauxPAS()
+        zrm = self._makeOne(id='index').__of__(root)
+
+        zrm.addRole('test')
+        zrm.addRole('other')
+        zrm.assignRoleToPrincipal('test', 'foo')
+        zrm.assignRoleToPrincipal('test', 'bar')
+        zrm.assignRoleToPrincipal('other', 'foo')
+
+        self.assertEqual(zrm._listPrincipalsWithRole('test'), ['bar', 'foo'])
+        self.assertEqual(zrm._listPrincipalsWithRole('other'), ['foo'])
+
+        zrm.removeRoleFromPrincipal('test', 'foo')
+        self.assertEqual(zrm._listPrincipalsWithRole('test'), ['bar'])
+
+        zrm.removeRole('test')
+        self.assertEqual(zrm._listPrincipalsWithRole('test'), [])
+        self.assertNotIn('test', zrm._role_principals)
+        self.assertEqual(zrm.getRolesForPrincipal(DummyUser('bar')), ())
+        self.assertEqual(zrm.getRolesForPrincipal(DummyUser('foo')),
+                         ('other',))
+
+    def test_role_principals_index_missing(self):
+
+        root = FauxPAS()
+        zrm = self._makeOne(id='index').__of__(root)
+
+        zrm.addRole('test')
+        zrm.assignRoleToPrincipal('test', 'foo')
+
+        # Instances created before the index existed.
+        del zrm._role_principals
+
+        self.assertEqual(zrm._listPrincipalsWithRole('test'), ['foo'])
+
+        zrm.assignRoleToPrincipal('test', 'bar')
+        self.assertEqual(list(zrm._role_principals['test']), ['bar', 'foo'])
+
     def test_updateRole_nonesuch(self):
 
         from ...tests.test_PluggableAuthService import FauxRoot
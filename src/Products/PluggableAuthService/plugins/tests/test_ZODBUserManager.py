@@ -93,6 +93,131 @@ class ZODBUserManagerTests(unittest.TestCase,
         self.assertRaises(KeyError, zum.addUser,
                           'new_user', 'userid@example.com', '3733t')
 
+    def _addUsers(self, zum, count, **kw):
+
+        from zope import event
+
+        events = []
+        event.subscribers.append(events.append)
+        try:
+            added = zum.addUsers([('user%d' % i, 'login%d' % i, 'pw%d' % i)
+                                  for i in reversed(range(count))], **kw)
+        finally:
+            event.subscribers.remove(events.append)
+
+        self.assertEqual(added, count)
+        return events
+
+    def test_addUsers(self):
+
+        zum = self._makeOne()
+
+        events = self._addUsers(zum, 5, chunk_size=2, workers=0)
+
+        self.assertEqual(list(zum.listUserIds()),
+                         ['user%d' % i for i in range(5)])
+        self.assertEqual(zum.getUserIdForLogin('login3'), 'user3')
+        self.assertEqual(zum.authenticateCredentials(
+            {'login': 'login3', 'password': 'pw3'}), ('user3', 'login3'))
+        self.assertEqual([x.principal.getId() for x in events],
+                         ['user4', 'user3', 'user2', 'user1', 'user0'])
+        self.assertEqual([x['id'] for x in zum.enumerateUsers(id='user')],
+                         ['user%d' % i for i in range(5)])
+
+    def test_addUsers_process_pool(self):
+
+        from ...plugins import ZODBUserManager
+
+        zum = self._makeOne()
+        pools = []
+
+        class RecordingPool(ZODBUserManager.ProcessPoolExecutor):
+            def __init__(self, *args, **kw):
+                super().__init__(*args, **kw)
+                pools.append(kw['mp_context'].get_start_method())
+
+        original = (ZODBUserManager.ProcessPoolExecutor,
+                    ZODBUserManager.POOL_MIN_PASSWORDS)
+        ZODBUserManager.ProcessPoolExecutor = RecordingPool
+        ZODBUserManager.POOL_MIN_PASSWORDS = 2
+        try:
+            self._addUsers(zum, 5, chunk_size=2, workers=2)
+        finally:
+            (ZODBUserManager.ProcessPoolExecutor,
+             ZODBUserManager.POOL_MIN_PASSWORDS) = original
+
+        # One pool, started once a chunk is large enough, without forking
+        self.assertEqual(len(pools), 1)
+        self.assertIn(pools[0], ('forkserver', 'spawn'))
+        self.assertEqual(zum.authenticateCredentials(
+            {'login': 'login4', 'password': 'pw4'}), ('user4', 'login4'))
+        self.assertNotEqual(zum._user_passwords['user4'], 'pw4')
+
+    def test_addUsers_small_chunks_in_process(self):
+
+        from ...plugins import ZODBUserManager
+
+        zum = self._makeOne()
+        original = ZODBUserManager.ProcessPoolExecutor
+        ZODBUserManager.ProcessPoolExecutor = None
+        try:
+            self._addUsers(zum, 5)
+        finally:
+            ZODBUserManager.ProcessPoolExecutor = original
+
+        self.assertEqual(zum.authenticateCredentials(
+            {'login': 'login4', 'password': 'pw4'}), ('user4', 'login4'))
+
+    def test_addUsers_overridden_pw_encrypt(self):
+
+        from ...plugins import ZODBUserManager
+
+        class CustomUserManager(ZODBUserManager.ZODBUserManager):
+            def _pw_encrypt(self, password):
+                return 'custom:' + password
+
+        zum = CustomUserManager('custom')
+        original = ZODBUserManager.POOL_MIN_PASSWORDS
+        ZODBUserManager.POOL_MIN_PASSWORDS = 1
+        try:
+            self._addUsers(zum, 2, workers=2)
+        finally:
+            ZODBUserManager.POOL_MIN_PASSWORDS = original
+
+        self.assertEqual(zum._user_passwords['user1'], 'custom:pw1')
+
+    def test_addUsers_encrypted(self):
+
+        zum = self._makeOne()
+        password = pw_encrypt('secret')
+
+        zum.addUsers([('userid', 'userid@example.com', password),
+                      ('unchecked', 'unchecked', 'not hashed')],
+                     encrypted=True)
+
+        self.assertEqual(zum._user_passwords['userid'], password)
+        self.assertEqual(zum._user_passwords['unchecked'], 'not hashed')
+        self.assertEqual(zum.authenticateCredentials(
+            {'login': 'userid@example.com', 'password': 'secret'}),
+            ('userid', 'userid@example.com'))
+
+    def test_addUsers_duplicate_check(self):
+
+        zum = self._makeOne()
+        zum.addUser('userid', 'userid@example.com', 'password')
+
+        self.assertRaises(KeyError, zum.addUsers,
+                          [('userid', 'other@example.com', 'pw')], workers=0)
+        self.assertRaises(KeyError, zum.addUsers,
+                          [('other', 'userid@example.com', 'pw')], workers=0)
+        self.assertRaises(KeyError, zum.addUsers,
+                          [('new', 'new1', 'pw'), ('new', 'new2', 'pw')],
+                          workers=0)
+        self.assertRaises(KeyError, zum.addUsers,
+                          [('new1', 'new', 'pw'), ('new2', 'new', 'pw')],
+                          workers=0)
+        self.assertEqual(list(zum.listUserIds()), ['userid'])
+
     def test_removeUser_nonesuch(self):
 
         zum = self._makeOne()
@@ -142,6 +267,54 @@ class ZODBUserManagerTests(unittest.TestCase,
         self.assertEqual(user_id, 'userid')
         self.assertEqual(login, 'userid@example.com')
 
+    def _countVerifications(self, zum):
+        calls = []
+        verifyPassword = zum._verifyPassword
+
+        def _verifyPassword(reference, password):
+            calls.append(password)
+            return verifyPassword(reference, password)
+
+        zum._verifyPassword = _verifyPassword
+        return calls
+
+    def test_authenticateCredentials_verified_credentials_disabled(self):
+
+        zum = self._makeOne()
+        zum.addUser('userid', 'userid@example.com', 'password')
+        calls = self._countVerifications(zum)
+        creds = {'login': 'userid@example.com', 'password': 'password'}
+
+        for i in range(2):
+            self.assertEqual(zum.authenticateCredentials(creds),
+                             ('userid', 'userid@example.com'))
+        self.assertEqual(len(calls), 2)
+
+    def test_authenticateCredentials_verified_credentials(self):
+
+        zum = self._makeOne()
+        zum.verified_credentials_ttl = 60
+        zum.addUser('userid', 'userid@example.com', 'password')
+        calls = self._countVerifications(zum)
+        creds = {'login': 'userid@example.com', 'password': 'password'}
+        bad_creds = {'login': 'userid@example.com', 'password': 'bad'}
+
+        for i in range(2):
+            self.assertEqual(zum.authenticateCredentials(creds),
+                             ('userid', 'userid@example.com'))
+            self.assertIsNone(zum.authenticateCredentials(bad_creds))
+        self.assertEqual(calls, ['password', 'bad', 'bad'])
+
+        zum.updateUserPassword('userid', 'new_password')
+        self.assertIsNone(zum.authenticateCredentials(creds))
+        self.assertEqual(len(calls), 4)
+
+        zum.removeUser('userid')
+        zum.addUser('userid', 'userid@example.com', 'password')
+        self.assertEqual(zum.authenticateCredentials(creds),
+                         ('userid', 'userid@example.com'))
+        self.assertEqual(len(calls), 5)
+
     def test_authenticateCredentials_only_matches_login_name(self):
         # When userid and login name are different, then
         # authentication with the userid should fail.  Alternatively,
@@ -253,6 +426,82 @@ class ZODBUserManagerTests(unittest.TestCase,
             self.assertEqual(info_list[i]['editurl'],
                              'partial/manage_users?user_id=%s' % sorted[i])
 
+    def _searchIds(self, zum, **kw):
+        return [x['id'] for x in zum.enumerateUsers(exact_match=False, **kw)]
+
+    def test_enumerateUsers_partial_uses_index(self):
+
+        zum = self._makeOne()
+
+        zum.addUser('foo', 'Foo@Example.com', 'password')
+        zum.addUser('bar', 'bar@example.org', 'password')
+        zum.addUser('baz', 'b', 'password')
+
+        self.assertEqual(list(zum._searchUserIds(login=['EXAMPLE.COM'])),
+                         ['foo'])
+        self.assertEqual(self._searchIds(zum, login='example.com'), ['foo'])
+        self.assertEqual(self._searchIds(zum, login='example'),
+                         ['bar', 'foo'])
+        self.assertEqual(self._searchIds(zum, login=['foo', '.org']),
+                         ['bar', 'foo'])
+        self.assertEqual(self._searchIds(zum, login='b'), ['bar', 'baz'])
+        self.assertEqual(self._searchIds(zum, login='@e'), ['bar', 'foo'])
+        self.assertEqual(self._searchIds(zum, login='nonesuch'), [])
+        self.assertEqual(self._searchIds(zum, id='A'), ['bar', 'baz'])
+        self.assertEqual(self._searchIds(zum, id='az'), ['baz'])
+
+    def test_enumerateUsers_partial_index_follows_changes(self):
+
+        zum = self._makeOne()
+        zum._getPAS = lambda: FakeLowerCasePAS()
+
+        zum.addUser('foo', 'Foo@Example.com', 'password')
+        zum.addUser('bar', 'bar@example.org', 'password')
+
+        zum.updateUser('foo', 'foo@example.net')
+        self.assertEqual(self._searchIds(zum, login='.com'), [])
+        self.assertEqual(self._searchIds(zum, login='.net'), ['foo'])
+
+        zum.removeUser('bar')
+        self.assertEqual(self._searchIds(zum, login='example'), ['foo'])
+        self.assertEqual(self._searchIds(zum, id='bar'), [])
+
+        zum.addUser('Qux', 'QUX@EXAMPLE.NET', 'password')
+        zum.updateEveryLoginName()
+        self.assertEqual(self._searchIds(zum, login='qux@e'), ['Qux'])
+        self.assertEqual(list(zum._login_index.search('QUX@E')), ['Qux'])
+
+    def test_enumerateUsers_partial_without_index(self):
+
+        zum = self._makeOne()
+
+        zum.addUser('foo', 'foo@example.com', 'password')
+        zum.addUser('bar', 'bar@example.org', 'password')
+
+        # Instances created before the indexes existed.
+        del zum._id_index
+        del zum._login_index
+
+        self.assertEqual(self._searchIds(zum, login='.com'), ['foo'])
+
+        zum.addUser('baz', 'baz@example.com', 'password')
+        self.assertEqual(list(zum._searchUserIds(login=['.com'])),
+                         ['baz', 'foo'])
+
+    def test_enumerateUsers_sort_by_and_max_results(self):
+
+        zum = self._makeOne()
+
+        zum.addUser('foo', 'Zed@example.com', 'password')
+        zum.addUser('bar', 'alice@example.com', 'password')
+        zum.addUser('baz', 'Bob@example.com', 'password')
+
+        self.assertEqual(self._searchIds(zum, sort_by='login'),
+                         ['bar', 'baz', 'foo'])
+        self.assertEqual(self._searchIds(zum, sort_by='login', max_results=2),
+                         ['bar', 'baz'])
+        self.assertEqual(self._searchIds(zum, max_results=1), ['bar'])
+
     def test_enumerateUsers_other_criteria(self):
 
         from ...tests.test_PluggableAuthService import FauxRoot
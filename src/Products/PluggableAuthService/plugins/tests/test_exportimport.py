@@ -1027,7 +1027,8 @@ class DynamicGroupsPluginExportImportTests(_TestBase):
 
         for g in _DYNAMIC_GROUP_INFO:
             plugin.addGroup(g['group_id'], g['predicate'], g['title'],
-                            g['description'], g['active'])
+                            g['description'], g['active'],
+                            g['request_only'])
 
         adapter = self._makeOne(plugin)
 
@@ -1046,7 +1047,8 @@ class DynamicGroupsPluginExportImportTests(_TestBase):
 
         for g in _DYNAMIC_GROUP_INFO:
             plugin.addGroup(g['group_id'], g['predicate'], g['title'],
-                            g['description'], g['active'])
+                            g['description'], g['active'],
+                            g['request_only'])
 
         adapter = self._makeOne(plugin)
         context = DummyExportContext(plugin)
@@ -1078,6 +1080,7 @@ class DynamicGroupsPluginExportImportTests(_TestBase):
             self.assertEqual(finfo['title'], ginfo['title'])
             self.assertEqual(finfo['description'], ginfo['description'])
             self.assertEqual(finfo['active'], ginfo['active'])
+            self.assertEqual(finfo['request_only'], ginfo['request_only'])
 
     def test_import_without_purge_leaves_existing_users(self):
 
@@ -1086,7 +1089,8 @@ class DynamicGroupsPluginExportImportTests(_TestBase):
 
         for g in _DYNAMIC_GROUP_INFO:
             plugin.addGroup(g['group_id'], g['predicate'], g['title'],
-                            g['description'], g['active'])
+                            g['description'], g['active'],
+                            g['request_only'])
 
         adapter = self._makeOne(plugin)
 
@@ -1107,7 +1111,8 @@ class DynamicGroupsPluginExportImportTests(_TestBase):
 
         for g in _DYNAMIC_GROUP_INFO:
             plugin.addGroup(g['group_id'], g['predicate'], g['title'],
-                            g['description'], g['active'])
+                            g['description'], g['active'],
+                            g['request_only'])
 
         adapter = self._makeOne(plugin)
 
@@ -1481,12 +1486,14 @@ _DYNAMIC_GROUP_INFO = ({'group_id': 'group_1',
                         'title': 'Group 1',
                         'predicate': 'python:1',
                         'description': 'First Group',
-                        'active': True},
+                        'active': True,
+                        'request_only': True},
                        {'group_id': 'group_2',
                         'title': 'Group 2',
                         'predicate': 'python:0',
                         'description': 'Second Group',
-                        'active': False})
+                        'active': False,
+                        'request_only': False})
 
 _EMPTY_DYNAMIC_GROUPS = """\
 <?xml version="1.0" ?>
@@ -1503,6 +1510,7 @@ _FILLED_DYNAMIC_GROUPS = """\
     title="Group 1"
     description="First Group"
     active="True"
+    request_only="True"
     />
 <group
     group_id="group_2"
@@ -1510,6 +1518,7 @@ _FILLED_DYNAMIC_GROUPS = """\
     title="Group 2"
     description="Second Group"
     active="False"
+    request_only="False"
     />
 </dynamic-groups>
 """
@@ -0,0 +1,162 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import unittest
+
+
+class FauxPlugin:
+
+    def fail(self):
+        raise KeyError('intentional')
+
+    def succeed(self):
+        return 'result'
+
+    def conflict(self):
+        from ZODB.POSException import ConflictError
+        raise ConflictError
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+
+        from ..CircuitBreaker import CircuitBreaker
+
+        return CircuitBreaker
+
+    def _makeOne(self, *args, **kw):
+
+        self.now = 0
+        return self._getTargetClass()(*args, clock=lambda: self.now, **kw)
+
+    def test_opens_after_threshold(self):
+
+        from ..CircuitBreaker import CLOSED
+        from ..CircuitBreaker import OPEN
+
+        breaker = self._makeOne(threshold=2, reset_timeout=10)
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 1))
+        self.assertTrue(breaker.allow())
+
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_failures(self):
+
+        breaker = self._makeOne(threshold=2)
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+        self.assertEqual(breaker.call(FauxPlugin(), 'succeed'), 'result')
+        self.assertEqual(breaker.failures, 0)
+
+    def test_half_open(self):
+
+        from ..CircuitBreaker import CLOSED
+        from ..CircuitBreaker import OPEN
+
+        breaker = self._makeOne(threshold=1, reset_timeout=10)
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+
+        self.now = 10
+        # A single trial call is let through
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        self.now = 20
+        self.assertTrue(breaker.allow())
+        breaker.call(FauxPlugin(), 'succeed')
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_lookup_error(self):
+
+        from ..CircuitBreaker import OPEN
+
+        breaker = self._makeOne(threshold=1, reset_timeout=10)
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+
+        self.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertRaises(AttributeError, breaker.call, FauxPlugin(),
+                          'missing')
+        self.assertEqual(breaker.state, OPEN)
+
+        # The failed trial does not block later ones
+        self.now = 20
+        self.assertTrue(breaker.allow())
+
+    def test_conflict_not_a_failure(self):
+
+        from ZODB.POSException import ConflictError
+
+        from ..CircuitBreaker import CLOSED
+
+        breaker = self._makeOne(threshold=1, exceptions=(KeyError,))
+        for i in range(3):
+            self.assertRaises(ConflictError, breaker.call, FauxPlugin(),
+                              'conflict')
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_conflict(self):
+
+        from ZODB.POSException import ConflictError
+
+        from ..CircuitBreaker import HALF_OPEN
+
+        breaker = self._makeOne(threshold=1, reset_timeout=10,
+                                exceptions=(KeyError,))
+        self.assertRaises(KeyError, breaker.call, FauxPlugin(), 'fail')
+
+        self.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertRaises(ConflictError, breaker.call, FauxPlugin(),
+                          'conflict')
+        # Neither closed nor opened again, but the next trial may go
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_dont_swallow_my_exceptions(self):
+
+        from ..CircuitBreaker import CLOSED
+
+        plugin = FauxPlugin()
+        plugin._dont_swallow_my_exceptions = True
+        breaker = self._makeOne(threshold=1)
+        self.assertRaises(KeyError, breaker.call, plugin, 'fail')
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+    def test_time_budget(self):
+
+        from ..CircuitBreaker import OPEN
+
+        breaker = self._makeOne(threshold=1, time_budget=0.5)
+        breaker.record(0.4)
+        self.assertTrue(breaker.allow())
+        breaker.record(0.6)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_reset(self):
+
+        from ..CircuitBreaker import CLOSED
+
+        breaker = self._makeOne(threshold=1)
+        breaker.record(0, failed=True)
+        breaker.reset()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
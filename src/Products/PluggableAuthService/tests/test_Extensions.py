@@ -14,6 +14,8 @@
 
 from io import StringIO
 
+from ZODB.POSException import ConflictError
+
 from ..PluggableAuthService import PluggableAuthService
 from ..tests import pastc
 
@@ -99,3 +101,136 @@ class UpgradeTests(pastc.PASTestCase):
             messages[1], 'Local role assignments have already been updated.',
         )
         self.assertEqual(len(messages), 2)
+
+    def _addOldUsers(self, count):
+        uf = self.app.acl_users
+        for i in range(count):
+            uf._doAddUser('user%d' % i, 'secret%d' % i, ['Editor'], [])
+
+    def _messages(self, response):
+        response.seek(0)
+        return response.read().splitlines()
+
+    def test_upgrade_userfolder_in_chunks(self):
+        from ..Extensions.upgrade import replace_acl_users
+
+        self._addOldUsers(5)
+
+        response = StringIO()
+        replace_acl_users(self.app, response, chunk_size=2)
+        messages = self._messages(response)
+        self.assertEqual([x.split(' (')[0] for x in messages[:3]],
+                         ['  -- 2 of 5 users done',
+                          '  -- 4 of 5 users done',
+                          '  -- 5 of 5 users done'])
+        self.assertEqual(
+            messages[3], 'Replaced root acl_users with PluggableAuthService')
+
+        uf = self.app.acl_users
+        self.assertIsInstance(uf, PluggableAuthService)
+        self.assertEqual(uf.users.authenticateCredentials(
+            {'login': 'user3', 'password': 'secret3'}), ('user3', 'user3'))
+        self.assertIn('Editor', uf.getUserById('user3').getRoles())
+        self.assertFalse(hasattr(self.app.aq_base, '_pas_migration'))
+
+    def test_upgrade_userfolder_resumes_changed_users(self):
+        from ..Extensions import upgrade
+
+        self._addOldUsers(5)
+        migrate = upgrade._migrateUsers
+
+        def failingMigrate(pas, old_acl, user_names, chunk_size):
+            if 'user3' in user_names:
+                raise ConflictError()
+            return migrate(pas, old_acl, user_names, chunk_size)
+
+        upgrade._migrateUsers = failingMigrate
+        try:
+            with self.assertRaises(ConflictError):
+                upgrade.replace_acl_users(self.app, StringIO(), chunk_size=2)
+        finally:
+            upgrade._migrateUsers = migrate
+
+        # Users are added and removed before resuming
+        old_acl = self.app.acl_users
+        old_acl._doAddUser('aaa', 'secret', ['Editor'], [])
+        old_acl._doDelUsers(['user0'])
+
+        upgrade.replace_acl_users(self.app, StringIO(), chunk_size=2)
+        uf = self.app.acl_users
+        self.assertEqual(sorted(uf.users.listUserIds()),
+                         ['aaa', 'user1', 'user2', 'user3', 'user4'])
+        self.assertIsNone(uf.getUserById('user0'))
+        self.assertNotIn('user0',
+                         [x[0] for x in
+                          uf.roles.listAssignedPrincipals('Editor')])
+        self.assertIn('Editor', uf.getUserById('aaa').getRoles())
+
+    def test_upgrade_userfolder_without_events(self):
+        from zope import event
+
+        from ..Extensions.upgrade import replace_acl_users
+
+        self._addOldUsers(2)
+        events = []
+        event.subscribers.append(events.append)
+        try:
+            replace_acl_users(self.app, StringIO())
+        finally:
+            event.subscribers.remove(events.append)
+
+        self.assertEqual([x for x in events
+                          if type(x).__name__ == 'PrincipalCreated'], [])
+
+    def test_upgrade_userfolder_resumes(self):
+        from ..Extensions import upgrade
+
+        self._addOldUsers(5)
+        old_acl = self.app.acl_users
+        migrate = upgrade._migrateUsers
+
+        def failingMigrate(pas, old_acl, user_names, chunk_size):
+            if 'user3' in user_names:
+                raise ConflictError()
+            return migrate(pas, old_acl, user_names, chunk_size)
+
+        upgrade._migrateUsers = failingMigrate
+        try:
+            with self.assertRaises(ConflictError):
+                upgrade.replace_acl_users(self.app, StringIO(), chunk_size=2)
+        finally:
+            upgrade._migrateUsers = migrate
+
+        self.assertIs(self.app.acl_users.aq_base, old_acl.aq_base)
+        new_acl = self.app._pas_migration['new_acl']
+        self.assertEqual(len(new_acl.users.listUserIds()), 2)
+
+        # Interrupt the walk of the objects, too
+        self.app.manage_addFolder('folder2')
+        translate = upgrade._translateLocalRoles
+
+        def failingTranslate(user_folder, obj, RESPONSE):
+            if obj.getId() == 'folder2':
+                raise ConflictError()
+            return translate(user_folder, obj, RESPONSE)
+
+        upgrade._translateLocalRoles = failingTranslate
+        response = StringIO()
+        try:
+            with self.assertRaises(ConflictError):
+                upgrade.replace_acl_users(self.app, response, chunk_size=2)
+        finally:
+            upgrade._translateLocalRoles = translate
+        self.assertEqual(self._messages(response)[0],
+                         'Resuming after 2 users')
+
+        self.assertIsInstance(self.app.acl_users, PluggableAuthService)
+        done = self.app._pas_migration['objects_done']
+
+        response = StringIO()
+        upgrade.replace_acl_users(self.app, response, chunk_size=2)
+        messages = self._messages(response)
+        self.assertEqual(messages[0], 'Already replaced this user folder')
+        self.assertEqual(messages[1], 'Resuming after %d objects' % done)
+        self.assertEqual(len(self.app.acl_users.users.listUserIds()), 5)
+        self.assertFalse(hasattr(self.app.aq_base, '_pas_migration'))
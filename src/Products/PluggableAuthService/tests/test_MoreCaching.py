@@ -43,6 +43,10 @@ class CachingTests(pastc.PASTestCase):
         self.assertEqual(report_item.get('misses'), misses)
         self.assertEqual(report_item.get('hits'), hits)
 
+    def newRequest(self):
+        # Repeated calls for the same request are served by its memo
+        self.pas._clearRequestMemo()
+
     def test__extractUserIds(self):
         request = self.app.REQUEST
         request._auth = pastc.user_auth
@@ -52,10 +56,12 @@ class CachingTests(pastc.PASTestCase):
         self.assertCacheStats(1, 1, 0)
 
         # Extract again, we should see a cache hit
+        self.newRequest()
         self.pas._extractUserIds(request, self.pas.plugins)
         self.assertCacheStats(1, 1, 1)
 
         # Extract yet again, we should see another hit
+        self.newRequest()
         self.pas._extractUserIds(request, self.pas.plugins)
         self.assertCacheStats(1, 1, 2)
 
@@ -73,10 +79,12 @@ class CachingTests(pastc.PASTestCase):
         self.assertCacheStats(2, 2, 0)
 
         # Extract again, we should see cache hits
+        self.newRequest()
         self.pas._extractUserIds(request, self.pas.plugins)
         self.assertCacheStats(2, 2, 2)
 
         # Extract yet again, we should see more hits
+        self.newRequest()
         self.pas._extractUserIds(request, self.pas.plugins)
         self.assertCacheStats(2, 2, 4)
 
@@ -142,9 +150,11 @@ class CachingTests(pastc.PASTestCase):
 
         self.assertCacheStats(2, 2, 0)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 2)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 4)
 
@@ -181,9 +191,11 @@ class CachingTests(pastc.PASTestCase):
 
         self.assertCacheStats(2, 2, 0)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 2)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 4)
 
@@ -208,9 +220,11 @@ class CachingTests(pastc.PASTestCase):
 
         self.assertCacheStats(2, 2, 0)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 2)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 4)
 
@@ -235,9 +249,11 @@ class CachingTests(pastc.PASTestCase):
 
         self.assertCacheStats(2, 2, 0)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 2)
 
+        self.newRequest()
         self.pas.validate(request)
         self.assertCacheStats(2, 2, 4)
 
@@ -307,3 +323,362 @@ class CachingTests(pastc.PASTestCase):
 
         groups.removePrincipalFromGroup(user_id, group_id)
         self.assertCacheStats(0, 0, 0)
+
+    def test_recursiveGroupsCacheFollowsMembership(self):
+        from ..interfaces.plugins import IGroupsPlugin
+        from ..PropertiedUser import PropertiedUser
+
+        factory = self.pas.manage_addProduct['PluggableAuthService']
+        factory.addZODBGroupManager('groups')
+        factory.addRecursiveGroupsPlugin('recursive_groups')
+        self.pas.plugins.activatePlugin(IGroupsPlugin, 'groups')
+        self.pas.plugins.activatePlugin(IGroupsPlugin, 'recursive_groups')
+        groups = self.pas.groups
+        rgp = self.pas.recursive_groups
+        rgp.ZCacheable_setManagerId('ram_cache')
+        for group_id in ('group1', 'group2', 'group3'):
+            groups.addGroup(group_id)
+        groups.addPrincipalToGroup('group1', 'group2')
+
+        user = PropertiedUser('user1')
+        user._addGroups(('group1',))
+
+        self.assertEqual(rgp.getGroupsForPrincipal(user),
+                         ('group1', 'group2'))
+        self.assertCacheStats(2, 2, 0)
+
+        self.assertEqual(rgp.getGroupsForPrincipal(user),
+                         ('group1', 'group2'))
+        self.assertCacheStats(2, 2, 2)
+
+        groups.addPrincipalToGroup('group2', 'group3')
+        self.assertCacheStats(0, 0, 0)
+        self.assertEqual(rgp.getGroupsForPrincipal(user),
+                         ('group1', 'group2', 'group3'))
+        self.assertCacheStats(3, 3, 0)
+
+        groups.removePrincipalFromGroup('group1', 'group2')
+        self.assertEqual(rgp.getGroupsForPrincipal(user), ('group1',))
+
+
+class PrincipalCacheTests(pastc.PASTestCase):
+
+    def afterSetUp(self):
+        self.pas = self.folder.acl_users
+        self.pas.principal_cache_size = 100
+        self.cache = self.pas._getPrincipalCache()
+
+    def beforeTearDown(self):
+        from ..PrincipalCache import _principal_caches
+        _principal_caches.clear()
+
+    def test_validate(self):
+        self.folder.manage_addDTMLMethod('doc', file='the document')
+        doc = self.folder.doc
+        doc.manage_permission(View, [pastc.user_role], acquire=False)
+        request = self.app.REQUEST
+        request['PUBLISHED'] = doc
+        request['PARENTS'] = [self.app, self.folder]
+        request.steps = list(doc.getPhysicalPath())
+        request._auth = pastc.user_auth
+
+        user = self.pas.validate(request)
+        self.assertEqual(user.getId(), pastc.user_name)
+        # _extractUserIds and _findUser
+        self.assertEqual(len(self.cache), 2)
+
+        user = self.pas.validate(request)
+        self.assertEqual(user.getId(), pastc.user_name)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_invalidating_principal_drops_all_its_entries(self):
+        user_id = 'test_user_2_'
+        self.pas._doAddUser(user_id, 'secret', [], [])
+        self.pas.getUser(pastc.user_name)
+        self.assertEqual(len(self.cache), 4)
+
+        user = self.pas.getUser(user_id)
+        self.assertEqual(user.getRoles(), ['Authenticated'])
+
+        self.pas.roles.assignRoleToPrincipal(pastc.user_role, user_id)
+        self.assertEqual(len(self.cache), 2)
+
+        user = self.pas.getUser(user_id)
+        self.assertEqual(sorted(user.getRoles()),
+                         ['Authenticated', pastc.user_role])
+
+    def _extract(self, login, password):
+        from ZPublisher.utils import basic_auth_encode
+        request = self.app.REQUEST
+        request._auth = basic_auth_encode(login, password)
+        return self.pas._extractUserIds(request, self.pas.plugins)
+
+    def test_removing_user_drops_its_entries(self):
+        self.assertEqual(len(self._extract(pastc.user_name,
+                                           pastc.user_password)), 1)
+        self.pas.getUserById(pastc.user_name)
+
+        self.pas.users.removeUser(pastc.user_name)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self._extract(pastc.user_name,
+                                       pastc.user_password), [])
+        self.assertIsNone(self.pas.getUserById(pastc.user_name))
+
+    def test_changing_password_drops_its_entries(self):
+        self.assertEqual(len(self._extract(pastc.user_name,
+                                           pastc.user_password)), 1)
+
+        self.pas.users.updateUserPassword(pastc.user_name, 'changed')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self._extract(pastc.user_name,
+                                       pastc.user_password), [])
+        self.assertEqual(len(self._extract(pastc.user_name, 'changed')), 1)
+
+    def test_changing_login_drops_its_entries(self):
+        user = self.pas.getUserById(pastc.user_name)
+        self.assertEqual(user.getUserName(), pastc.user_name)
+
+        self.pas.users.updateUser(pastc.user_name, 'changed')
+        self.assertEqual(len(self.cache), 0)
+        user = self.pas.getUserById(pastc.user_name)
+        self.assertEqual(user.getUserName(), 'changed')
+
+    def test_removing_role_drops_its_principals(self):
+        self.pas.roles.addRole('Other')
+        self.pas.roles.assignRoleToPrincipal('Other', pastc.user_name)
+        self.assertIn('Other',
+                      self.pas.getUserById(pastc.user_name).getRoles())
+
+        self.pas.roles.removeRole('Other')
+        self.assertNotIn('Other',
+                         self.pas.getUserById(pastc.user_name).getRoles())
+
+    def test_removing_group_drops_its_members(self):
+        groups = self._addGroups()
+        self.assertEqual(
+            sorted(self.pas.getUserById(pastc.user_name).getGroups()),
+            ['inner', 'outer'])
+
+        groups.removeGroup('inner')
+        self.assertEqual(self.pas.getUserById(pastc.user_name).getGroups(),
+                         [])
+
+    def _addGroups(self):
+        from ..interfaces.plugins import IGroupsPlugin
+
+        factory = self.pas.manage_addProduct['PluggableAuthService']
+        factory.addZODBGroupManager('groups')
+        factory.addRecursiveGroupsPlugin('recursive_groups')
+        self.pas.plugins.activatePlugin(IGroupsPlugin, 'groups')
+        self.pas.plugins.activatePlugin(IGroupsPlugin, 'recursive_groups')
+        self.pas._doAddUser('test_user_2_', 'secret', [], [])
+        groups = self.pas.groups
+        groups.addGroup('inner')
+        groups.addGroup('outer')
+        groups.addPrincipalToGroup('inner', 'outer')
+        groups.addPrincipalToGroup(pastc.user_name, 'inner')
+        return groups
+
+    def test_group_role_change_drops_members(self):
+        self._addGroups()
+        user = self.pas.getUserById(pastc.user_name)
+        self.assertEqual(sorted(user.getGroups()), ['inner', 'outer'])
+        self.pas.getUserById('test_user_2_')
+        self.assertEqual(len(self.cache), 5)
+
+        self.pas.roles.assignRoleToPrincipal(pastc.user_role, 'outer')
+        # Only the nested member's _findUser entry is gone
+        self.assertNotIn(b'_findUser-test_user_1_',
+                         [x[0] for x in self.cache._entries])
+        self.assertEqual(len(self.cache), 4)
+        self.assertIn(pastc.user_role,
+                      self.pas.getUserById(pastc.user_name).getRoles())
+
+    def test_nested_membership_change_drops_members(self):
+        groups = self._addGroups()
+        self.pas.getUserById(pastc.user_name)
+        self.pas.getUserById('test_user_2_')
+        self.assertEqual(len(self.cache), 5)
+
+        groups.addGroup('third')
+        groups.addPrincipalToGroup('inner', 'third')
+        self.assertEqual(len(self.cache), 4)
+        self.assertIn('third',
+                      self.pas.getUserById(pastc.user_name).getGroups())
+
+    def test_group_ancestors_cached_without_cache_manager(self):
+        groups = self._addGroups()
+        rgp = self.pas.recursive_groups
+        self.assertEqual(rgp._getAncestorsCache(), None)
+
+        rgp.ancestors_cache_size = 100
+        groups.addGroup('third')
+        groups.addPrincipalToGroup('outer', 'third')
+
+        rgp._getAncestors('inner')
+        cache = rgp._getAncestorsCache()
+        self.assertEqual(cache.get('inner'), ('outer', 'third'))
+        self.assertEqual(cache.get('outer'), None)
+
+        # The closure of 'inner' depends on all of its ancestors
+        groups.removePrincipalFromGroup('outer', 'third')
+        self.assertEqual(cache.get('inner'), None)
+        self.assertEqual(rgp._getAncestors('inner'), ('outer',))
+
+    def test__listTransitiveMembers(self):
+        self._addGroups()
+        self.assertEqual(sorted(self.pas._listTransitiveMembers('outer')),
+                         ['inner', 'outer', pastc.user_name])
+        self.assertEqual(self.pas._listTransitiveMembers('test_user_2_'),
+                         ['test_user_2_'])
+
+
+class NegativeCacheTests(pastc.PASTestCase):
+
+    def afterSetUp(self):
+        self.pas = self.folder.acl_users
+        self.pas.negative_cache_size = 100
+        self.cache = self.pas._getNegativeCache()
+
+    def beforeTearDown(self):
+        from ..PrincipalCache import _principal_caches
+        _principal_caches.clear()
+
+    def _extract(self, login, password):
+        from ZPublisher.utils import basic_auth_encode
+        request = self.app.REQUEST
+        request._auth = basic_auth_encode(login, password)
+        return self.pas._extractUserIds(request, self.pas.plugins)
+
+    def test_unknown_user_id(self):
+        self.assertIsNone(self.pas.getUserById('unknown'))
+        self.assertEqual(len(self.cache), 1)
+
+        calls = []
+        self.pas.users.enumerateUsers = lambda **kw: calls.append(kw)
+        self.assertIsNone(self.pas.getUserById('unknown'))
+        self.assertEqual(calls, [])
+        del self.pas.users.enumerateUsers
+
+        # New users are not locked out
+        self.pas._doAddUser('unknown', 'secret', [], [])
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.pas.getUserById('unknown').getId(), 'unknown')
+
+    def test_failed_authentication(self):
+        self.assertEqual(self._extract(pastc.user_name, 'wrong'), [])
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self._extract(pastc.user_name, 'wrong'), [])
+
+        # Other credentials are still checked
+        self.assertEqual(len(self._extract(pastc.user_name,
+                                           pastc.user_password)), 1)
+
+        self.pas.users.updateUserPassword(pastc.user_name, 'wrong')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(len(self._extract(pastc.user_name, 'wrong')), 1)
+
+    def test_plugin_errors_are_not_cached(self):
+        def enumerateUsers(**kw):
+            raise ValueError()
+        self.pas.users.enumerateUsers = enumerateUsers
+        self.assertIsNone(self.pas.getUserById('unknown'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_disabled(self):
+        self.pas.negative_cache_size = 0
+        self.assertIsNone(self.pas._getNegativeCache())
+        self.assertIsNone(self.pas.getUserById('unknown'))
+
+
+class RequestMemoTests(pastc.PASTestCase):
+
+    def afterSetUp(self):
+        self.pas = self.folder.acl_users
+        self.folder.manage_addDTMLMethod('doc', file='the document')
+        self.doc = self.folder.doc
+        self.doc.manage_permission(View, [pastc.user_role], acquire=False)
+        self.request = request = self.app.REQUEST
+        request['PUBLISHED'] = self.doc
+        request['PARENTS'] = [self.app, self.folder]
+        request.steps = list(self.doc.getPhysicalPath())
+        request._auth = pastc.user_auth
+
+    def _countCalls(self, plugin, name):
+        calls = []
+        method = getattr(plugin, name)
+
+        def counted(*args, **kw):
+            calls.append(args)
+            return method(*args, **kw)
+
+        setattr(plugin, name, counted)
+        return calls
+
+    def test_validate(self):
+        authenticated = self._countCalls(self.pas.users,
+                                         'authenticateCredentials')
+        decorated = self._countCalls(self.pas.roles, 'getRolesForPrincipal')
+
+        first = self.pas.validate(self.request)
+        second = self.pas.validate(self.request)
+
+        self.assertEqual(first.getId(), pastc.user_name)
+        self.assertEqual(second.getId(), pastc.user_name)
+        self.assertIsNot(first, second)
+        self.assertEqual(len(authenticated), 1)
+        self.assertEqual(len(decorated), 1)
+
+    def test_failed_authentication(self):
+        from ZPublisher.utils import basic_auth_encode
+        self.request._auth = basic_auth_encode(pastc.user_name, 'wrong')
+        authenticated = self._countCalls(self.pas.users,
+                                         'authenticateCredentials')
+
+        self.assertEqual(self.pas._extractUserIds(self.request,
+                                                  self.pas.plugins), [])
+        self.assertEqual(self.pas._extractUserIds(self.request,
+                                                  self.pas.plugins), [])
+        self.assertEqual(len(authenticated), 1)
+
+    def test_memo_per_user_folder(self):
+        from ..interfaces.plugins import IAuthenticationPlugin
+        from ..interfaces.plugins import IExtractionPlugin
+        self.folder.manage_addFolder('sub')
+        sub = self.folder.sub
+        factory = sub.manage_addProduct['PluggableAuthService']
+        factory.addPluggableAuthService()
+        inner = sub.acl_users
+        factory = inner.manage_addProduct['PluggableAuthService']
+        factory.addHTTPBasicAuthHelper('http_auth')
+        factory.addZODBUserManager('users')
+        inner.plugins.activatePlugin(IExtractionPlugin, 'http_auth')
+        inner.plugins.activatePlugin(IAuthenticationPlugin, 'users')
+
+        self.assertEqual(len(self.pas._extractUserIds(self.request,
+                                                      self.pas.plugins)), 1)
+        self.assertEqual(inner._extractUserIds(self.request,
+                                               inner.plugins), [])
+
+    def test_invalidation(self):
+        user = self.pas.validate(self.request)
+        self.assertEqual(set(user.getRoles()),
+                         {'Authenticated', pastc.user_role})
+
+        self.pas.roles.addRole('Other')
+        self.pas.roles.assignRoleToPrincipal('Other', pastc.user_name)
+
+        user = self.pas.validate(self.request)
+        self.assertEqual(set(user.getRoles()),
+                         {'Authenticated', pastc.user_role, 'Other'})
+
+    def test_request_keys(self):
+        self.pas.validate(self.request)
+
+        self.assertIn('_pas_memo:%s' % '/'.join(self.pas.getPhysicalPath()),
+                      self.request.keys())
+        self.assertTrue(str(self.request))
+        self.assertTrue(self.request.text())
+
+    def test_request_without_memo(self):
+        self.assertEqual(self.pas._getRequestMemo(None), {})
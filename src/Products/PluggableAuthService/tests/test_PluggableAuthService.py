@@ -12,6 +12,9 @@
 #
 ##############################################################################
 
+import gc
+import threading
+import time
 import unittest
 
 from AccessControl.SecurityManagement import newSecurityManager
@@ -132,6 +135,34 @@ class WantonUserEnumerator(DummyMultiUserEnumerator):
         return self.users
 
 
+class DummySortedUserEnumerator(DummyMultiUserEnumerator):
+
+    sorted_enumeration = True
+
+    def enumerateUsers(self, sort_by=None, max_results=None, **kw):
+        # Lazily yield the users, which are already sorted by login.
+        self.criteria = (sort_by, max_results)
+        self.consumed = 0
+        for info in self.users[:max_results]:
+            self.consumed += 1
+            yield info
+
+
+class DummyConcurrentUserEnumerator(DummyMultiUserEnumerator):
+
+    concurrent_enumeration = True
+
+    def __init__(self, pluginid, *users):
+        super().__init__(pluginid, *users)
+        self.release = threading.Event()
+        self.release.set()
+
+    def enumerateUsers(self, **kw):
+        self.thread = threading.current_thread()
+        self.release.wait()
+        return self.users
+
+
 class DummyGroupEnumerator(DummyPlugin):
 
     def __init__(self, group_id):
@@ -178,6 +209,31 @@ class DummyGroupPlugin(DummyPlugin):
         return self._groups
 
 
+class DummyBatchPlugin(DummyPlugin):
+
+    def __init__(self, *user_ids):
+
+        self.user_ids = user_ids
+        self.calls = []
+
+    def enumerateUsers(self, id=(), exact_match=False, **kw):
+
+        self.calls.append(('enumerateUsers', id))
+        return tuple({'id': x, 'login': x, 'pluginid': 'batch'}
+                     for x in id if x in self.user_ids)
+
+    def getRolesForPrincipals(self, principals, request=None):
+
+        self.calls.append(('getRolesForPrincipals',
+                           [x.getId() for x in principals]))
+        return [('Role_%s' % x.getId(),) for x in principals]
+
+    def getRolesForPrincipal(self, principal, request=None):
+
+        self.calls.append(('getRolesForPrincipal', principal.getId()))
+        return ('Role_%s' % principal.getId(),)
+
+
 class DummyChallenger(DummyPlugin):
 
     def __init__(self, id):
@@ -418,6 +474,18 @@ class FauxUser(Implicit):
         return '<FauxUser: %s>' % self._id
 
 
+def _waitFor(condition, timeout=5.0):
+    # Pool threads finish on their own time
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+
+    return True
+
+
 def _extractLogin(request):
 
     return {'login': request['form'].get('login'),
@@ -1041,6 +1109,85 @@ class PluggableAuthServiceTests(unittest.TestCase, IUserFolder_conformance,
         finally:
             PluggableAuthService.emergency_user = old_eu
 
+    def test__listPlugins_reuses_resolved_plugins(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        plugins = zcuf._getOb('plugins')  # acquisition wrap
+
+        zcuf._setObject('foo', self._makeUserEnumerator('foo'))
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+
+        first = zcuf._listPlugins(plugins, IUserEnumerationPlugin)
+        self.assertEqual([x[0] for x in first], ['foo'])
+        self.assertTrue(aq_base(first[0][1]) is aq_base(zcuf.foo))
+
+        def _boom(plugin_type):
+            raise AssertionError('pipeline was not reused')
+
+        plugins.listPlugins = _boom
+        second = zcuf._listPlugins(plugins, IUserEnumerationPlugin)
+        self.assertEqual([x[0] for x in second], ['foo'])
+        self.assertTrue(aq_base(second[0][1]) is aq_base(zcuf.foo))
+
+    def test__listPlugins_after_registry_change(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        plugins = zcuf._getOb('plugins')  # acquisition wrap
+
+        zcuf._setObject('foo', self._makeUserEnumerator('foo'))
+        zcuf._setObject('bar', self._makeUserEnumerator('bar'))
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+        self.assertEqual(
+            [x[0] for x in zcuf._listPlugins(plugins,
+                                             IUserEnumerationPlugin)],
+            ['foo'])
+
+        plugins.activatePlugin(IUserEnumerationPlugin, 'bar')
+        self.assertEqual(
+            [x[0] for x in zcuf._listPlugins(plugins,
+                                             IUserEnumerationPlugin)],
+            ['foo', 'bar'])
+
+        plugins.movePluginsUp(IUserEnumerationPlugin, ['bar'])
+        self.assertEqual(
+            [x[0] for x in zcuf._listPlugins(plugins,
+                                             IUserEnumerationPlugin)],
+            ['bar', 'foo'])
+
+        plugins.deactivatePlugin(IUserEnumerationPlugin, 'foo')
+        self.assertEqual(
+            [x[0] for x in zcuf._listPlugins(plugins,
+                                             IUserEnumerationPlugin)],
+            ['bar'])
+
+    def test__listPlugins_after_replacing_plugin(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        plugins = zcuf._getOb('plugins')  # acquisition wrap
+
+        zcuf._setObject('foo', self._makeUserEnumerator('foo'))
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+        zcuf._listPlugins(plugins, IUserEnumerationPlugin)
+
+        zcuf._delObject('foo')
+        self.assertEqual(zcuf._listPlugins(plugins, IUserEnumerationPlugin),
+                         [])
+
+        replacement = self._makeUserEnumerator('foo')
+        zcuf._setObject('foo', replacement)
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+        result = zcuf._listPlugins(plugins, IUserEnumerationPlugin)
+        self.assertTrue(aq_base(result[0][1]) is replacement)
+
     def _isNotCompetent_test(self, decisions, result):
         from ..interfaces.plugins import INotCompetentPlugin
 
@@ -1829,6 +1976,66 @@ class PluggableAuthServiceTests(unittest.TestCase, IUserFolder_conformance,
         self.assertEqual(user3.getId(), 'bar/bar')
         self.assertEqual(user3.getUserName(), 'bar@example.com')
 
+    def test_getUsersByIds(self):
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+
+        foo = self._makeUserEnumerator('foo')
+        zcuf._setObject('foo', foo)
+
+        bar = self._makeUserEnumerator('bar', 'bar@example.com')
+        zcuf._setObject('bar', bar)
+
+        plugins = zcuf._getOb('plugins')
+
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'bar')
+
+        users = zcuf.getUsersByIds(['bar', 'unknown', 'foo', 'bar'])
+        self.assertEqual([x.getId() for x in users], ['bar', 'foo'])
+        self.assertEqual(users[0].getUserName(), 'bar@example.com')
+        self.assertEqual(zcuf.getUsersByIds([]), [])
+
+    def test_getUsersByIds_batch_plugins(self):
+        from ..interfaces.plugins import IGroupsPlugin
+        from ..interfaces.plugins import IRolesPlugin
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+
+        batch = DummyBatchPlugin('foo', 'bar')
+        directlyProvides(batch, IUserEnumerationPlugin, IRolesPlugin)
+        zcuf._setObject('batch', batch)
+
+        groups = self._makeGroupPlugin('groups', ('Group A',))
+        zcuf._setObject('groups', groups)
+
+        plugins = zcuf._getOb('plugins')
+
+        plugins.activatePlugin(IUserEnumerationPlugin, 'batch')
+        plugins.activatePlugin(IRolesPlugin, 'batch')
+        plugins.activatePlugin(IGroupsPlugin, 'groups')
+
+        foo, bar = zcuf.getUsersByIds(['foo', 'bar', 'baz'])
+        self.assertEqual(batch.calls,
+                         [('enumerateUsers', ['foo', 'bar', 'baz']),
+                          ('getRolesForPrincipals', ['foo', 'bar'])])
+        self.assertEqual(sorted(foo.getRoles()),
+                         ['Authenticated', 'Role_foo'])
+        self.assertEqual(sorted(bar.getRoles()),
+                         ['Authenticated', 'Role_bar'])
+        self.assertEqual(bar.getGroups(), ['Group A'])
+
+        # A single user is decorated with the usual calls
+        batch.calls = []
+        foo, = zcuf.getUsersByIds(['foo'])
+        self.assertEqual(batch.calls,
+                         [('enumerateUsers', ['foo']),
+                          ('getRolesForPrincipal', 'foo')])
+
     def test_simple_getUserGroups_with_Groupplugin(self):
 
         from ..interfaces.plugins import IGroupsPlugin
@@ -2306,6 +2513,282 @@ class PluggableAuthServiceTests(unittest.TestCase, IUserFolder_conformance,
         expected = zcuf.searchUsers(name=('Foo', 'Bar', 'Zope'))
         self.assertEqual(len(expected), 2)
 
+    def _makeSortedUserEnumerator(self, pluginid, *logins):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        users = [{'id': x.lower(), 'login': x} for x in logins]
+        enumerator = DummySortedUserEnumerator(pluginid, *users)
+        directlyProvides(enumerator, IUserEnumerationPlugin)
+
+        return enumerator
+
+    def test_searchUsers_sort_by_and_max_results(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+
+        unsorted = self._makeMultiUserEnumerator(
+            {'id': 'zz', 'login': 'Zz'}, {'id': 'bb', 'login': 'bb'})
+        zcuf._setObject('unsorted', unsorted)
+        presorted = self._makeSortedUserEnumerator('presorted',
+                                                   'Aa', 'cc', 'Dd', 'ee')
+        zcuf._setObject('presorted', presorted)
+
+        plugins = zcuf._getOb('plugins')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'unsorted')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'presorted')
+
+        result = zcuf.searchUsers(sort_by='login', max_results=3)
+        self.assertEqual([x['id'] for x in result], ['aa', 'bb', 'cc'])
+        self.assertEqual(result[0]['userid'], 'aa')
+        self.assertEqual(result[0]['principal_type'], 'user')
+        self.assertEqual(presorted.criteria, ('login', 3))
+
+        result = zcuf.searchUsers(sort_by='login')
+        self.assertEqual([x['id'] for x in result],
+                         ['aa', 'bb', 'cc', 'dd', 'ee', 'zz'])
+        self.assertEqual(presorted.criteria, ('login', None))
+
+        # Without sorting, enumerators are only consumed as far as needed.
+        result = zcuf.searchUsers(max_results=3)
+        self.assertEqual([x['id'] for x in result], ['zz', 'bb', 'aa'])
+        self.assertEqual(presorted.consumed, 1)
+
+        result = zcuf.searchUsers(max_results='invalid')
+        self.assertEqual(len(result), 6)
+
+    def test_searchUsers_broken_lazy_enumerator(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+
+        presorted = self._makeSortedUserEnumerator('presorted', 'aa', 'bb')
+        presorted.users = presorted.users + ({'login': 'no id'},)
+        zcuf._setObject('presorted', presorted)
+
+        plugins = zcuf._getOb('plugins')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'presorted')
+
+        result = zcuf.searchUsers(sort_by='login')
+        self.assertEqual([x['id'] for x in result], ['aa', 'bb'])
+
+    def test_searchUsers_concurrent(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+
+        slow = DummyConcurrentUserEnumerator('slow', {'id': 'cc',
+                                                      'login': 'cc'})
+        directlyProvides(slow, IUserEnumerationPlugin)
+        zcuf._setObject('slow', slow)
+        serial = self._makeMultiUserEnumerator({'id': 'bb', 'login': 'bb'})
+        zcuf._setObject('serial', serial)
+        fast = DummyConcurrentUserEnumerator('fast', {'id': 'aa',
+                                                      'login': 'aa'})
+        directlyProvides(fast, IUserEnumerationPlugin)
+        zcuf._setObject('fast', fast)
+
+        plugins = zcuf._getOb('plugins')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'slow')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'serial')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'fast')
+
+        # Sequential by default
+        result = zcuf.searchUsers()
+        self.assertEqual([x['id'] for x in result], ['cc', 'bb', 'aa'])
+        self.assertIs(slow.thread, threading.current_thread())
+
+        zcuf.enumeration_timeout = 10.0
+        result = zcuf.searchUsers(sort_by='login')
+        self.assertEqual([x['id'] for x in result], ['aa', 'bb', 'cc'])
+        self.assertIsNot(slow.thread, threading.current_thread())
+
+        # Plugins not done in time are left out
+        zcuf.enumeration_timeout = 0.01
+        slow.release.clear()
+        try:
+            with self.assertLogs('PluggableAuthService', 'WARNING') as log:
+                result = zcuf.searchUsers()
+        finally:
+            slow.release.set()
+        self.assertEqual([x['id'] for x in result], ['bb', 'aa'])
+        self.assertIn('slow timed out', log.output[0])
+
+    def test_searchUsers_concurrent_plugin_call_only(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        zcuf.enumeration_timeout = 10.0
+        zcuf.breaker_threshold = 2
+
+        fast = DummyConcurrentUserEnumerator('fast', {'id': 'aa',
+                                                      'login': 'aa'})
+        directlyProvides(fast, IUserEnumerationPlugin)
+        zcuf._setObject('fast', fast)
+        broken = DummyConcurrentUserEnumerator('broken')
+        broken.enumerateUsers = lambda **kw: {}['intentional']
+        directlyProvides(broken, IUserEnumerationPlugin)
+        zcuf._setObject('broken', broken)
+
+        plugins = zcuf._getOb('plugins')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'fast')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'broken')
+
+        threads = []
+        getCircuitBreaker = zcuf._getCircuitBreaker
+
+        def _getCircuitBreaker(*args):
+            threads.append(threading.current_thread())
+            return getCircuitBreaker(*args)
+
+        zcuf._getCircuitBreaker = _getCircuitBreaker
+
+        result = zcuf.searchUsers()
+        self.assertEqual([x['id'] for x in result], ['aa'])
+        self.assertIsNot(fast.thread, threading.current_thread())
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+        states = zcuf.getCircuitBreakerStates()
+        self.assertEqual([(x['plugin_id'], x['failures']) for x in states],
+                         [('broken', 1), ('fast', 0)])
+
+    def test_searchUsers_concurrent_timeouts_open_breaker(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        zcuf.enumeration_timeout = 0.01
+        zcuf.breaker_threshold = 2
+
+        slow = DummyConcurrentUserEnumerator('slow', {'id': 'cc',
+                                                      'login': 'cc'})
+        directlyProvides(slow, IUserEnumerationPlugin)
+        zcuf._setObject('slow', slow)
+        zcuf._getOb('plugins').activatePlugin(IUserEnumerationPlugin,
+                                              'slow')
+        breaker = zcuf._getCircuitBreaker('slow', slow)
+
+        for i in range(2):
+            slow.release.clear()
+            try:
+                with self.assertLogs('PluggableAuthService', 'WARNING'):
+                    self.assertFalse(zcuf.searchUsers())
+            finally:
+                # The call ends after the deadline, without an error
+                slow.release.set()
+            self.assertTrue(_waitFor(lambda: breaker.failures == i + 1))
+
+        self.assertEqual(breaker.state, 'open')
+        slow.thread = None
+        self.assertFalse(zcuf.searchUsers())
+        self.assertIsNone(slow.thread)
+
+    def test_circuit_breaker(self):
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        zcuf.breaker_threshold = 2
+
+        calls = []
+
+        def enumerateUsers(**kw):
+            calls.append(kw)
+            raise KeyError('intentional KeyError from enumerateUsers')
+
+        broken = self._makeUserEnumerator('broken')
+        broken.enumerateUsers = enumerateUsers
+        zcuf._setObject('broken', broken)
+        zcuf._setObject('foo', self._makeUserEnumerator('foo'))
+
+        plugins = zcuf._getOb('plugins')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'broken')
+        plugins.activatePlugin(IUserEnumerationPlugin, 'foo')
+
+        for i in range(3):
+            self.assertEqual(zcuf.getUserById('foo').getId(), 'foo')
+        self.assertEqual(len(calls), 2)
+
+        states = zcuf.getCircuitBreakerStates()
+        self.assertEqual([(x['plugin_id'], x['state'], x['failures'])
+                          for x in states],
+                         [('broken', 'open', 2), ('foo', 'closed', 0)])
+
+        zcuf.searchUsers(id='foo')
+        self.assertEqual(len(calls), 2)
+
+        zcuf.resetCircuitBreakers()
+        self.assertEqual(zcuf.getCircuitBreakerStates(), [])
+        zcuf.getUserById('foo')
+        self.assertEqual(len(calls), 3)
+
+    def test_circuit_breaker_ignores_conflicts(self):
+
+        from ZODB.POSException import ConflictError
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        plugins = self._makePlugins()
+        zcuf = self._makeOne(plugins)
+        zcuf.breaker_threshold = 1
+
+        def enumerateUsers(**kw):
+            raise ConflictError
+
+        conflicting = self._makeUserEnumerator('conflicting')
+        conflicting.enumerateUsers = enumerateUsers
+        zcuf._setObject('conflicting', conflicting)
+        zcuf._getOb('plugins').activatePlugin(IUserEnumerationPlugin,
+                                              'conflicting')
+
+        for i in range(3):
+            self.assertRaises(ConflictError, zcuf.searchUsers, id='foo')
+
+        states = zcuf.getCircuitBreakerStates()
+        self.assertEqual([(x['plugin_id'], x['state'], x['failures'])
+                          for x in states],
+                         [('conflicting', 'closed', 0)])
+
+    def test_unpersisted_process_state_is_dropped(self):
+
+        from ..CircuitBreaker import _circuit_breakers
+        from ..PluginStatistics import _plugin_statistics
+        from ..PrincipalCache import _principal_caches
+
+        from ..interfaces.plugins import IUserEnumerationPlugin
+
+        zcuf = self._makeOne(self._makePlugins())
+        zcuf.principal_cache_size = zcuf.negative_cache_size = 10
+        zcuf.breaker_threshold = 2
+        zcuf._setObject('foo', self._makeUserEnumerator('foo'))
+        zcuf._getOb('plugins').activatePlugin(IUserEnumerationPlugin, 'foo')
+        zcuf.getUserById('bar')
+        zcuf.getPluginStatistics()
+        key = zcuf._getPrincipalCacheKey()
+
+        self.assertIn(key, _principal_caches)
+        self.assertIn(key + ('negative',), _principal_caches)
+        self.assertIn(key, _plugin_statistics)
+        self.assertIn(key, _circuit_breakers)
+
+        del zcuf
+        gc.collect()
+        self.assertNotIn(key, _principal_caches)
+        self.assertNotIn(key + ('negative',), _principal_caches)
+        self.assertNotIn(key, _plugin_statistics)
+        self.assertNotIn(key, _circuit_breakers)
+
     def test_searchGroups(self):
 
         from ..interfaces.plugins import IGroupEnumerationPlugin
@@ -0,0 +1,122 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import unittest
+
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SpecialUsers import system
+
+from ..interfaces.plugins import IRolesPlugin
+from . import pastc
+
+
+class FauxRolesPlugin:
+
+    prefix = 'faux'
+
+    def getRolesForPrincipal(self, principal, request=None):
+        if principal is None:
+            raise KeyError(principal)
+        return ('Role',)
+
+
+class PluginStatisticsTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+
+        from ..PluginStatistics import PluginStatistics
+
+        return PluginStatistics
+
+    def _makeOne(self, *args, **kw):
+
+        return self._getTargetClass()(*args, **kw)
+
+    def test_conformance_IPluginStatistics(self):
+
+        from zope.interface.verify import verifyClass
+
+        from ..interfaces.authservice import IPluginStatistics
+
+        verifyClass(IPluginStatistics, self._getTargetClass())
+
+    def test_record_report_reset(self):
+
+        statistics = self._makeOne()
+        key = ('roles', 'IRolesPlugin')
+        statistics.record(key, 0.002)
+        statistics.record(key, 0.004, failed=True)
+        statistics.record(key, 2.0)
+
+        entry, = statistics.report()
+        self.assertEqual(entry['plugin_id'], 'roles')
+        self.assertEqual(entry['interface'], 'IRolesPlugin')
+        self.assertEqual(entry['calls'], 3)
+        self.assertEqual(entry['errors'], 1)
+        self.assertAlmostEqual(entry['total'], 2.006)
+        self.assertAlmostEqual(entry['mean'], 2.006 / 3)
+        self.assertEqual(entry['max'], 2.0)
+        self.assertEqual(entry['histogram'], [0, 0, 0, 2, 0, 0, 0, 0, 0, 1])
+
+        statistics.reset()
+        self.assertEqual(statistics.report(), [])
+
+    def test_instrument(self):
+
+        now = [0]
+        statistics = self._makeOne(clock=lambda: now[0])
+        plugin = statistics.instrument('roles', FauxRolesPlugin(),
+                                       IRolesPlugin)
+
+        self.assertEqual(plugin.prefix, 'faux')
+        self.assertEqual(plugin.getRolesForPrincipal('user'), ('Role',))
+        self.assertRaises(KeyError, plugin.getRolesForPrincipal, None)
+
+        entry, = statistics.report()
+        self.assertEqual(entry['interface'], IRolesPlugin.__identifier__)
+        self.assertEqual((entry['calls'], entry['errors']), (2, 1))
+
+
+class PASPluginStatisticsTests(pastc.PASTestCase):
+
+    def afterSetUp(self):
+        self.pas = self.folder.acl_users
+
+    def beforeTearDown(self):
+        self.pas.resetPluginStatistics()
+        self.pas.resetCircuitBreakers()
+
+    def test_disabled(self):
+        self.pas.getUserById(pastc.user_name)
+        self.assertEqual(self.pas.getPluginStatistics(), [])
+
+    def test_enabled(self):
+        self.pas.instrument_plugins = True
+        self.pas.getUserById(pastc.user_name)
+        self.pas.getUserById('unknown')
+
+        calls = {(x['plugin_id'], x['interface'].split('.')[-1]): x['calls']
+                 for x in self.pas.getPluginStatistics()}
+        self.assertEqual(calls, {('users', 'IUserEnumerationPlugin'): 2,
+                                 ('roles', 'IRolesPlugin'): 1})
+        self.pas.resetPluginStatistics()
+
+        self.pas.breaker_threshold = 5
+        self.pas.getUserById(pastc.user_name)
+        newSecurityManager(None, system)
+        page = self.pas.manage_pluginStatistics()
+        self.assertIn('IUserEnumerationPlugin', page)
+        self.assertIn('closed', page)
+
+        self.pas.resetPluginStatistics()
+        self.assertEqual(self.pas.getPluginStatistics(), [])
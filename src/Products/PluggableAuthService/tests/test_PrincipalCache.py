@@ -0,0 +1,169 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import unittest
+
+
+class PrincipalCacheTests(unittest.TestCase):
+
+    def _getTargetClass(self):
+
+        from ..PrincipalCache import PrincipalCache
+
+        return PrincipalCache
+
+    def _makeOne(self, *args, **kw):
+
+        return self._getTargetClass()(*args, **kw)
+
+    def test_conformance_IPrincipalCache(self):
+
+        from zope.interface.verify import verifyClass
+
+        from ..interfaces.authservice import IPrincipalCache
+
+        verifyClass(IPrincipalCache, self._getTargetClass())
+
+    def test_get_set(self):
+
+        cache = self._makeOne()
+
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('key', 'default'), 'default')
+
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+
+        cache.set('key', 'other')
+        self.assertEqual(cache.get('key'), 'other')
+        self.assertEqual(len(cache), 1)
+
+    def test_ttl(self):
+
+        now = [0]
+        cache = self._makeOne(ttl=10, clock=lambda: now[0])
+        cache.set('default', 'value')
+        cache.set('own', 'value', ttl=20)
+
+        now[0] = 9
+        self.assertEqual(cache.get('default'), 'value')
+
+        now[0] = 10
+        self.assertIsNone(cache.get('default'))
+        self.assertEqual(cache.get('own'), 'value')
+        self.assertEqual(len(cache), 1)
+
+    def test_lru(self):
+
+        cache = self._makeOne(max_entries=2)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+        cache.set('third', 3)
+
+        self.assertEqual(cache.get('first'), 1)
+        self.assertIsNone(cache.get('second'))
+        self.assertEqual(cache.get('third'), 3)
+
+    def test_invalidateTags(self):
+
+        from ..PrincipalCache import principalTag
+
+        cache = self._makeOne()
+        cache.set('user', 1, tags=[principalTag('user')])
+        cache.set('both', 2, tags=[principalTag('user'), principalTag('grp')])
+        cache.set('group', 3, tags=[principalTag('grp')])
+        cache.set('untagged', 4)
+
+        cache.invalidateTags([principalTag('user')])
+
+        self.assertIsNone(cache.get('user'))
+        self.assertIsNone(cache.get('both'))
+        self.assertEqual(cache.get('group'), 3)
+        self.assertEqual(cache.get('untagged'), 4)
+
+        cache.invalidateTags([principalTag('grp')])
+        self.assertIsNone(cache.get('group'))
+        self.assertEqual(cache._tagged, {})
+
+    def test_invalidate_and_clear(self):
+
+        cache = self._makeOne()
+        cache.set('one', 1, tags=['tag'])
+        cache.set('two', 2, tags=['tag'])
+
+        cache.invalidate('one')
+        self.assertIsNone(cache.get('one'))
+        self.assertEqual(cache.get('two'), 2)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache._tagged, {})
+
+
+class GetPrincipalCacheTests(unittest.TestCase):
+
+    def tearDown(self):
+
+        from ..PrincipalCache import _principal_caches
+
+        _principal_caches.clear()
+
+    def test_shared_and_reconfigured(self):
+
+        from ..PrincipalCache import getPrincipalCache
+
+        cache = getPrincipalCache('key', 10, 60)
+        self.assertIs(getPrincipalCache('key', 20, 30), cache)
+        self.assertEqual(cache.max_entries, 20)
+        self.assertEqual(cache.ttl, 30)
+        self.assertIsNot(getPrincipalCache('other', 10, 60), cache)
+
+    def _invalidateAndRecache(self):
+
+        from ..PrincipalCache import getPrincipalCache
+        from ..PrincipalCache import invalidatePrincipalCaches
+
+        cache = getPrincipalCache(('key', 'ancestors'), 10, 60)
+        cache.set('a', 1, tags=['tag'])
+        cache.set('b', 2, tags=['other'])
+
+        invalidatePrincipalCaches(('key',), ['tag'])
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+
+        # A thread still reading the former state caches it again
+        cache.set('a', 1, tags=['tag'])
+
+        return cache
+
+    def test_invalidatePrincipalCaches_after_commit(self):
+
+        import transaction
+
+        transaction.begin()
+        cache = self._invalidateAndRecache()
+        transaction.commit()
+
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), 2)
+
+    def test_invalidatePrincipalCaches_after_abort(self):
+
+        import transaction
+
+        transaction.begin()
+        cache = self._invalidateAndRecache()
+        transaction.abort()
+
+        self.assertEqual(cache.get('a'), None)
@@ -15,6 +15,7 @@ import unittest
 
 from Acquisition import Implicit
 
+from ..PropertiedUser import PropertiedUser
 from .conformance import IBasicUser_conformance
 from .conformance import IPropertiedUser_conformance
 
@@ -33,6 +34,10 @@ class FauxProtected(Implicit):
         self.__ac_local_roles__ = local_roles
 
 
+class DerivedUser(PropertiedUser):
+    pass
+
+
 class PropertiedUserTests(unittest.TestCase, IBasicUser_conformance,
                           IPropertiedUser_conformance):
 
@@ -173,6 +178,25 @@ class PropertiedUserTests(unittest.TestCase, IBasicUser_conformance,
         self.assertEqual(len(local_roles), 1)
         self.assertIn('Manager', local_roles)
 
+    def test_getRolesInContext_callable_in_chain_order(self):
+
+        user = self._makeOne()
+        user._addGroups(('Group A',))
+        user._addRoles(('Role 1',))
+
+        faux_root = FauxProtected({'Group A': ('Owner', 'Reviewer')})
+        faux_container = FauxProtected().__of__(faux_root)
+        faux_container.__ac_local_roles__ = lambda: {'testing': ('Editor',),
+                                                     'Group A': ('Owner',)}
+        faux_contained = FauxProtected({'testing': ('Reader',)})
+        faux_contained = faux_contained.__of__(faux_container)
+
+        self.assertEqual(user.getRolesInContext(faux_contained),
+                         ['Role 1', 'Reader', 'Editor', 'Owner', 'Reviewer'])
+        self.assertTrue(user.allowed(faux_contained, ('Reviewer',)))
+        self.assertTrue(user.allowed(faux_contained, ('Editor', 'Other')))
+        self.assertIsNone(user.allowed(faux_contained, ('Other',)))
+
     def test_getRolesInContext_weslayan(self):
 
         # Test "methodish" checks.
@@ -273,3 +297,31 @@ class PropertiedUserTests(unittest.TestCase, IBasicUser_conformance,
         faux_self = FauxProtected({'Group A': ('Manager',)})
 
         self.assertTrue(user.allowed(faux_self.method, ('Manager',)))
+
+    def test__CompactUser_restore(self):
+        import pickle
+
+        from ..PropertiedUser import _CompactUser
+
+        user = DerivedUser('testing', 'login')
+        user._addRoles(('Role 1', 'Role 2'))
+        user._addGroups(('Group A',))
+        user.addPropertysheet('sheet', {'email': 'testing@example.com'})
+        user._extra_attribute = 'extra'
+
+        compact = pickle.loads(pickle.dumps(_CompactUser(user), 5))
+        restored = compact.restore()
+
+        self.assertIsInstance(restored, DerivedUser)
+        self.assertIsNot(restored, user)
+        self.assertEqual(restored.getId(), 'testing')
+        self.assertEqual(restored.getUserName(), 'login')
+        self.assertEqual(restored.getRoles(), ['Role 1', 'Role 2'])
+        self.assertEqual(restored.getGroups(), ['Group A'])
+        self.assertEqual(restored['sheet'].getProperty('email'),
+                         'testing@example.com')
+        self.assertEqual(restored._extra_attribute, 'extra')
+
+        # Restored users are independent of each other
+        restored._addRoles(('Role 3',))
+        self.assertEqual(compact.restore().getRoles(), ['Role 1', 'Role 2'])
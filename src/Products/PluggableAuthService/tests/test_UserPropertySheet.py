@@ -203,3 +203,14 @@ class UserPropertySheetTests(unittest.TestCase, IPropertySheet_conformance):
         ups = self._makeOne('w_schema', self._SCHEMA)
 
         self._checkStockSchema(ups, values_are_none=True)
+
+    def test_ctor_shares_schema(self):
+
+        first = self._makeOne('first', fullname='First', email='first@')
+        second = self._makeOne('second', fullname='Second', email='second@')
+        other = self._makeOne('other', fullname='Other')
+
+        self.assertIs(first._schema, second._schema)
+        self.assertIsNot(first._schema, other._schema)
+        self.assertEqual(second.getProperty('fullname'), 'Second')
+        self.assertFalse(hasattr(first, '__dict__'))
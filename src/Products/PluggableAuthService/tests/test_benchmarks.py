@@ -0,0 +1,54 @@
+##############################################################################
+#
+# Copyright (c) 2001 Zope Foundation and Contributors
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this
+# distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+import unittest
+
+
+class FixtureTests(unittest.TestCase):
+
+    def test_principals(self):
+        from ..benchmarks.fixtures import Fixture
+
+        fixture = Fixture(200)
+        self.assertEqual((fixture.users, fixture.groups, fixture.roles),
+                         (200, 20, 2))
+
+        request = fixture.makeRequest('user0000199')
+        user = fixture.pas.validate(request)
+        self.assertEqual(user.getId(), 'user0000199')
+        # group000019 is nested in group000001, which is in group000000
+        self.assertEqual(sorted(user.getGroups()),
+                         ['group000000', 'group000001', 'group000019'])
+        self.assertEqual(sorted(user.getRoles()),
+                         ['Authenticated', 'Role00000', 'Role00001'])
+
+
+class RunnerTests(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        from ..benchmarks.runner import BENCHMARKS
+        from ..benchmarks.runner import compare
+        from ..benchmarks.runner import run
+
+        results = run([20], repeat=1, number=1)
+        self.assertEqual([x['benchmark'] for x in results['results']],
+                         list(BENCHMARKS))
+        for result in results['results']:
+            self.assertEqual(result['size'], 20)
+            self.assertGreater(result['best'], 0)
+
+        baseline = {'results': [dict(results['results'][0])]}
+        baseline['results'][0]['best'] *= 2
+        name, size, before, after, ratio = compare(baseline, results)[0]
+        self.assertEqual((name, size), ('validate', 20))
+        self.assertEqual(ratio, 0.5)
@@ -115,10 +115,19 @@ class Test_exportPAS(_TestBase):
         self.assertEqual(content_type, 'text/plain')
         lines = [_f for _f in [x.strip() for x in text.splitlines()] if _f]
         lines = sorted(lines)
-        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(lines), 12)
         self.assertEqual(lines[0], '[DEFAULT]')
-        self.assertEqual(lines[1], 'login_transform =')
-        self.assertEqual(lines[2], 'title =')
+        self.assertEqual(lines[1], 'breaker_reset_timeout = 30')
+        self.assertEqual(lines[2], 'breaker_threshold = 0')
+        self.assertEqual(lines[3], 'enumeration_timeout = 0.0')
+        self.assertEqual(lines[4], 'instrument_plugins = False')
+        self.assertEqual(lines[5], 'login_transform =')
+        self.assertEqual(lines[6], 'negative_cache_size = 0')
+        self.assertEqual(lines[7], 'negative_cache_ttl = 30')
+        self.assertEqual(lines[8], 'plugin_time_budget = 0.0')
+        self.assertEqual(lines[9], 'principal_cache_size = 0')
+        self.assertEqual(lines[10], 'principal_cache_ttl = 3600')
+        self.assertEqual(lines[11], 'title =')
 
         filename, text, content_type = context._wrote[2]
         self.assertEqual(filename, 'PAS/pluginregistry.xml')
@@ -162,10 +171,19 @@ class Test_exportPAS(_TestBase):
         self.assertEqual(content_type, 'text/plain')
         lines = [_f for _f in [x.strip() for x in text.splitlines()] if _f]
         lines = sorted(lines)
-        self.assertEqual(len(lines), 3)
+        self.assertEqual(len(lines), 12)
         self.assertEqual(lines[0], '[DEFAULT]')
-        self.assertEqual(lines[1], 'login_transform =')
-        self.assertEqual(lines[2], 'title =')
+        self.assertEqual(lines[1], 'breaker_reset_timeout = 30')
+        self.assertEqual(lines[2], 'breaker_threshold = 0')
+        self.assertEqual(lines[3], 'enumeration_timeout = 0.0')
+        self.assertEqual(lines[4], 'instrument_plugins = False')
+        self.assertEqual(lines[5], 'login_transform =')
+        self.assertEqual(lines[6], 'negative_cache_size = 0')
+        self.assertEqual(lines[7], 'negative_cache_ttl = 30')
+        self.assertEqual(lines[8], 'plugin_time_budget = 0.0')
+        self.assertEqual(lines[9], 'principal_cache_size = 0')
+        self.assertEqual(lines[10], 'principal_cache_ttl = 3600')
+        self.assertEqual(lines[11], 'title =')
 
         filename, text, content_type = context._wrote[2]
         self.assertEqual(filename, 'PAS/pluginregistry.xml')